@@ -1,14 +1,40 @@
+from dotenv import load_dotenv
+
+# Load .env before importing modules that read settings at import time (config.py)
+load_dotenv()
+
+from contextlib import asynccontextmanager
+
 from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from routers.youtube_router import router as youtube_router
 from routers.instagram_router import router as instagram_router
-from dotenv import load_dotenv
+from routers.metrics_router import router as metrics_router
 
+from config import WARM_UP_CLIENTS
+from services.clients import close_clients, warm_up
+from services.instagram_executor import get_instagram_executor
+from services.instagram_sessions import get_instagram_session_pool
 from services.security import verify_firebase_token
+from services.serialization import FastJSONResponse
+from services.tracing import ProfilingMiddleware
+from services.summary_jobs import get_summary_job_queue
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pay for client creation and auth handshakes at boot rather than on the first request
+    if WARM_UP_CLIENTS:
+        await run_in_threadpool(warm_up)
+    yield
+    await get_summary_job_queue().close()
+    get_instagram_executor().shutdown()
+    get_instagram_session_pool().close()
+    await close_clients()
 
-load_dotenv()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -20,8 +46,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Opt-in Server-Timing, tracing and sampling profiler, see services.tracing
+app.add_middleware(ProfilingMiddleware)
+
 app.include_router(
     youtube_router,
     prefix="/api/youtube",
@@ -33,3 +63,6 @@ app.include_router(
     prefix="/api/instagram",
     dependencies=[Depends(verify_firebase_token)]
 )
+
+# Scraped without a Firebase token, see METRICS_TOKEN
+app.include_router(metrics_router)
@@ -0,0 +1,118 @@
+"""
+Measure the auth overhead per request: the former direct `auth.verify_id_token` call against
+the cached `verify_firebase_token` dependency.
+
+Tokens are signed with a local RSA key whose certificate is served by a local HTTP server in
+place of Google's certificate endpoint, with the same Cache-Control behavior.
+
+    python -m benchmarks.bench_auth --requests 2000
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+KID = "bench-key"
+
+
+def make_certificate():
+    """
+    Create an RSA key and a self-signed certificate for it.
+    """
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "bench")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (x509.CertificateBuilder().subject_name(name).issuer_name(name)
+                   .public_key(key.public_key()).serial_number(1)
+                   .not_valid_before(now - datetime.timedelta(days=1))
+                   .not_valid_after(now + datetime.timedelta(days=1))
+                   .sign(key, hashes.SHA256()))
+    return key, certificate.public_bytes(serialization.Encoding.PEM).decode()
+
+
+def serve_certificates(certificate: str) -> ThreadingHTTPServer:
+    """
+    Serve the certificate the way Google's x509 endpoint does, on a random local port.
+    """
+    body = json.dumps({KID: certificate}).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Cache-Control", "public, max-age=3600")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    import firebase_admin
+    from fastapi.security import HTTPAuthorizationCredentials
+    from firebase_admin import auth
+
+    from services import security
+
+    key, certificate = make_certificate()
+    server = serve_certificates(certificate)
+    app = firebase_admin.get_app()
+    verifier = auth._get_client(app)._token_verifier.id_token_verifier
+    verifier.cert_url = f"http://127.0.0.1:{server.server_port}/certs"
+    project_id = verifier.project_id
+
+    now = int(time.time())
+    token = jwt.encode({
+        "iss": f"https://securetoken.google.com/{project_id}",
+        "aud": project_id,
+        "sub": "bench-user",
+        "iat": now,
+        "exp": now + 3600,
+        "auth_time": now,
+    }, key, algorithm="RS256", headers={"kid": KID})
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    # First fetch of the certificates, paid by neither run
+    auth.verify_id_token(token)
+
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        auth.verify_id_token(token)
+    uncached = (time.perf_counter() - start) / args.requests
+
+    async def run_cached():
+        await security.verify_firebase_token(credentials)
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            await security.verify_firebase_token(credentials)
+        return (time.perf_counter() - start) / args.requests
+
+    cached = asyncio.run(run_cached())
+    server.shutdown()
+
+    print(f"{args.requests} requests with the same ID token")
+    print(f"verify_id_token on the event loop : {uncached * 1e6:8.1f} us/request")
+    print(f"cached verify_firebase_token      : {cached * 1e6:8.1f} us/request ({uncached / cached:,.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
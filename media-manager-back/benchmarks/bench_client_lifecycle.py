@@ -0,0 +1,61 @@
+"""
+Compare the per-request cost of building fresh Firestore and Gemini clients (the old
+pattern) with reusing the warmed-up process-wide clients of services/clients.py.
+
+Needs Application Default Credentials with access to the project:
+
+    python -m benchmarks.bench_client_lifecycle --requests 20
+"""
+import argparse
+import statistics
+import time
+
+from google import genai
+from google.auth import default
+
+from services.clients import get_firestore_service, get_genai_client, warm_up
+from services.firestore import FirestoreService
+from services.gemini import MODEL
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def report(label: str, samples: list):
+    print(f"{label:<28} median {statistics.median(samples):8.1f}ms   max {max(samples):8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--document", default="__warm_up__", help="ID of the videos document to read")
+    args = parser.parse_args()
+
+    report("firestore, client per call", [
+        timed(lambda: FirestoreService().get_document("videos", args.document)) for _ in range(args.requests)
+    ])
+
+    _, project = default()
+    report("gemini, client per call", [
+        timed(lambda: genai.Client(vertexai=True, project=project, location="global").models.get(model=MODEL))
+        for _ in range(args.requests)
+    ])
+
+    print(f"{'warm-up at startup':<28} {timed(warm_up):8.1f}ms (paid once per instance)")
+
+    firestore_service = get_firestore_service()
+    report("firestore, shared client", [
+        timed(lambda: firestore_service.get_document("videos", args.document)) for _ in range(args.requests)
+    ])
+
+    client = get_genai_client()
+    report("gemini, shared client", [
+        timed(lambda: client.models.get(model=MODEL)) for _ in range(args.requests)
+    ])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compare the memory held by a video's comments as the former list of dicts with the compact
+CommentSet, when loading them from the comment store and when preparing a summary.
+
+    python -m benchmarks.bench_comment_memory --comments 100000
+"""
+import argparse
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fake_youtube_api import comment_thread
+from services.comment_store import CommentStore
+from services.youtube import generate_comment_item
+
+
+def dict_summary_input(comments: list) -> list:
+    """
+    The summary input as built before CommentSet: a sorted copy of the list, then a dict per
+    thread and reply, then the JSON strings.
+    """
+    comments = sorted(comments, key=lambda c: c.get('likes', 0), reverse=True)
+    formatted_comments = []
+    for c in comments:
+        comment = {"author": c.get('author'), "text": c.get('text'), "likes": c.get('likes'), "replies": []}
+        if c.get('replies'):
+            comment["replies"] = [
+                {"author": r.get('author'), "text": r.get('text'), "likes": r.get('likes')} for r in c.get('replies')
+            ]
+        formatted_comments.append(comment)
+    return [json.dumps(c) for c in formatted_comments]
+
+
+def measure(fn):
+    """
+    Run fn and return its result, the memory it still holds, its peak memory and its duration.
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    duration = time.perf_counter() - start
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, held, peak, duration
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--comments", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = CommentStore(os.path.join(directory, "comments.sqlite3"))
+        # Filled like a full sync does
+        threads = [generate_comment_item(comment_thread("bench", i)) for i in range(args.comments)]
+        store.stage_comments("bench", threads, 0)
+        store.commit_staged_comments("bench", None)
+        del threads
+
+        rows = []
+        comments, held, peak, duration = measure(
+            lambda: store.get_comments_page("bench", limit=args.comments)["comments"])
+        rows.append(("load: list of dicts", held, peak, duration))
+        _, _, peak, duration = measure(lambda: dict_summary_input(comments))
+        rows.append(("summary input: dict copies", None, peak, duration))
+        del comments
+
+        comment_set, held, peak, duration = measure(lambda: store.get_comment_set("bench"))
+        rows.append(("load: CommentSet", held, peak, duration))
+        _, _, peak, duration = measure(lambda: list(comment_set.iter_summary_json(comment_set.order_by_likes())))
+        rows.append(("summary input: CommentSet views", None, peak, duration))
+
+    print(f"{args.comments:,} comment threads ({args.comments // 5:,} with 2 replies)")
+    print(f"{'':32} {'held':>10} {'peak':>10} {'time':>8}")
+    for name, held, peak, duration in rows:
+        held = f"{held / 2 ** 20:8.1f}MB" if held is not None else ""
+        print(f"{name:32} {held:>10} {peak / 2 ** 20:8.1f}MB {duration:7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
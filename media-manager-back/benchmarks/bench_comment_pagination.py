@@ -0,0 +1,85 @@
+"""
+Compare the former serial `requests` pagination loop with the async streaming engine against
+the local fake YouTube API.
+
+    python -m benchmarks.bench_comment_pagination --comments 20000 --latency-ms 80 --handshake-ms 100
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import requests
+
+
+def fetch_all_comments_serially(api_url: str, video_id: str) -> list:
+    """
+    The pagination loop the service used before the async engine: one blocking request per
+    page, and a new connection for each of them.
+    """
+    from services.youtube import generate_comment_item
+
+    comments = []
+    page_token = None
+    while True:
+        params = {"part": "snippet", "videoId": video_id, "maxResults": 100, "key": "bench"}
+        if page_token:
+            params["pageToken"] = page_token
+        data = requests.get(f"{api_url}/commentThreads", params=params).json()
+        comments.extend(generate_comment_item(item) for item in data.get("items", []))
+        page_token = data.get("nextPageToken")
+        if not page_token:
+            return comments
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--comments", type=int, default=10000)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--handshake-ms", type=float, default=100)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    # The fake API and config.py read their settings at import time
+    os.environ["FAKE_COMMENT_COUNT"] = str(args.comments)
+    os.environ["FAKE_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["FAKE_HANDSHAKE_MS"] = str(args.handshake_ms)
+    os.environ["YOUTUBE_API_URL"] = f"http://127.0.0.1:{args.port}/youtube/v3"
+    # Count the fake API's quota in process, and do not let it limit the run
+    os.environ["SHARED_CACHE_BACKEND"] = "memory"
+    os.environ["YOUTUBE_DAILY_QUOTA"] = str(10 ** 9)
+
+    from benchmarks.fake_youtube_api import serve
+    from services import youtube
+    from services.clients import close_clients
+
+    with serve(args.port):
+        start = time.perf_counter()
+        serial = fetch_all_comments_serially(os.environ["YOUTUBE_API_URL"], "bench")
+        serial_time = time.perf_counter() - start
+
+        async def run_async():
+            start = time.perf_counter()
+            first_page = None
+            comments = []
+            async for page in youtube.stream_comment_pages("bench"):
+                if first_page is None:
+                    first_page = time.perf_counter() - start
+                comments.extend(page)
+            total = time.perf_counter() - start
+            await close_clients()
+            return comments, first_page, total
+
+        streamed, first_page_time, async_time = asyncio.run(run_async())
+
+    assert len(serial) == len(streamed) == args.comments
+    pages = -(-args.comments // 100)
+    print(f"{args.comments} comments, {pages} pages, "
+          f"{args.latency_ms}ms simulated latency, {args.handshake_ms}ms per new connection")
+    print(f"serial requests loop : {serial_time:.2f}s ({args.comments / serial_time:,.0f} comments/s)")
+    print(f"async streaming      : {async_time:.2f}s ({args.comments / async_time:,.0f} comments/s), "
+          f"first page after {first_page_time * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Compare a full comment sync against a fake YouTube API failing transiently, without retries
+(a failed page fails the sync, which starts over) and with the retries of services.resilience
+(only the failed page is fetched again).
+
+    python -m benchmarks.bench_resilience --comments 20000 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import functools
+import os
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--comments", type=int, default=20000)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    # The fake API and config.py read their settings at import time
+    directory = tempfile.mkdtemp()
+    os.environ["FAKE_COMMENT_COUNT"] = str(args.comments)
+    os.environ["FAKE_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["FAKE_HANDSHAKE_MS"] = "0"
+    os.environ["FAKE_ERROR_RATE"] = str(args.error_rate)
+    os.environ["YOUTUBE_API_URL"] = f"http://127.0.0.1:{args.port}/youtube/v3"
+    os.environ["COMMENT_STORE_PATH"] = os.path.join(directory, "comments.sqlite3")
+    os.environ["SHARED_CACHE_BACKEND"] = "memory"
+    os.environ["YOUTUBE_DAILY_QUOTA"] = str(10 ** 9)
+    os.environ["UPSTREAM_RETRY_BASE_DELAY"] = "0.05"
+    os.environ["CIRCUIT_FAILURE_THRESHOLD"] = str(10 ** 9)
+
+    from fastapi import HTTPException
+
+    from benchmarks.fake_youtube_api import serve
+    from services import youtube
+    from services.clients import close_clients
+    from services.progress import Progress, tracking
+    from services.resilience import call_with_retry
+
+    async def sync(video_id: str) -> tuple:
+        progress = Progress()
+        start = time.perf_counter()
+        syncs = 0
+        with tracking(progress):
+            while True:
+                syncs += 1
+                try:
+                    async for _ in youtube.stage_all_comments(video_id, resume=False):
+                        pass
+                    break
+                except HTTPException:
+                    continue
+        return time.perf_counter() - start, syncs, progress.snapshot().get("pages_fetched", 0)
+
+    async def run():
+        rows = []
+        youtube.call_with_retry = functools.partial(call_with_retry, attempts=1)
+        rows.append(("no retries", *await sync("before")))
+        youtube.call_with_retry = call_with_retry
+        rows.append(("retries with backoff", *await sync("after")))
+        await close_clients()
+        return rows
+
+    with serve(args.port):
+        rows = asyncio.run(run())
+
+    pages = -(-args.comments // 100)
+    print(f"{args.comments} comments, {pages} pages, {args.error_rate:.1%} of requests failing")
+    for name, duration, syncs, fetched in rows:
+        print(f"{name:22}: {duration:6.2f}s, {syncs} sync(s), {fetched} pages fetched")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Compare FastAPI's default response path (model dump, validation against the response_model,
+jsonable_encoder, json.dumps) with the orjson path of services/serialization.py on a video
+with a large synthetic comment set and on a page of search results.
+
+    python -m benchmarks.bench_serialization --comments 50000
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import serialize_response
+from pydantic import TypeAdapter
+
+from benchmarks.fake_youtube_api import comment_thread
+from models.youtube import SearchResponse, Video
+from services.comment_store import CommentStore
+from services.serialization import dumps
+from services.youtube import generate_comment_item
+
+
+def starlette_render(content) -> bytes:
+    # What JSONResponse.render does with the encoded content
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def default_search_response(content: dict) -> bytes:
+    """
+    FastAPI's path for an endpoint with a response_model: the models are dumped, validated
+    again against SearchResponse, dumped to JSON types and rendered.
+    """
+    adapter = TypeAdapter(SearchResponse)
+    prepared = {"response": {kind: [item.model_dump() for item in items] for kind, items in content["response"].items()}}
+    return starlette_render(jsonable_encoder(adapter.dump_python(adapter.validate_python(prepared), mode="json")))
+
+
+def default_video_response(content: dict) -> bytes:
+    # No response_model: every value goes through jsonable_encoder
+    return starlette_render(asyncio.run(serialize_response(response_content=content)))
+
+
+def timed(fn, repeat: int) -> tuple:
+    """
+    Return the result of fn and its best duration over repeat runs.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--comments", type=int, default=50000)
+    parser.add_argument("--videos", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    comments = [generate_comment_item(comment_thread("bench", i)) for i in range(args.comments)]
+    videos = [
+        Video(id=f"video{i}", title=f"Video number {i} — démo", description="A video description. " * 10,
+              thumbnail_url=f"https://i.ytimg.com/vi/video{i}/hqdefault.jpg", channel_id="UCbench",
+              channel_title="Bench channel", published_at="2024-01-01T00:00:00Z",
+              statistics={"viewCount": "1000", "likeCount": "100", "commentCount": str(args.comments)})
+        for i in range(args.videos)
+    ]
+    video_content = {"response": {"video": videos[0], "comments": comments, "summary": None}}
+    search_content = {"response": {"videos": videos, "channels": []}}
+
+    rows = []
+    for name, default, content in [
+        (f"/video ({args.comments:,} comments)", default_video_response, video_content),
+        (f"/search ({args.videos} videos)", default_search_response, search_content),
+    ]:
+        expected, before = timed(lambda: default(content), args.repeat)
+        body, after = timed(lambda: dumps(content), args.repeat)
+        assert json.loads(body) == json.loads(expected)
+        rows.append((name, before, after, len(body)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = CommentStore(os.path.join(directory, "comments.sqlite3"))
+        # Filled like a full sync does
+        store.stage_comments("bench", comments, 0)
+        store.commit_staged_comments("bench", None)
+        stored = store.get_comments_page("bench", limit=args.comments, decode=False)["comments"]
+        expected, before = timed(lambda: starlette_render({"comments": [json.loads(c) for c in stored]}), args.repeat)
+        body, after = timed(lambda: dumps({"comments": [orjson.Fragment(c) for c in stored]}), args.repeat)
+        assert json.loads(body) == json.loads(expected)
+        rows.append(("stored comments: decode vs splice", before, after, len(body)))
+
+    summary_input = [{"author": c["author"], "text": c["text"], "likes": c["likes"], "replies": c["replies"]}
+                     for c in comments]
+    _, before = timed(lambda: [json.dumps(c) for c in summary_input], args.repeat)
+    _, after = timed(lambda: [orjson.dumps(c).decode() for c in summary_input], args.repeat)
+    rows.append(("summary input strings", before, after, None))
+
+    print(f"{'':36} {'default':>9} {'orjson':>9} {'speedup':>8} {'size':>10}")
+    for name, before, after, size in rows:
+        size = f"{size / 1024:,.0f}KB" if size is not None else ""
+        print(f"{name:36} {before * 1000:7.1f}ms {after * 1000:7.1f}ms {before / after:7.1f}x {size:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Compare a single summarization call with the chunked map-reduce pipeline on a synthetic
+comment set, using the fake model of benchmarks/fake_gemini.py.
+
+    python -m benchmarks.bench_summarize --comments 50000
+"""
+import argparse
+import json
+import time
+
+from benchmarks.fake_gemini import FakeGemini
+from config import SUMMARY_CHUNK_TOKENS, SUMMARY_CONCURRENCY, SUMMARY_FAN_OUT
+from services.gemini import summarize
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--comments", type=int, default=50000)
+    parser.add_argument("--chunk-tokens", type=int, default=SUMMARY_CHUNK_TOKENS)
+    parser.add_argument("--fan-out", type=int, default=SUMMARY_FAN_OUT)
+    parser.add_argument("--concurrency", type=int, default=SUMMARY_CONCURRENCY)
+    args = parser.parse_args()
+
+    comments = [
+        json.dumps({"author": f"@author{i}", "text": f"Comment number {i}, what a great video!",
+                    "likes": i % 1000, "replies": []})
+        for i in range(args.comments)
+    ]
+
+    model = FakeGemini()
+    start = time.perf_counter()
+    summarize(comments, chunk_tokens=10 ** 9, generate_fn=model)
+    print(f"single call : {time.perf_counter() - start:.2f}s, {len(model.calls)} call(s), "
+          f"{model.calls[0][1]:,} prompt tokens")
+
+    model = FakeGemini()
+    start = time.perf_counter()
+    summarize(comments, chunk_tokens=args.chunk_tokens, fan_out=args.fan_out,
+              concurrency=args.concurrency, generate_fn=model)
+    merges = sum(1 for kind, _ in model.calls if kind == "merge")
+    print(f"map-reduce  : {time.perf_counter() - start:.2f}s, {len(model.calls) - merges} chunk call(s), "
+          f"{merges} merge call(s), largest prompt {max(t for _, t in model.calls):,} tokens")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Local stand-in for the Gemini model call of services.gemini.summarize.
+
+Its latency grows with the prompt size like a real model call, so the summarization
+pipeline can be exercised and benchmarked without Vertex AI:
+
+    summarize(comments, generate_fn=FakeGemini())
+"""
+import threading
+import time
+
+from config import MERGE_SUMMARIES_PROMPT
+
+
+class FakeGemini:
+    """
+    Callable with the signature of services.gemini.generate, recording every call.
+    """
+
+    def __init__(self, base_latency: float = 0.4, seconds_per_1k_tokens: float = 0.05):
+        """
+        :param base_latency: Fixed latency of a call, in seconds.
+        :param seconds_per_1k_tokens: Extra latency per thousand prompt tokens.
+        """
+        self.base_latency = base_latency
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, text: str, system_prompt: str) -> str:
+        tokens = len(text) // 4 + 1
+        kind = "merge" if system_prompt == MERGE_SUMMARIES_PROMPT else "summarize"
+        with self._lock:
+            self.calls.append((kind, tokens))
+        time.sleep(self.base_latency + tokens / 1000 * self.seconds_per_1k_tokens)
+        return (
+            f"**1. Feedback Positif:**\n*   {kind} de {tokens} tokens\n\n"
+            "**2. Feedback Négatif:**\n*   ...\n\n"
+            "**3. Axes d'Amélioration:**\n*   ...\n\n"
+            "**4. Nouvelles Idées:**\n*   ...\n"
+        )
@@ -0,0 +1,194 @@
+"""
+Local stand-in for the parts of the YouTube Data API v3 used by the backend.
+
+Serves deterministic synthetic data with a configurable per-request latency, so the
+comment engines can be benchmarked without spending quota:
+
+    FAKE_COMMENT_COUNT=50000 FAKE_LATENCY_MS=80 FAKE_HANDSHAKE_MS=100 FAKE_ERROR_RATE=0.01 uvicorn benchmarks.fake_youtube_api:app --port 8765
+    YOUTUBE_API_URL=http://127.0.0.1:8765/youtube/v3 uvicorn app:app
+"""
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+COMMENT_COUNT = int(os.getenv("FAKE_COMMENT_COUNT", "10000"))
+LATENCY_MS = float(os.getenv("FAKE_LATENCY_MS", "50"))
+# Extra delay on the first request of each connection, standing in for the TLS handshake
+HANDSHAKE_MS = float(os.getenv("FAKE_HANDSHAKE_MS", "100"))
+REPLIES_EVERY = 5
+# Share of the requests failing with a 503, standing in for transient upstream errors
+ERROR_RATE = float(os.getenv("FAKE_ERROR_RATE", "0"))
+
+app = FastAPI(title="Fake YouTube Data API")
+
+
+def comment_thread(video_id: str, index: int) -> dict:
+    """
+    Build the commentThread item at `index` for a video.
+    :param video_id: The ID of the video.
+    :param index: Position of the thread, 0 being the newest.
+    :return: commentThread resource
+    """
+    thread_id = f"{video_id}-c{index}"
+    published_at = f"2025-01-01T00:00:00.{COMMENT_COUNT - index:06d}Z"
+    thread = {
+        "kind": "youtube#commentThread",
+        "id": thread_id,
+        "snippet": {
+            "videoId": video_id,
+            "topLevelComment": {
+                "id": thread_id,
+                "snippet": {
+                    "textOriginal": f"Comment number {index} on {video_id}, what a great video!",
+                    "authorDisplayName": f"@author{index % 7919}",
+                    "authorChannelId": {"value": f"UCauthor{index % 7919}"},
+                    "likeCount": (index * 7) % 1000,
+                    "publishedAt": published_at,
+                    "updatedAt": published_at,
+                },
+            },
+            "totalReplyCount": 2 if index % REPLIES_EVERY == 0 else 0,
+        },
+    }
+    if index % REPLIES_EVERY == 0:
+        thread["replies"] = {
+            "comments": [
+                {
+                    "id": f"{thread_id}.r{r}",
+                    "snippet": {
+                        "textOriginal": f"Reply {r} to comment {index}",
+                        "authorDisplayName": f"@replier{r}",
+                        "likeCount": r,
+                        "publishedAt": published_at,
+                    },
+                } for r in range(2)
+            ]
+        }
+    return thread
+
+
+_seen_connections = set()
+
+
+class TransientError(Exception):
+    pass
+
+
+@app.exception_handler(TransientError)
+async def transient_error(request: Request, e: TransientError):
+    return JSONResponse(status_code=503, content={"error": {"code": 503, "message": "Backend Error"}})
+
+
+async def simulate_latency(request: Request):
+    delay = LATENCY_MS
+    if request.client not in _seen_connections:
+        _seen_connections.add(request.client)
+        delay += HANDSHAKE_MS
+    if delay:
+        await asyncio.sleep(delay / 1000)
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        raise TransientError()
+
+
+@app.get("/youtube/v3/commentThreads")
+async def comment_threads(request: Request, videoId: str, maxResults: int = 20, pageToken: str = None, order: str = "time"):
+    await simulate_latency(request)
+    start = int(pageToken) if pageToken else 0
+    end = min(start + maxResults, COMMENT_COUNT)
+    result = {
+        "kind": "youtube#commentThreadListResponse",
+        "items": [comment_thread(videoId, i) for i in range(start, end)],
+    }
+    if end < COMMENT_COUNT:
+        result["nextPageToken"] = str(end)
+    return result
+
+
+@app.get("/youtube/v3/videos")
+async def videos(request: Request, id: str):
+    await simulate_latency(request)
+    return {
+        "items": [{
+            "id": id,
+            "snippet": {
+                "title": f"Video {id}",
+                "description": "Synthetic video",
+                "thumbnails": {"high": {"url": f"https://example.invalid/{id}.jpg"}},
+                "channelId": "UCfakechannel",
+                "channelTitle": "Fake channel",
+                "publishedAt": "2025-01-01T00:00:00Z",
+            },
+            "statistics": {"commentCount": str(COMMENT_COUNT)},
+        }]
+    }
+
+
+@app.get("/youtube/v3/search")
+async def search(request: Request, q: str, type: str = "video,channel", maxResults: int = 5):
+    await simulate_latency(request)
+    items = []
+    for i in range(maxResults):
+        kind = "youtube#channel" if "channel" in type and (i % 2 or "video" not in type) else "youtube#video"
+        key = "channelId" if kind == "youtube#channel" else "videoId"
+        items.append({
+            "id": {"kind": kind, key: f"{q}-{i}"},
+            "snippet": {
+                "title": f"{q} result {i}",
+                "description": "Synthetic search result",
+                "thumbnails": {"high": {"url": f"https://example.invalid/{q}-{i}.jpg"}},
+                "channelId": f"{q}-{i}",
+                "channelTitle": f"{q} channel",
+                "publishedAt": "2025-01-01T00:00:00Z",
+            },
+        })
+    return {"items": items}
+
+
+@app.get("/youtube/v3/subscriptions")
+async def subscriptions(request: Request, channelId: str, forChannelId: str = ""):
+    await simulate_latency(request)
+    # A third of the authors subscribe to everything, a third to nothing, a third keep it private
+    index = int("".join(filter(str.isdigit, channelId)) or 0)
+    if index % 3 == 2:
+        return JSONResponse(status_code=403, content={
+            "error": {"code": 403, "message": "The requester is not allowed to access the requested subscriptions."}
+        })
+    if index % 3 == 1:
+        return {"items": []}
+    return {"items": [{"snippet": {"resourceId": {"channelId": c}}} for c in forChannelId.split(",") if c]}
+
+
+@contextmanager
+def serve(port: int = 8765):
+    """
+    Run the fake API in a separate process for the duration of the block, so its CPU
+    time does not compete with the client being measured.
+    :param port: Local port to listen on.
+    :return: The base URL to use as YOUTUBE_API_URL
+    """
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.fake_youtube_api:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+    )
+    base_url = f"http://127.0.0.1:{port}/youtube/v3"
+    try:
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                if process.poll() is not None:
+                    raise RuntimeError("Fake YouTube API failed to start")
+                time.sleep(0.05)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait()
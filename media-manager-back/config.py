@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 SUMMARIZE_COMMENTS_PROMPT = """
 Tu es un assistant capable de synthétiser des commentaires YouTube. Ton objectif est de produire un résumé structuré des différents sujets abordés dans les commentaires fournis.  Le résumé doit être en français et suivre le format suivant :
 
@@ -39,4 +42,173 @@ Tu es un assistant capable de synthétiser des commentaires YouTube. Ton objecti
 
 **Commentaires YouTube à analyser:**
 
-"""
\ No newline at end of file
+"""
+
+MERGE_SUMMARIES_PROMPT = """
+Tu es un assistant capable de synthétiser des commentaires YouTube. Les commentaires d'une vidéo ont été découpés en plusieurs lots, et chaque lot a déjà été résumé séparément. Ton objectif est de fusionner ces résumés partiels en un seul résumé structuré, en français.
+
+**Instructions:**
+
+1.  **Fusion des résumés:** Regroupe les points similaires ou redondants des différents résumés partiels en un seul point.
+
+2.  **Importance relative:** Mets en avant les points qui reviennent dans plusieurs résumés partiels, ils représentent l'avis d'un plus grand nombre de spectateurs.
+
+3.  **Fidélité:** N'invente aucun point qui ne figure pas dans les résumés partiels.
+
+4.  **Réponse en français:** Assure-toi que l'intégralité du résumé est rédigée en français.
+
+**Format du Résumé:**
+
+Le résumé final doit reprendre exactement les quatre catégories des résumés partiels :
+
+**1. Feedback Positif:**
+
+**2. Feedback Négatif:**
+
+**3. Axes d'Amélioration:**
+
+**4. Nouvelles Idées:**
+
+**Consignes supplémentaires :**
+
+*   **Longueur :** Essaie d'être concis et de ne pas dépasser 300 mots pour l'ensemble du résumé.
+*   **Adapte ton style:**  Adopte un ton professionnel et informatif.
+
+**Résumés partiels à fusionner:**
+
+"""
+
+# YouTube Data API
+YOUTUBE_API_URL = os.getenv("YOUTUBE_API_URL", "https://www.googleapis.com/youtube/v3")
+YOUTUBE_HTTP_TIMEOUT = float(os.getenv("YOUTUBE_HTTP_TIMEOUT", "30"))
+YOUTUBE_MAX_CONNECTIONS = int(os.getenv("YOUTUBE_MAX_CONNECTIONS", "100"))
+
+# YouTube Data API quota: YOUTUBE_DAILY_QUOTA units per day (Pacific time), counted across instances and
+# synced with the shared store every YOUTUBE_QUOTA_SYNC_EVERY seconds. Background calls (e.g. summary
+# jobs) may only use YOUTUBE_QUOTA_SHARE_BACKGROUND of the budget and bulk calls (subscription checks)
+# YOUTUBE_QUOTA_SHARE_BULK, the rest is kept for interactive calls.
+YOUTUBE_DAILY_QUOTA = int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000"))
+YOUTUBE_QUOTA_SYNC_EVERY = float(os.getenv("YOUTUBE_QUOTA_SYNC_EVERY", "10"))
+YOUTUBE_QUOTA_SHARE_BACKGROUND = float(os.getenv("YOUTUBE_QUOTA_SHARE_BACKGROUND", "0.9"))
+YOUTUBE_QUOTA_SHARE_BULK = float(os.getenv("YOUTUBE_QUOTA_SHARE_BULK", "0.7"))
+
+# Requests per second sent to each YouTube endpoint (search.list, then every other endpoint),
+# bursts of up to YOUTUBE_RATE_BURST seconds worth of requests are let through at once
+YOUTUBE_RATE_SEARCH = float(os.getenv("YOUTUBE_RATE_SEARCH", "5"))
+YOUTUBE_RATE_DEFAULT = float(os.getenv("YOUTUBE_RATE_DEFAULT", "50"))
+YOUTUBE_RATE_BURST = float(os.getenv("YOUTUBE_RATE_BURST", "1"))
+
+# Idempotent calls to YouTube, Gemini and Instagram are retried up to UPSTREAM_RETRY_ATTEMPTS times in
+# total on transient failures, after a random delay growing from UPSTREAM_RETRY_BASE_DELAY up to
+# UPSTREAM_RETRY_MAX_DELAY seconds. After CIRCUIT_FAILURE_THRESHOLD consecutive failures calls to the
+# service fail right away for CIRCUIT_RESET_TIMEOUT seconds.
+UPSTREAM_RETRY_ATTEMPTS = int(os.getenv("UPSTREAM_RETRY_ATTEMPTS", "4"))
+UPSTREAM_RETRY_BASE_DELAY = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", "0.5"))
+UPSTREAM_RETRY_MAX_DELAY = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", "8"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+# Number of commentThreads pages fetched ahead of the consumer
+COMMENTS_PREFETCH_PAGES = int(os.getenv("COMMENTS_PREFETCH_PAGES", "2"))
+
+# Local comment store: threads are served from it and only new ones are fetched from YouTube.
+# A video synced less than COMMENT_STORE_FRESH_FOR seconds ago is not synced again, and a full
+# resync (refreshing like counts and replies) happens every COMMENT_STORE_RESYNC_AFTER seconds.
+COMMENT_STORE_PATH = os.getenv("COMMENT_STORE_PATH", os.path.join(tempfile.gettempdir(), "media-manager-comments.sqlite3"))
+COMMENT_STORE_FRESH_FOR = float(os.getenv("COMMENT_STORE_FRESH_FOR", "60"))
+COMMENT_STORE_RESYNC_AFTER = float(os.getenv("COMMENT_STORE_RESYNC_AFTER", str(6 * 3600)))
+# An interrupted full sync resumes from its last stored page if retried within COMMENT_SYNC_RESUME_FOR seconds
+COMMENT_SYNC_RESUME_FOR = float(os.getenv("COMMENT_SYNC_RESUME_FOR", "3600"))
+
+# Maximum number of eligibility (subscription) checks in flight during a draw
+DRAW_PARALLELISM = int(os.getenv("DRAW_PARALLELISM", "8"))
+
+# Shared tier of the caches: "firestore" to share entries across instances, "memory" to keep them in process
+SHARED_CACHE_BACKEND = os.getenv("SHARED_CACHE_BACKEND", "firestore")
+
+# Subscription check results, with one TTL (seconds) per status
+SUBSCRIPTION_CACHE_SIZE = int(os.getenv("SUBSCRIPTION_CACHE_SIZE", "100000"))
+SUBSCRIPTION_TTL_SUBSCRIBED = float(os.getenv("SUBSCRIPTION_TTL_SUBSCRIBED", str(24 * 3600)))
+SUBSCRIPTION_TTL_NOT_SUBSCRIBED = float(os.getenv("SUBSCRIPTION_TTL_NOT_SUBSCRIBED", str(15 * 60)))
+SUBSCRIPTION_TTL_PRIVATE = float(os.getenv("SUBSCRIPTION_TTL_PRIVATE", str(24 * 3600)))
+
+# Comment summaries: comment sets larger than SUMMARY_CHUNK_TOKENS are split into chunks summarized
+# in parallel (at most SUMMARY_CONCURRENCY Gemini calls at once per summary, and SUMMARY_MAX_CALLS
+# across every summary of the process), then the partial summaries are merged SUMMARY_FAN_OUT at a
+# time until a single summary remains.
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "20000"))
+SUMMARY_FAN_OUT = int(os.getenv("SUMMARY_FAN_OUT", "8"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+SUMMARY_MAX_CALLS = int(os.getenv("SUMMARY_MAX_CALLS", "8"))
+
+# A regenerated summary only summarizes the comments added since the stored one, and merges them into
+# it, when the comments already summarized were not edited or deleted since and the new ones number
+# at most SUMMARY_DELTA_MAX_RATIO times them.
+SUMMARY_DELTA_MAX_RATIO = float(os.getenv("SUMMARY_DELTA_MAX_RATIO", "0.2"))
+
+# Summary jobs run in the background on SUMMARY_JOB_WORKERS workers, by priority. Submissions beyond
+# SUMMARY_JOB_MAX_QUEUE waiting jobs are rejected, and finished jobs can be looked up for SUMMARY_JOB_KEEP_FOR seconds.
+SUMMARY_JOB_WORKERS = int(os.getenv("SUMMARY_JOB_WORKERS", "2"))
+SUMMARY_JOB_MAX_QUEUE = int(os.getenv("SUMMARY_JOB_MAX_QUEUE", "100"))
+SUMMARY_JOB_KEEP_FOR = float(os.getenv("SUMMARY_JOB_KEEP_FOR", str(24 * 3600)))
+
+# Create the Firestore, Gemini and HTTP clients at startup instead of on the first request
+WARM_UP_CLIENTS = os.getenv("WARM_UP_CLIENTS", "true").lower() == "true"
+
+# Instagram calls (instagrapi is blocking) run on a dedicated pool of INSTAGRAM_WORKERS threads.
+# Calls waiting for a worker beyond INSTAGRAM_MAX_QUEUE are rejected, and a call is abandoned
+# after INSTAGRAM_CALL_TIMEOUT seconds.
+INSTAGRAM_WORKERS = int(os.getenv("INSTAGRAM_WORKERS", "4"))
+INSTAGRAM_MAX_QUEUE = int(os.getenv("INSTAGRAM_MAX_QUEUE", "32"))
+INSTAGRAM_CALL_TIMEOUT = float(os.getenv("INSTAGRAM_CALL_TIMEOUT", "30"))
+
+# Authenticated instagrapi clients kept ready (one per worker by default). They share one session,
+# which is logged in again in the background every INSTAGRAM_SESSION_REFRESH_EVERY seconds.
+INSTAGRAM_SESSION_POOL_SIZE = int(os.getenv("INSTAGRAM_SESSION_POOL_SIZE", str(INSTAGRAM_WORKERS)))
+INSTAGRAM_SESSION_REFRESH_EVERY = float(os.getenv("INSTAGRAM_SESSION_REFRESH_EVERY", str(24 * 3600)))
+
+# Default number of posts or comments per page of the Instagram endpoints
+INSTAGRAM_PAGE_SIZE = int(os.getenv("INSTAGRAM_PAGE_SIZE", "50"))
+
+# Instagram draws requiring a follow check commenters INSTAGRAM_FOLLOW_BATCH_SIZE at a time, one lookup
+# (one Instagram worker call) after the other, with at most INSTAGRAM_DRAW_PARALLELISM batches in flight
+INSTAGRAM_FOLLOW_BATCH_SIZE = int(os.getenv("INSTAGRAM_FOLLOW_BATCH_SIZE", "10"))
+INSTAGRAM_DRAW_PARALLELISM = int(os.getenv("INSTAGRAM_DRAW_PARALLELISM", "2"))
+
+# Verified Firebase ID tokens are cached until they expire
+FIREBASE_TOKEN_CACHE_SIZE = int(os.getenv("FIREBASE_TOKEN_CACHE_SIZE", "10000"))
+
+# YouTube search results (100 quota units per search.list call). Results are fresh for SEARCH_TTL
+# seconds (SEARCH_TTL_CHANNELS for channel searches, which change slowly), then served stale for up
+# to SEARCH_STALE_FOR more seconds while being refreshed in the background. A query extending a cached
+# one is answered by filtering its results when at least SEARCH_PREFIX_MIN_RESULTS match.
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "5000"))
+SEARCH_TTL = float(os.getenv("SEARCH_TTL", str(15 * 60)))
+SEARCH_TTL_CHANNELS = float(os.getenv("SEARCH_TTL_CHANNELS", str(6 * 3600)))
+SEARCH_STALE_FOR = float(os.getenv("SEARCH_STALE_FOR", str(24 * 3600)))
+SEARCH_PREFIX_MIN_RESULTS = int(os.getenv("SEARCH_PREFIX_MIN_RESULTS", "10"))
+
+# Metrics served in the Prometheus text format on /metrics. Off by default: operations are then not
+# timed at all. Scrapers must send METRICS_TOKEN as a bearer token, /metrics answers 403 while it is unset.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Per-request profiling. With PROFILING_ENABLED, a request sent with an X-Profile: 1 header (or a profile=1
+# query parameter) gets a Server-Timing header with the time spent in each operation and upstream call.
+# When TRACE_EXPORT is set, the spans of profiled requests and of TRACE_SAMPLE_RATIO of the others are
+# exported as OTLP/JSON: to a file (one trace per line) or to an OTLP/HTTP collector, e.g.
+# http://localhost:4318/v1/traces. A traceparent header only forces the export of its sampled requests with
+# TRACE_TRUST_PARENT, when every caller is a trusted upstream: otherwise any client could have all its
+# requests exported.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+TRACE_EXPORT = os.getenv("TRACE_EXPORT")
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "0"))
+TRACE_TRUST_PARENT = os.getenv("TRACE_TRUST_PARENT", "false").lower() == "true"
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "media-manager-back")
+
+# Sampling profiler, off unless PROFILE_SLOW_REQUESTS_AFTER is set: stacks are sampled every
+# PROFILE_SAMPLE_INTERVAL seconds while requests run, and requests taking more than
+# PROFILE_SLOW_REQUESTS_AFTER seconds write their samples to PROFILE_DIR as folded stacks (flame graphs).
+PROFILE_SLOW_REQUESTS_AFTER = float(os.getenv("PROFILE_SLOW_REQUESTS_AFTER", "0"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 # Define models for response data
 class InstagramUser(BaseModel):
@@ -10,15 +10,30 @@ class InstagramUser(BaseModel):
 
 class InstagramMedia(BaseModel):
     id: str
+    title: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    comment_count: Optional[int] = None
+    like_count: Optional[int] = None
+    play_count: Optional[int] = None
     caption: Optional[str] = None
-    media_type: str
-    media_url: str
-    permalink: str
     timestamp: str
-    username: str
+    video_url: Optional[str] = None
 
 class InstagramComment(BaseModel):
     id: str
     text: str
     timestamp: str
-    username: str
\ No newline at end of file
+    username: str
+    user_id: Optional[str] = None
+    like_count: Optional[int] = None
+
+class InstagramMediaPage(BaseModel):
+    medias: List[InstagramMedia]
+    next_cursor: Optional[str] = None
+
+class InstagramCommentPage(BaseModel):
+    comments: List[InstagramComment]
+    next_cursor: Optional[str] = None
+
+class InstagramPickCommentResponse(BaseModel):
+    comment: InstagramComment
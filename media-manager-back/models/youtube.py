@@ -1,4 +1,4 @@
-from typing import Dict, List, Any, Literal, Union
+from typing import Dict, List, Any, Literal, Optional, Union
 from pydantic import BaseModel
 
 class Video(BaseModel):
@@ -29,6 +29,26 @@ class CommentSummaryResponse(BaseModel):
     summary: str
 
 
+class CommentPageResponse(BaseModel):
+    comments: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+
+class SummaryJobResponse(BaseModel):
+    id: str
+    video_id: str
+    status: Literal['queued', 'running', 'done', 'failed']
+    priority: Literal['high', 'normal', 'low']
+    # pages_fetched, chunks, chunks_summarized, merges
+    progress: Dict[str, int] = {}
+    summary: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
 class PickCommentResponse(BaseModel):
     comment: Dict[str, Any]
+    audit: Optional[Dict[str, Any]] = None
 
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Query, HTTPException, Depends
-from typing import List
-import requests
+from fastapi import APIRouter, Query, Depends
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Optional
 
-from models.instagram import InstagramComment, InstagramMedia, InstagramUser
+from config import INSTAGRAM_PAGE_SIZE
+from models.instagram import InstagramCommentPage, InstagramMediaPage, InstagramPickCommentResponse, InstagramUser
 from services.instagram import InstagramService
+from services.instagram_draw import pick_random_instagram_comment
+from services.instagram_executor import get_instagram_executor
+from services.instagram_stream import iter_pages
+from services.serialization import encode_ndjson
+from services.single_flight import single_flight_group
 
     
 # Create router
@@ -12,10 +18,18 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-# Dependency to get the Instagram service
-def get_instagram_service():
+# Dependency to get the Instagram service (its clients come from the process-wide session pool)
+async def get_instagram_service():
     return InstagramService()
 
+async def run_instagram(fn, *args):
+    """
+    Run an Instagram service method on the Instagram executor.
+    Identical concurrent calls share one Instagram call.
+    """
+    return await single_flight_group.do(f"instagram.{fn.__name__}", args,
+                                        lambda: get_instagram_executor().run(fn, *args))
+
 @router.get("/search", response_model=List[InstagramUser])
 async def search_instagram_users(
     q: str = Query(..., description="Search query for Instagram users"),
@@ -24,24 +38,78 @@ async def search_instagram_users(
     """
     Search for Instagram users based on the provided query.
     """
-    return instagram_service.search(q)
+    return await run_instagram(instagram_service.search, q)
+
+async def walk_pages(fn, id: str, key: str, limit: int) -> AsyncIterator[dict]:
+    """
+    Turn every page of a paginated Instagram service method into a stream event, see iter_pages.
+    :param fn: get_posts_page or get_comments_page.
+    :param id: The ID of the user or media.
+    :param key: The key of the items in a page ("medias" or "comments").
+    :param limit: The number of items per page.
+    :return: async generator of {"type": key, key: [...]} events
+    """
+    async for page in iter_pages(fn, id, limit, run=run_instagram):
+        if page[key]:
+            yield {"type": key, key: page[key]}
 
-@router.get("/medias", response_model=List[InstagramMedia])
+@router.get("/medias", response_model=InstagramMediaPage)
 async def get_user_medias(
     user_id: str = Query(..., description="Instagram user ID to fetch media from"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page, omitted for the first page"),
+    limit: int = Query(INSTAGRAM_PAGE_SIZE, ge=1, le=100, description="Number of media posts per page"),
     instagram_service: InstagramService = Depends(get_instagram_service)
 ):
     """
-    Get media posts for a specific Instagram user.
+    Get a page of media posts for a specific Instagram user, the most recent first.
+    """
+    return await run_instagram(instagram_service.get_posts_page, user_id, cursor, limit)
+
+@router.get("/medias/stream")
+async def stream_user_medias(
+    user_id: str = Query(..., description="Instagram user ID to fetch media from"),
+    limit: int = Query(INSTAGRAM_PAGE_SIZE, ge=1, le=100, description="Number of media posts per batch"),
+    instagram_service: InstagramService = Depends(get_instagram_service)
+) -> StreamingResponse:
+    """
+    Stream every media post of a specific Instagram user as newline-delimited JSON,
+    one {"type": "medias", "medias": [...]} event per page.
     """
-    return instagram_service.get_posts(user_id)
+    events = walk_pages(instagram_service.get_posts_page, user_id, "medias", limit)
+    return StreamingResponse(encode_ndjson(events), media_type="application/x-ndjson")
 
-@router.get("/comments", response_model=List[InstagramComment])
+@router.get("/comments", response_model=InstagramCommentPage)
 async def get_media_comments(
     media_id: str = Query(..., description="Instagram media ID to fetch comments from"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page, omitted for the first page"),
+    limit: int = Query(INSTAGRAM_PAGE_SIZE, ge=1, le=100, description="Number of comments per page"),
+    instagram_service: InstagramService = Depends(get_instagram_service)
+):
+    """
+    Get a page of comments for a specific Instagram media post.
+    """
+    return await run_instagram(instagram_service.get_comments_page, media_id, cursor, limit)
+
+@router.get("/comments/stream")
+async def stream_media_comments(
+    media_id: str = Query(..., description="Instagram media ID to fetch comments from"),
+    limit: int = Query(INSTAGRAM_PAGE_SIZE, ge=1, le=100, description="Number of comments per batch"),
+    instagram_service: InstagramService = Depends(get_instagram_service)
+) -> StreamingResponse:
+    """
+    Stream every comment of a specific Instagram media post as newline-delimited JSON,
+    one {"type": "comments", "comments": [...]} event per page.
+    """
+    events = walk_pages(instagram_service.get_comments_page, media_id, "comments", limit)
+    return StreamingResponse(encode_ndjson(events), media_type="application/x-ndjson")
+
+@router.get("/comments/pick", response_model=InstagramPickCommentResponse)
+async def pick_media_comment(
+    media_id: str = Query(..., description="Instagram media ID to pick a comment from"),
+    follows: Optional[str] = Query(None, description="Instagram user ID the commenter needs to follow"),
     instagram_service: InstagramService = Depends(get_instagram_service)
 ):
     """
-    Get comments for a specific Instagram media post.
+    Pick a random comment from a specific Instagram media post, one entry per commenter.
     """
-    return instagram_service.get_comments(media_id)
+    return {"comment": await pick_random_instagram_comment(media_id, follows, instagram_service)}
@@ -0,0 +1,52 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from config import METRICS_TOKEN
+from services.instagram_executor import get_instagram_executor
+from services.instagram_sessions import get_instagram_session_pool
+from services.metrics import metrics, stats_of
+from services.resilience import circuit_breaker_stats
+from services.search_cache import get_search_cache
+from services.security import token_cache
+from services.single_flight import single_flight_group
+from services.subscription_cache import get_follow_cache, get_subscription_cache
+from services.summary_jobs import get_summary_job_queue
+from services.tracing import trace_exporter
+from services.youtube_quota import get_youtube_quota
+
+# Create router
+router = APIRouter(tags=["metrics"])
+
+metrics.register_collector("single_flight", single_flight_group.stats, labels=("operation",))
+metrics.register_collector("search_cache", lambda: stats_of(get_search_cache))
+metrics.register_collector("subscription_cache", lambda: stats_of(get_subscription_cache))
+metrics.register_collector("instagram_follow_cache", lambda: stats_of(get_follow_cache))
+metrics.register_collector("token_cache", token_cache.stats)
+metrics.register_collector("instagram_executor", lambda: stats_of(get_instagram_executor))
+metrics.register_collector("instagram_sessions", lambda: stats_of(get_instagram_session_pool))
+metrics.register_collector("summary_jobs", lambda: stats_of(get_summary_job_queue))
+metrics.register_collector("youtube_quota", lambda: (stats_of(get_youtube_quota) or {}).get("budget"))
+metrics.register_collector("youtube_rate_limiter", lambda: (stats_of(get_youtube_quota) or {}).get("endpoints"),
+                           labels=("endpoint",))
+metrics.register_collector("circuit_breaker", circuit_breaker_stats, labels=("upstream",))
+metrics.register_collector("trace_exporter", trace_exporter.stats)
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics(authorization: Optional[str] = Header(None)) -> PlainTextResponse:
+    """
+    Get the metrics in the Prometheus text format.
+    :param authorization: "Bearer <METRICS_TOKEN>"
+    :return: The metrics
+    """
+    if not metrics.enabled:
+        raise HTTPException(404, "Not Found")
+    # The route is outside Firebase auth and the timings name videos and routes, so it is never left open
+    if not METRICS_TOKEN:
+        raise HTTPException(403, "Metrics require METRICS_TOKEN to be set")
+    if not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(401, "Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
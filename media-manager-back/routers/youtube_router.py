@@ -1,52 +1,122 @@
-from fastapi import APIRouter
-from models.youtube import CommentSummaryResponse, PickCommentResponse, SearchResponse
-from services.youtube import pick_random_comment, search, summarize_comments, get_video_details
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from models.youtube import (CommentPageResponse, CommentSummaryResponse, PickCommentResponse, SearchResponse,
+                            SummaryJobResponse)
+from services.clients import get_firestore_service
+from services.comment_stream import stream_video_details
+from services.firestore import FirestoreService
+from services.serialization import FastJSONResponse, encode_ndjson
+from services.summary_jobs import SummaryJobQueue, get_summary_job_queue
+from services.youtube import get_comments_page, pick_random_comment, search, summarize_comments, get_video_details
 
 router = APIRouter(tags=["YouTube"])
 
 
 @router.get("/search", response_model=SearchResponse)
-def get_youtube_data(q: str, scope: str = 'all') -> SearchResponse:
+async def get_youtube_data(q: str, scope: str = 'all') -> SearchResponse:
     """
     Search for YouTube videos and channels.
     :param q: The query to search for.
     :param scope: The scope of the search (videos or channels).
     :return: A list of videos and channels.
     """
-    return {
-        "response": search(q, scope)
-    }
+    # The videos and channels are already validated models
+    return FastJSONResponse({
+        "response": await search(q, scope)
+    })
 
 
 @router.get('/comments/summary/{video_id}', response_model=CommentSummaryResponse)
-def get_summary(video_id: str, regenerate: bool = False) -> CommentSummaryResponse:
+async def get_summary(video_id: str, regenerate: bool = False) -> CommentSummaryResponse:
     """
     Get a summary of the comments for a video.
     :param video_id: The ID of the video.
     :return: A summary of the comments.
     """
-    return {"summary": summarize_comments(video_id, regenerate=regenerate)}
+    return {"summary": await summarize_comments(video_id, regenerate=regenerate)}
+
+
+@router.post('/comments/summary/{video_id}', response_model=SummaryJobResponse, status_code=202)
+async def create_summary_job(video_id: str, regenerate: bool = False,
+                             priority: Literal['high', 'normal', 'low'] = 'normal',
+                             summary_jobs: SummaryJobQueue = Depends(get_summary_job_queue)) -> SummaryJobResponse:
+    """
+    Summarize the comments of a video in the background.
+    :param video_id: The ID of the video.
+    :param regenerate: Whether to ignore the stored summary.
+    :param priority: The priority of the job (high, normal or low).
+    :return: The job, to poll with /comments/summary/jobs/{job_id}
+    """
+    return await summary_jobs.submit(video_id, regenerate=regenerate, priority=priority)
+
+
+@router.get('/comments/summary/jobs/{job_id}', response_model=SummaryJobResponse)
+async def get_summary_job(job_id: str,
+                          summary_jobs: SummaryJobQueue = Depends(get_summary_job_queue)) -> SummaryJobResponse:
+    """
+    Get the status and progress of a summary job.
+    :param job_id: The ID of the job.
+    :return: The job, with the summary once done
+    """
+    job = await summary_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Summary job not found")
+    return job
 
 
 @router.get('/comments/pick', response_model=PickCommentResponse)
-def pick_comment(video_id: str, needs_subscription: bool = False, channels: str = '') -> PickCommentResponse:
+async def pick_comment(video_id: str, needs_subscription: bool = False, channels: str = '',
+                       weight: Optional[Literal['likes', 'author']] = None,
+                       seed: Optional[str] = None) -> PickCommentResponse:
     """
     Pick a random comment from a video.
     :param video_id: The ID of the video.
     :param needs_subscription: Whether the commenter needs to be subscribed.
     :param channels: The channels the commenter needs to be subscribed to.
-    :return: A random comment.
+    :param weight: Weigh comments by likes, or give every author the same chance (default: every comment).
+    :param seed: Seed of a reproducible draw, returned with the position of the winner.
+    :return: A random comment, and the audit record of a seeded draw.
     """
-    return {"comment": pick_random_comment(video_id=video_id, needs_subscription=needs_subscription, channels=channels.split(','))}
+    return await pick_random_comment(video_id=video_id, needs_subscription=needs_subscription,
+                                     channels=channels.split(','), weight=weight, seed=seed)
 
 
 @router.get('/video/{video_id}')
-def get_video(video_id: str):
+async def get_video(video_id: str, comments: bool = True,
+                    firestore_service: FirestoreService = Depends(get_firestore_service)):
     """
     Get details of a video.
     :param video_id: The ID of the video.
+    :param comments: Whether to include every comment (see /video/{video_id}/comments to page through them).
     :return: Details of the video (video, comments and summary if exists)
     """
-    return {
-        "response": get_video_details(video_id)
-    }
\ No newline at end of file
+    return FastJSONResponse({
+        "response": await get_video_details(video_id, firestore_service=firestore_service, include_comments=comments)
+    })
+
+
+@router.get('/video/{video_id}/comments', response_model=CommentPageResponse)
+async def get_video_comments(video_id: str, cursor: str = None, limit: int = Query(50, ge=1, le=100),
+                             sort: Literal['relevance', 'likes', 'time'] = 'relevance') -> CommentPageResponse:
+    """
+    Get a page of the comments of a video.
+    :param video_id: The ID of the video.
+    :param cursor: The next_cursor of the previous page, omitted for the first page.
+    :param limit: The maximum number of comments in the page.
+    :param sort: The order of the comments: relevance, likes (most liked first) or time (newest first).
+    :return: The comments of the page and the cursor of the next one
+    """
+    # Stored comments are spliced into the response without being decoded
+    return FastJSONResponse(await get_comments_page(video_id, cursor=cursor, limit=limit, sort=sort, raw=True))
+
+
+@router.get('/video/{video_id}/stream')
+async def stream_video(video_id: str) -> StreamingResponse:
+    """
+    Stream details of a video as newline-delimited JSON.
+    :param video_id: The ID of the video.
+    :return: One event per line: the video, then comment batches as they are fetched, then the summary
+    """
+    return StreamingResponse(encode_ndjson(stream_video_details(video_id)), media_type="application/x-ndjson")
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache where every entry expires after its own TTL.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize: Maximum number of entries, the least recently used ones are evicted first
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a value if it is cached and not expired.
+
+        Args:
+            key: Key of the entry
+            default: Value returned on a miss
+
+        Returns:
+            The cached value, or default
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: float):
+        """
+        Cache a value.
+
+        Args:
+            key: Key of the entry
+            value: Value to cache
+            ttl: Number of seconds the entry stays valid
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        """
+        Remove an entry if present.
+
+        Args:
+            key: Key of the entry
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the hit and miss counters.
+
+        Returns:
+            Dictionary with size, hits, misses and hit_ratio
+        """
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else None,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry: Optional[tuple] = self._entries.get(key)
+        return entry is not None and entry[1] > time.monotonic()
@@ -0,0 +1,114 @@
+import logging
+import threading
+from typing import Optional
+
+import httpx
+from google import genai
+from google.auth import default
+
+from config import YOUTUBE_API_URL, YOUTUBE_HTTP_TIMEOUT, YOUTUBE_MAX_CONNECTIONS
+from services.firestore import FirestoreService
+
+logger = logging.getLogger(__name__)
+
+# Process-wide clients, created on first use (or by warm_up at startup) and closed by close_clients
+_lock = threading.Lock()
+_firestore_service: Optional[FirestoreService] = None
+_genai_client: Optional[genai.Client] = None
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_firestore_service() -> FirestoreService:
+    """
+    Get the process-wide Firestore service, creating it on first use.
+    Usable as a FastAPI dependency.
+    :return: The shared FirestoreService
+    """
+    global _firestore_service
+    if _firestore_service is None:
+        with _lock:
+            if _firestore_service is None:
+                _firestore_service = FirestoreService()
+    return _firestore_service
+
+
+def get_genai_client() -> genai.Client:
+    """
+    Get the process-wide Gemini client, creating it on first use.
+    Usable as a FastAPI dependency.
+    :return: The shared genai.Client
+    """
+    global _genai_client
+    if _genai_client is None:
+        with _lock:
+            if _genai_client is None:
+                _, project = default()
+                _genai_client = genai.Client(
+                    vertexai=True,
+                    project=project,
+                    location="global",
+                )
+    return _genai_client
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Get the process-wide async HTTP client for the YouTube Data API, creating it on first use.
+    All requests share its keep-alive connection pool, and concurrent requests are multiplexed
+    over HTTP/2 when the server supports it.
+    :return: The shared httpx.AsyncClient
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            base_url=YOUTUBE_API_URL,
+            http2=True,
+            timeout=YOUTUBE_HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=YOUTUBE_MAX_CONNECTIONS,
+                max_keepalive_connections=YOUTUBE_MAX_CONNECTIONS,
+            ),
+        )
+    return _http_client
+
+
+def warm_up():
+    """
+    Create the clients and make one cheap call with each, so the first user request does not pay
+    for credential loading, token fetches and channel setup. Failures are logged, not raised.
+    """
+    try:
+        get_firestore_service().get_document("videos", "__warm_up__")
+    except Exception as e:
+        logger.warning("Firestore warm-up failed: %s", e)
+
+    try:
+        from services.gemini import MODEL
+        get_genai_client().models.get(model=MODEL)
+    except Exception as e:
+        logger.warning("Gemini warm-up failed: %s", e)
+
+    get_http_client()
+
+
+async def close_clients():
+    """
+    Close the process-wide clients and release their connections.
+    """
+    global _firestore_service, _genai_client, _http_client
+
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+    with _lock:
+        if _firestore_service is not None:
+            _firestore_service.close()
+            _firestore_service = None
+
+        if _genai_client is not None:
+            # Older google-genai releases have no close() and release their pool with the process
+            close = getattr(_genai_client, "close", None)
+            if close:
+                close()
+            _genai_client = None
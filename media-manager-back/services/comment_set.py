@@ -0,0 +1,189 @@
+import hashlib
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import orjson
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value else value
+
+
+class CommentSet:
+    """
+    Compact, read-only set of comment threads stored column by column.
+
+    Each thread field lives in its own list or array instead of a dict per thread, author names and
+    IDs are interned so a prolific author is stored once, and replies are stored flat, thread i
+    owning replies reply_offsets[i] to reply_offsets[i + 1]. Orderings and groupings are arrays of
+    thread indices over the same columns, so sorting or grouping never copies a comment.
+
+    Threads are materialized as the usual comment dicts (see services.youtube.generate_comment_item)
+    only when read one by one.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty set, use from_comments to build one.
+        """
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.authors: List[str] = []
+        self.author_ids: List[Optional[str]] = []
+        self.likes = array('q')
+        self.published_at: List[Optional[str]] = []
+        self.reply_offsets = array('q', [0])
+        self.reply_ids: List[str] = []
+        self.reply_texts: List[str] = []
+        self.reply_authors: List[str] = []
+        self.reply_likes = array('q')
+        self._by_likes: Optional[array] = None
+
+    @classmethod
+    def from_comments(cls, comments: Iterable[Dict[str, Any]]) -> 'CommentSet':
+        """
+        Build a set from comment dicts. Each dict can be dropped as soon as it was read, so
+        passing a generator keeps a single thread in dict form at a time.
+
+        Args:
+            comments: Comment threads, in display order
+
+        Returns:
+            The comment set
+        """
+        comment_set = cls()
+        for c in comments:
+            comment_set.ids.append(c.get('id'))
+            comment_set.texts.append(c.get('text'))
+            comment_set.authors.append(_intern(c.get('author')))
+            comment_set.author_ids.append(_intern(c.get('author_id')))
+            comment_set.likes.append(c.get('likes') or 0)
+            comment_set.published_at.append(c.get('published_at'))
+            for r in c.get('replies') or []:
+                comment_set.reply_ids.append(r.get('id'))
+                comment_set.reply_texts.append(r.get('text'))
+                comment_set.reply_authors.append(_intern(r.get('author')))
+                comment_set.reply_likes.append(r.get('likes') or 0)
+            comment_set.reply_offsets.append(len(comment_set.reply_ids))
+        return comment_set
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        return {
+            "id": self.ids[i],
+            "text": self.texts[i],
+            "author": self.authors[i],
+            "author_id": self.author_ids[i],
+            "likes": self.likes[i],
+            "published_at": self.published_at[i],
+            "replies": [
+                {
+                    "id": self.reply_ids[j],
+                    "text": self.reply_texts[j],
+                    "author": self.reply_authors[j],
+                    "likes": self.reply_likes[j],
+                } for j in range(self.reply_offsets[i], self.reply_offsets[i + 1])
+            ]
+        }
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return (self[i] for i in range(len(self)))
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """
+        Materialize every thread as a comment dict, e.g. for an API response.
+
+        Returns:
+            List of comment dictionaries
+        """
+        return list(self)
+
+    def order_by_likes(self) -> array:
+        """
+        Get the thread indices from the most to the least liked thread (computed once).
+
+        Returns:
+            Array of thread indices
+        """
+        if self._by_likes is None:
+            likes = self.likes
+            self._by_likes = array('q', sorted(range(len(self)), key=likes.__getitem__, reverse=True))
+        return self._by_likes
+
+    def group_by_author(self) -> Dict[str, array]:
+        """
+        Group thread indices by author, skipping threads without an author ID.
+
+        Returns:
+            dict mapping each author ID to the indices of its threads
+        """
+        comments_by_author = {}
+        for i, author_id in enumerate(self.author_ids):
+            if author_id:
+                indices = comments_by_author.get(author_id)
+                if indices is None:
+                    indices = comments_by_author[author_id] = array('q')
+                indices.append(i)
+        return comments_by_author
+
+    def iter_summary_json(self, indices: Sequence[int] = None) -> Iterator[str]:
+        """
+        Encode threads one by one as the JSON documents sent to the summarizer.
+        Text is kept as UTF-8 instead of \\u escapes, which also saves prompt tokens.
+
+        Args:
+            indices: Thread indices to encode, in order (default: every thread in display order)
+
+        Returns:
+            Generator of JSON strings with the author, text, likes and replies of each thread
+        """
+        for i in range(len(self)) if indices is None else indices:
+            yield orjson.dumps({
+                "author": self.authors[i],
+                "text": self.texts[i],
+                "likes": self.likes[i],
+                "replies": [
+                    {
+                        "author": self.reply_authors[j],
+                        "text": self.reply_texts[j],
+                        "likes": self.reply_likes[j],
+                    } for j in range(self.reply_offsets[i], self.reply_offsets[i + 1])
+                ]
+            }).decode()
+
+    def fingerprint(self, indices: Sequence[int] = None) -> str:
+        """
+        Hash the IDs and like counts of threads, e.g. to tell whether a summarized set changed since.
+
+        Args:
+            indices: Thread indices to hash, in order (default: every thread in display order)
+
+        Returns:
+            Hex digest of the threads
+        """
+        digest = hashlib.sha256()
+        for i in range(len(self)) if indices is None else indices:
+            digest.update(f"{self.ids[i]}:{self.likes[i]}\n".encode())
+        return digest.hexdigest()
+
+    def content_fingerprint(self, indices: Sequence[int] = None) -> str:
+        """
+        Hash the IDs and texts of threads and of their replies, in any order and regardless of likes,
+        e.g. to tell whether summarized threads were edited or deleted since, or got new replies.
+
+        Args:
+            indices: Thread indices to hash (default: every thread)
+
+        Returns:
+            Hex digest of the threads
+        """
+        digest = hashlib.sha256()
+        ids = self.ids
+        for i in sorted(range(len(self)) if indices is None else indices, key=ids.__getitem__):
+            replies = range(self.reply_offsets[i], self.reply_offsets[i + 1])
+            digest.update(orjson.dumps([ids[i], self.texts[i], *((self.reply_ids[j], self.reply_texts[j]) for j in replies)]))
+            digest.update(b"\n")
+        return digest.hexdigest()
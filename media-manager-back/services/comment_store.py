@@ -0,0 +1,342 @@
+import json
+import sqlite3
+import time
+from contextlib import closing
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from config import COMMENT_STORE_PATH
+from services.comment_set import CommentSet
+
+
+class CommentStore:
+    """
+    Local SQLite store of normalized comment threads, keyed by video ID.
+
+    Each video also has a sync state (when it was last fully and incrementally synced, and
+    the publication date of its newest thread) used as the cursor for incremental syncs. A full
+    sync in progress records the page token of its next page, so it can resume after a failure.
+    Threads are indexed in every sort order served by get_comments_page, so any page is read
+    with an index range scan.
+    """
+
+    # Sort orders other than the stored (relevance) order: most liked first, newest first
+    SORT_COLUMNS = {"likes": "likes", "time": "published_at"}
+
+    def __init__(self, path: str = COMMENT_STORE_PATH):
+        """
+        Open (and create if needed) the store.
+
+        Args:
+            path: Path of the SQLite database file
+        """
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS comment_threads (
+                    video_id TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    published_at TEXT,
+                    likes INTEGER NOT NULL DEFAULT 0,
+                    author_id TEXT,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (video_id, id)
+                );
+                CREATE INDEX IF NOT EXISTS comment_threads_position
+                    ON comment_threads (video_id, position);
+                CREATE INDEX IF NOT EXISTS comment_threads_likes
+                    ON comment_threads (video_id, likes DESC, position);
+                CREATE INDEX IF NOT EXISTS comment_threads_published_at
+                    ON comment_threads (video_id, published_at DESC, position);
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    video_id TEXT PRIMARY KEY,
+                    newest_published_at TEXT,
+                    synced_at REAL NOT NULL,
+                    full_synced_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS staged_sync (
+                    video_id TEXT PRIMARY KEY,
+                    page_token TEXT,
+                    position INTEGER NOT NULL,
+                    newest_published_at TEXT,
+                    staged_at REAL NOT NULL
+                );
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per operation keeps the store safe to use from the threadpool
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_sync_state(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the sync state of a video.
+
+        Args:
+            video_id: ID of the video
+
+        Returns:
+            Dictionary with newest_published_at, synced_at and full_synced_at, or None if the video was never synced
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT newest_published_at, synced_at, full_synced_at FROM sync_state WHERE video_id = ?",
+                (video_id,)
+            ).fetchone()
+
+        if not row:
+            return None
+        return {"newest_published_at": row[0], "synced_at": row[1], "full_synced_at": row[2]}
+
+    def get_comment_set(self, video_id: str) -> CommentSet:
+        """
+        Get all stored comment threads of a video as a compact CommentSet, newest additions first then in fetch order.
+        Rows are decoded one at a time, so the full list of comment dicts is never built.
+
+        Args:
+            video_id: ID of the video
+
+        Returns:
+            The comment set
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT data FROM comment_threads WHERE video_id = ? ORDER BY position",
+                (video_id,)
+            )
+            return CommentSet.from_comments(json.loads(data) for (data,) in rows)
+
+    def get_comments_batch(self, video_id: str, after_position: Optional[int] = None,
+                           limit: int = 100) -> Dict[str, Any]:
+        """
+        Get a batch of stored comment threads of a video, in the same order as get_comment_set.
+
+        Args:
+            video_id: ID of the video
+            after_position: Position of the last thread of the previous batch, None for the first batch
+            limit: Maximum number of threads to return
+
+        Returns:
+            Dictionary with the comments and the position to pass for the next batch (None on the last one)
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT position, data FROM comment_threads WHERE video_id = ? AND position > ? "
+                "ORDER BY position LIMIT ?",
+                (video_id, after_position if after_position is not None else -2 ** 63, limit)
+            ).fetchall()
+
+        return {
+            "comments": [json.loads(data) for _, data in rows],
+            "next_position": rows[-1][0] if len(rows) == limit else None
+        }
+
+    def get_comments_page(self, video_id: str, sort: str = "relevance", after: Optional[tuple] = None,
+                          limit: int = 50, decode: bool = True) -> Dict[str, Any]:
+        """
+        Get a page of stored comment threads of a video in the given order.
+        Pages are read from the position after the previous one (keyset pagination), so reading
+        page N costs the same as reading the first one. Positions are reassigned by each full sync,
+        so a page also carries the sync generation it was read from.
+
+        Args:
+            video_id: ID of the video
+            sort: "relevance" (fetch order), "likes" (most liked first) or "time" (newest first)
+            after: The `next` value of the previous page, None for the first page
+            limit: Maximum number of threads to return
+            decode: Whether to decode the threads, or return them as the stored JSON documents
+
+        Returns:
+            Dictionary with the comments, the `after` value of the next page (None on the last one) and
+            the generation of the threads (when the video was last fully synced, None if it never was)
+        """
+        with closing(self._connect()) as conn:
+            # One read transaction, so the generation is the one of the threads read
+            conn.execute("BEGIN")
+            state = conn.execute(
+                "SELECT full_synced_at FROM sync_state WHERE video_id = ?", (video_id,)
+            ).fetchone()
+            if sort not in self.SORT_COLUMNS:
+                rows = conn.execute(
+                    "SELECT NULL, position, data FROM comment_threads WHERE video_id = ? AND position > ? "
+                    "ORDER BY position LIMIT ?",
+                    (video_id, after[1] if after else -2 ** 63, limit)
+                ).fetchall()
+            else:
+                column = self.SORT_COLUMNS[sort]
+                rows = []
+                if after:
+                    # The rest of the threads tied with the last one of the previous page
+                    rows = conn.execute(
+                        f"SELECT {column}, position, data FROM comment_threads "
+                        f"WHERE video_id = ? AND {column} = ? AND position > ? ORDER BY position LIMIT ?",
+                        (video_id, *after, limit)
+                    ).fetchall()
+                if len(rows) < limit:
+                    condition, params = (f"AND {column} < ?", (after[0],)) if after else ("", ())
+                    rows += conn.execute(
+                        f"SELECT {column}, position, data FROM comment_threads WHERE video_id = ? {condition} "
+                        f"ORDER BY {column} DESC, position LIMIT ?",
+                        (video_id, *params, limit - len(rows))
+                    ).fetchall()
+
+        return {
+            "comments": [json.loads(data) for _, _, data in rows] if decode else [data for _, _, data in rows],
+            "next": tuple(rows[-1][:2]) if len(rows) == limit else None,
+            "generation": state[0] if state else None
+        }
+
+    def known_ids(self, video_id: str, ids: List[str]) -> set:
+        """
+        Get which of the given thread IDs are already stored for a video.
+
+        Args:
+            video_id: ID of the video
+            ids: Thread IDs to look up
+
+        Returns:
+            Set of the IDs already stored
+        """
+        if not ids:
+            return set()
+
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT id FROM comment_threads WHERE video_id = ? AND id IN ({','.join('?' * len(ids))})",
+                (video_id, *ids)
+            )
+            return {thread_id for (thread_id,) in rows}
+
+    def get_staged_sync(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get where the full sync in progress of a video stands.
+
+        Args:
+            video_id: ID of the video
+
+        Returns:
+            Dictionary with the page_token of the next page, the position of its first thread, the
+            newest_published_at of the staged threads and when the last page was staged (staged_at),
+            or None if no page is staged
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT page_token, position, newest_published_at, staged_at FROM staged_sync WHERE video_id = ?",
+                (video_id,)
+            ).fetchone()
+
+        if not row:
+            return None
+        return {"page_token": row[0], "position": row[1], "newest_published_at": row[2], "staged_at": row[3]}
+
+    def stage_comments(self, video_id: str, comments: List[Dict[str, Any]], first_position: int,
+                       next_page_token: Optional[str] = None, newest_published_at: Optional[str] = None):
+        """
+        Store a page of a full sync that is still in progress.
+        Staged threads stay invisible until commit_staged_comments is called.
+
+        Args:
+            video_id: ID of the video
+            comments: Comment threads of the page, in display order
+            first_position: Position of the first thread of the page in the full list
+            next_page_token: Page token of the next page, to resume the sync from
+            newest_published_at: Publication date of the newest thread staged so far
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO comment_threads VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self._row(self._staging_key(video_id), first_position + i, c) for i, c in enumerate(comments))
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO staged_sync VALUES (?, ?, ?, ?, ?)",
+                (video_id, next_page_token, first_position + len(comments), newest_published_at, time.time())
+            )
+
+    def commit_staged_comments(self, video_id: str, newest_published_at: Optional[str]):
+        """
+        Replace the stored threads of a video with the staged ones, completing a full sync.
+
+        Args:
+            video_id: ID of the video
+            newest_published_at: Publication date of the newest staged thread
+        """
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM comment_threads WHERE video_id = ?", (video_id,))
+            conn.execute(
+                "UPDATE comment_threads SET video_id = ? WHERE video_id = ?",
+                (video_id, self._staging_key(video_id))
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+                (video_id, newest_published_at, now, now)
+            )
+            conn.execute("DELETE FROM staged_sync WHERE video_id = ?", (video_id,))
+
+    def discard_staged_comments(self, video_id: str):
+        """
+        Drop the staged threads of an interrupted full sync.
+
+        Args:
+            video_id: ID of the video
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM comment_threads WHERE video_id = ?", (self._staging_key(video_id),))
+            conn.execute("DELETE FROM staged_sync WHERE video_id = ?", (video_id,))
+
+    def add_comments(self, video_id: str, comments: List[Dict[str, Any]]):
+        """
+        Add threads found by an incremental sync in front of the stored ones.
+
+        Args:
+            video_id: ID of the video
+            comments: New comment threads, newest first
+        """
+        with closing(self._connect()) as conn, conn:
+            state = conn.execute(
+                "SELECT newest_published_at FROM sync_state WHERE video_id = ?", (video_id,)
+            ).fetchone()
+            first_position = conn.execute(
+                "SELECT COALESCE(MIN(position), 0) FROM comment_threads WHERE video_id = ?", (video_id,)
+            ).fetchone()[0]
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO comment_threads VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self._row(video_id, first_position - len(comments) + i, c) for i, c in enumerate(comments))
+            )
+            newest = max(filter(None, [state[0] if state else None, self._newest_published_at(comments)]), default=None)
+            conn.execute(
+                "UPDATE sync_state SET newest_published_at = ?, synced_at = ? WHERE video_id = ?",
+                (newest, time.time(), video_id)
+            )
+
+    @staticmethod
+    def _staging_key(video_id: str) -> str:
+        return f"{video_id}#staging"
+
+    @staticmethod
+    def _row(video_id: str, position: int, comment: Dict[str, Any]) -> tuple:
+        return (
+            video_id,
+            comment.get('id'),
+            position,
+            # Not NULL, so threads without a date still take part in the keyset pagination
+            comment.get('published_at') or '',
+            comment.get('likes') or 0,
+            comment.get('author_id'),
+            json.dumps(comment),
+        )
+
+    @staticmethod
+    def _newest_published_at(comments: List[Dict[str, Any]]) -> Optional[str]:
+        # RFC 3339 timestamps from the API compare correctly as strings
+        return max((c.get('published_at') for c in comments if c.get('published_at')), default=None)
+
+
+@lru_cache(maxsize=None)
+def get_comment_store() -> CommentStore:
+    """
+    Get the process-wide comment store.
+    """
+    return CommentStore()
@@ -0,0 +1,60 @@
+import asyncio
+import time
+from typing import AsyncIterator
+
+from starlette.concurrency import run_in_threadpool
+
+from config import COMMENT_STORE_RESYNC_AFTER
+from services.clients import get_firestore_service
+from services.comment_store import get_comment_store
+from services.youtube import generate_video_item, get_video, stage_all_comments, stream_stored_comments
+
+
+async def stream_and_store_comments(video_id: str) -> AsyncIterator[list]:
+    """
+    Stream the comments of a video from YouTube while doing a full sync of the comment store.
+    Each page is staged as it arrives, and the stored copy is only replaced once every page went through.
+    :param video_id: The ID of the video
+    :return: async generator of comment lists, one per API page
+    """
+    # The client needs every page, so an interrupted sync is not resumed
+    async for page in stage_all_comments(video_id, resume=False):
+        yield page
+
+
+async def stream_video_details(video_id: str) -> AsyncIterator[dict]:
+    """
+    Stream the details of a video as a sequence of events.
+    The video metadata comes first, then the comments in batches, then the stored summary:
+    {"type": "video", "video": ...}, {"type": "comments", "comments": [...]}, ..., {"type": "summary", "summary": ...}
+    Only one batch of comments is held in memory at a time.
+    :param video_id: The ID of the video
+    :return: async generator of events
+    """
+    video = asyncio.ensure_future(get_video(video_id))
+
+    state = await run_in_threadpool(get_comment_store().get_sync_state, video_id)
+    if state and time.time() - state.get('full_synced_at') <= COMMENT_STORE_RESYNC_AFTER:
+        batches = stream_stored_comments(video_id)
+    else:
+        batches = stream_and_store_comments(video_id)
+
+    # Start on the first batch while the video metadata is still in flight
+    first_batch = asyncio.ensure_future(anext(batches, None))
+    try:
+        yield {"type": "video", "video": generate_video_item(await video).model_dump()}
+
+        batch = await first_batch
+        if batch is not None:
+            yield {"type": "comments", "comments": batch}
+            async for batch in batches:
+                yield {"type": "comments", "comments": batch}
+    finally:
+        video.cancel()
+        if not first_batch.done():
+            first_batch.cancel()
+            await asyncio.gather(first_batch, return_exceptions=True)
+        await batches.aclose()
+
+    document = await run_in_threadpool(get_firestore_service().get_document, "videos", video_id)
+    yield {"type": "summary", "summary": document.get("summary") if document else None}
@@ -0,0 +1,177 @@
+import asyncio
+import random
+from collections import deque
+from itertools import islice
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+from config import DRAW_PARALLELISM
+
+
+async def aenumerate(items: AsyncIterator) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Async version of enumerate.
+    """
+    i = 0
+    async for item in items:
+        yield i, item
+        i += 1
+
+
+async def draw_eligible_comment(comments_by_author: Dict[str, Sequence], is_eligible: Callable[[str], Awaitable[bool]],
+                                parallelism: int = DRAW_PARALLELISM, rng: random.Random = None) -> Optional[Any]:
+    """
+    Draw a random comment whose author passes an eligibility check.
+    Authors are shuffled once, then checked in that order with up to `parallelism` checks in
+    flight. The first eligible author in shuffled order wins, so every eligible author has the
+    same chance whatever the order checks complete in. Each author is checked at most once.
+    :param comments_by_author: The comments to draw from grouped by author ID, see CommentSet.group_by_author.
+    :param is_eligible: Async check run on an author ID, e.g. a subscription check.
+    :param parallelism: Maximum number of concurrent checks.
+    :param rng: The random generator (default: the random module).
+    :return: A random comment (or comment index) of the winning author, or None if no author is eligible
+    """
+    rng = rng or random
+    authors = list(comments_by_author)
+    rng.shuffle(authors)
+
+    remaining = iter(authors)
+    in_flight = deque((author, asyncio.ensure_future(is_eligible(author)))
+                      for author in islice(remaining, max(parallelism, 1)))
+    try:
+        while in_flight:
+            author, check = in_flight.popleft()
+            if await check:
+                return rng.choice(comments_by_author[author])
+
+            next_author = next(remaining, None)
+            if next_author is not None:
+                in_flight.append((next_author, asyncio.ensure_future(is_eligible(next_author))))
+        return None
+    finally:
+        # Checks still running once a winner is found are not worth waiting for
+        for _, check in in_flight:
+            check.cancel()
+        await asyncio.gather(*(check for _, check in in_flight), return_exceptions=True)
+
+
+async def draw_streamed_comment(pages: AsyncIterator[list], check_batch: Callable[[list], Awaitable[list]] = None,
+                                author_key: str = 'author_id', batch_size: int = 1,
+                                parallelism: int = DRAW_PARALLELISM, rng: random.Random = None) -> Optional[dict]:
+    """
+    Draw a random comment from a stream of comment pages, with one entry per author: every
+    eligible author has the same chance, then every comment of the winning author.
+    Each new author gets a random key and the eligible author with the lowest key wins. Only the
+    authors whose key beats the current winner's need a check (a few dozen even on large draws),
+    and checks run while the next pages are still being fetched. Apart from the set of authors
+    already seen, memory does not grow with the number of comments.
+    :param pages: async iterator of comment lists.
+    :param check_batch: Async check run on a batch of comments (one per author), returning whether
+        each author is eligible, e.g. a follow check. None if every author is eligible.
+    :param author_key: The key of the author ID in a comment, comments without one are skipped.
+    :param batch_size: Number of authors per check.
+    :param parallelism: Maximum number of checks in flight.
+    :param rng: The random generator (default: the random module).
+    :return: dict with the comment drawn and its page and offset in the page, or None if no author is eligible
+    """
+    rng = rng or random
+    seen = set()
+    # [key, draw, number of comments] of the authors waiting for a check, and of the winner so far
+    candidates: Dict[str, list] = {}
+    winner, winner_author = None, None
+    batch = []
+    in_flight = deque()
+
+    def settle(authors: list, eligible: list):
+        nonlocal winner, winner_author
+        for author, is_eligible in zip(authors, eligible):
+            entry = candidates.pop(author, None)
+            if entry is not None and is_eligible and (winner is None or entry[0] < winner[0]):
+                winner, winner_author = entry, author
+        if winner is not None:
+            # Authors drawn behind the winner cannot win anymore, their check is not needed
+            for author in [a for a, entry in candidates.items() if entry[0] >= winner[0]]:
+                del candidates[author]
+
+    async def launch():
+        authors = [author for author in batch if author in candidates]
+        batch.clear()
+        if authors:
+            check = asyncio.ensure_future(check_batch([candidates[author][1]["comment"] for author in authors]))
+            in_flight.append((authors, check))
+        while len(in_flight) > max(parallelism, 1):
+            authors, check = in_flight.popleft()
+            settle(authors, await check)
+
+    try:
+        async for page_index, page in aenumerate(pages):
+            for offset, comment in enumerate(page):
+                author = comment.get(author_key)
+                if not author:
+                    continue
+                entry = candidates.get(author) or (winner if author == winner_author else None)
+                if entry is not None:
+                    # Reservoir of one comment per tracked author
+                    entry[2] += 1
+                    if rng.randrange(entry[2]) == 0:
+                        entry[1] = {"comment": comment, "page": page_index, "offset": offset}
+                    continue
+                if author in seen:
+                    continue
+                seen.add(author)
+
+                key = rng.random()
+                if winner is not None and key >= winner[0]:
+                    continue
+                draw = {"comment": comment, "page": page_index, "offset": offset}
+                if check_batch is None:
+                    winner, winner_author = [key, draw, 1], author
+                    continue
+                candidates[author] = [key, draw, 1]
+                batch.append(author)
+                if len(batch) >= batch_size:
+                    await launch()
+
+            while in_flight and in_flight[0][1].done():
+                authors, check = in_flight.popleft()
+                settle(authors, check.result())
+
+        await launch()
+        while in_flight:
+            authors, check = in_flight.popleft()
+            settle(authors, await check)
+        return winner[1] if winner is not None else None
+    finally:
+        for _, check in in_flight:
+            check.cancel()
+        await asyncio.gather(*(check for _, check in in_flight), return_exceptions=True)
+
+
+async def draw_weighted_comment(pages: AsyncIterator[list], weight: Callable[[dict], float] = None,
+                                rng: random.Random = None) -> Optional[dict]:
+    """
+    Draw a random comment from a stream of comment pages in a single pass, keeping only the
+    comment drawn so far: the n-th comment replaces it with probability weight / total weight
+    of the comments seen, which gives each comment a chance proportional to its weight.
+    :param pages: async iterator of comment lists.
+    :param weight: The weight of a comment, e.g. its likes + 1 (default: every comment weighs 1).
+        Comments weighing 0 are never drawn.
+    :param rng: The random generator (default: the random module).
+    :return: dict with the comment drawn, its page and offset in the page, the number of comments
+        and their total weight, or None if there is no comment to draw
+    """
+    rng = rng or random
+    drawn = None
+    comments = 0
+    total_weight = 0
+    async for page_index, page in aenumerate(pages):
+        for offset, comment in enumerate(page):
+            comments += 1
+            comment_weight = weight(comment) if weight is not None else 1
+            if comment_weight <= 0:
+                continue
+            total_weight += comment_weight
+            if rng.random() * total_weight < comment_weight:
+                drawn = {"comment": comment, "page": page_index, "offset": offset}
+    if drawn is None:
+        return None
+    return {**drawn, "comments": comments, "total_weight": total_weight}
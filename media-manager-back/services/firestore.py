@@ -1,5 +1,9 @@
+import copy
+import threading
 from google.cloud import firestore
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Protocol, Union
+
+from services.metrics import timed
 
 
 class FirestoreService:
@@ -11,6 +15,11 @@ class FirestoreService:
             database="media-manager"
         )
 
+    def close(self):
+        """Close the underlying gRPC channel."""
+        self.db.close()
+
+    @timed("firestore.create_document")
     def create_document(self, collection_name: str, data: Dict[str, Any], document_id: Optional[str] = None) -> str:
         """
         Create a new document in Firestore.
@@ -33,6 +42,7 @@ class FirestoreService:
             doc_ref = collection_ref.add(data)[1]
             return doc_ref.id
 
+    @timed("firestore.get_document")
     def get_document(self, collection_name: str, document_id: str) -> Optional[Dict[str, Any]]:
         """
         Retrieve a document from Firestore by ID.
@@ -51,6 +61,7 @@ class FirestoreService:
             return doc.to_dict()
         return None
 
+    @timed("firestore.update_document")
     def update_document(self, collection_name: str, document_id: str, data: Dict[str, Any], merge: bool = True) -> bool:
         """
         Update an existing document in Firestore.
@@ -71,6 +82,28 @@ class FirestoreService:
         except Exception:
             return False
 
+    @timed("firestore.increment")
+    def increment(self, collection_name: str, document_id: str, field: str, amount: Union[int, float]) -> Union[int, float]:
+        """
+        Atomically add to a numeric field, creating the document and the field if needed.
+        Concurrent increments from several instances all count.
+
+        Args:
+            collection_name: Name of the collection
+            document_id: ID of the document
+            field: Name of the numeric field
+            amount: Amount to add (can be 0 to just read the field)
+
+        Returns:
+            The value of the field after the increment
+        """
+        doc_ref = self.db.collection(collection_name).document(document_id)
+        if amount:
+            doc_ref.set({field: firestore.Increment(amount)}, merge=True)
+        doc = doc_ref.get()
+        return (doc.to_dict() or {}).get(field, 0) if doc.exists else 0
+
+    @timed("firestore.delete_document")
     def delete_document(self, collection_name: str, document_id: str) -> bool:
         """
         Delete a document from Firestore.
@@ -88,6 +121,7 @@ class FirestoreService:
         except Exception:
             return False
 
+    @timed("firestore.query_documents")
     def query_documents(self, collection_name: str, filters: Optional[List[tuple]] = None, 
                         order_by: Optional[Union[str, tuple]] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """
@@ -132,6 +166,7 @@ class FirestoreService:
         
         return results
 
+    @timed("firestore.collection_group_query")
     def collection_group_query(self, collection_id: str, filters: Optional[List[tuple]] = None) -> List[Dict[str, Any]]:
         """
         Query across all collections with the given ID, regardless of path.
@@ -161,6 +196,7 @@ class FirestoreService:
         
         return results
 
+    @timed("firestore.batch_write")
     def batch_write(self, operations: List[Dict[str, Any]]) -> bool:
         """
         Perform multiple write operations in a single atomic batch.
@@ -199,3 +235,85 @@ class FirestoreService:
             return True
         except Exception:
             return False
+
+
+class DocumentStore(Protocol):
+    """
+    The document operations the shared caches need, implemented by FirestoreService and
+    InMemoryFirestoreService.
+    """
+
+    def get_document(self, collection_name: str, document_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    def update_document(self, collection_name: str, document_id: str, data: Dict[str, Any], merge: bool = True) -> bool:
+        ...
+
+    def increment(self, collection_name: str, document_id: str, field: str, amount: Union[int, float]) -> Union[int, float]:
+        ...
+
+
+class InMemoryFirestoreService:
+    """
+    Local stand-in for FirestoreService as a DocumentStore, keeping documents in process memory.
+    Used when no Firestore database is available (local runs, benchmarks).
+    """
+
+    def __init__(self):
+        """Initialize the in-memory collections."""
+        self.collections: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def get_document(self, collection_name: str, document_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve a document by ID.
+
+        Args:
+            collection_name: Name of the collection
+            document_id: ID of the document to retrieve
+
+        Returns:
+            Copy of the document data, or None if the document doesn't exist
+        """
+        with self._lock:
+            document = self.collections.get(collection_name, {}).get(document_id)
+            return copy.deepcopy(document) if document is not None else None
+
+    def update_document(self, collection_name: str, document_id: str, data: Dict[str, Any], merge: bool = True) -> bool:
+        """
+        Update a document, creating it if needed.
+
+        Args:
+            collection_name: Name of the collection
+            document_id: ID of the document to update
+            data: Dictionary containing updated fields, copied
+            merge: If True, performs a merge update instead of overwriting the entire document
+
+        Returns:
+            True, an in-memory update cannot fail
+        """
+        with self._lock:
+            collection = self.collections.setdefault(collection_name, {})
+            document = collection.get(document_id, {}) if merge else {}
+            document.update(copy.deepcopy(data))
+            collection[document_id] = document
+        return True
+
+    def increment(self, collection_name: str, document_id: str, field: str, amount: Union[int, float]) -> Union[int, float]:
+        """
+        Atomically add to a numeric field, creating the document and the field if needed.
+        Only increments made in this process count.
+
+        Args:
+            collection_name: Name of the collection
+            document_id: ID of the document
+            field: Name of the numeric field
+            amount: Amount to add (can be 0 to just read the field)
+
+        Returns:
+            The value of the field after the increment
+        """
+        with self._lock:
+            document = self.collections.setdefault(collection_name, {}).setdefault(document_id, {})
+            document[field] = document.get(field, 0) + amount
+            return document[field]
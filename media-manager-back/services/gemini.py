@@ -1,30 +1,46 @@
-from google import genai
-from google.genai import types
-from google.auth import default
+import contextvars
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List
 
-from config import SUMMARIZE_COMMENTS_PROMPT
+import httpx
+from google.genai import errors, types
 
-CREDS, PROJECT = default()
+from config import (MERGE_SUMMARIES_PROMPT, SUMMARIZE_COMMENTS_PROMPT, SUMMARY_CHUNK_TOKENS, SUMMARY_CONCURRENCY,
+                    SUMMARY_FAN_OUT, SUMMARY_MAX_CALLS)
+from services.clients import get_genai_client
+from services.metrics import record_upstream, timed
+from services.progress import Progress
+from services.resilience import call_with_retry_sync, get_circuit_breaker
 
+MODEL = "gemini-2.0-flash-001"
 
-def summarize(comments: list) -> str:
+# Changes whenever the model or a prompt changes, so summaries made by a former version are not reused
+SUMMARY_VERSION = hashlib.sha256(
+    "\n".join([MODEL, SUMMARIZE_COMMENTS_PROMPT, MERGE_SUMMARIES_PROMPT]).encode()).hexdigest()[:16]
+
+# Shared by every summary, so concurrent summaries never run more than SUMMARY_MAX_CALLS calls at once
+executor = ThreadPoolExecutor(max_workers=SUMMARY_MAX_CALLS, thread_name_prefix="gemini")
+
+
+@timed("gemini.generate")
+def generate(text: str, system_prompt: str = SUMMARIZE_COMMENTS_PROMPT) -> str:
     """
-    Summarize a list of comments.
-    :param comments: The list of comments to summarize.
-    :return: The summarized text.
+    Send a single prompt to Gemini.
+    Transient failures are retried with backoff, see services.resilience.
+    :param text: The user content.
+    :param system_prompt: The system instruction.
+    :return: The generated text.
     """
-    client = genai.Client(
-        vertexai=True,
-        project=PROJECT,
-        location="global",
-    )
+    client = get_genai_client()
 
-    model = "gemini-2.0-flash-001"
     contents = [
         types.Content(
             role="user",
             parts=[
-                types.Part.from_text(text="\n".join(comments))
+                types.Part.from_text(text=text)
             ]
         )
     ]
@@ -46,13 +62,167 @@ def summarize(comments: list) -> str:
             category="HARM_CATEGORY_HARASSMENT",
             threshold="OFF"
         )],
-        system_instruction=[types.Part.from_text(text=SUMMARIZE_COMMENTS_PROMPT)],
+        system_instruction=[types.Part.from_text(text=system_prompt)],
     )
 
-    res = client.models.generate_content(
-        model=model,
-        contents=contents,
-        config=generate_content_config,
-    )
-    
+    def attempt():
+        start = time.perf_counter()
+        try:
+            res = client.models.generate_content(
+                model=MODEL,
+                contents=contents,
+                config=generate_content_config,
+            )
+        except Exception as e:
+            record_upstream("gemini", MODEL, type(e).__name__, time.perf_counter() - start)
+            raise
+        record_upstream("gemini", MODEL, "ok", time.perf_counter() - start, len((res.text or "").encode()))
+        return res
+
+    res = call_with_retry_sync(attempt, get_circuit_breaker("Gemini"), retryable=is_transient_error)
+
     return res.text
+
+
+def is_transient_error(e: Exception) -> bool:
+    """
+    Tell whether a Gemini error is worth retrying: server errors, rate limits and network errors.
+    :param e: The error.
+    :return: True if the call can be retried
+    """
+    return isinstance(e, (errors.ServerError, httpx.TransportError)) or (
+        isinstance(e, errors.ClientError) and e.code == 429)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of a text without calling the API (about 4 characters per token).
+    :param text: The text to measure.
+    :return: The estimated number of tokens.
+    """
+    return len(text) // 4 + 1
+
+
+def chunk_by_tokens(items: List[str], max_tokens: int) -> List[List[str]]:
+    """
+    Split items into consecutive chunks of at most max_tokens estimated tokens.
+    An item larger than max_tokens gets a chunk of its own.
+    :param items: The items to split.
+    :param max_tokens: The token budget of a chunk.
+    :return: The list of chunks.
+    """
+    chunks = []
+    chunk = []
+    chunk_tokens = 0
+    for item in items:
+        tokens = estimate_tokens(item)
+        if chunk and chunk_tokens + tokens > max_tokens:
+            chunks.append(chunk)
+            chunk = []
+            chunk_tokens = 0
+        chunk.append(item)
+        chunk_tokens += tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+@timed("gemini.summarize")
+def summarize(comments: list, chunk_tokens: int = SUMMARY_CHUNK_TOKENS, fan_out: int = SUMMARY_FAN_OUT,
+              concurrency: int = SUMMARY_CONCURRENCY, generate_fn: Callable[[str, str], str] = None,
+              progress: Progress = None) -> str:
+    """
+    Summarize a list of comments.
+    Comments fitting in one chunk are summarized in a single call. Larger sets are summarized chunk by
+    chunk in parallel, then the partial summaries are merged fan_out at a time until one remains.
+    :param comments: The list of comments to summarize.
+    :param chunk_tokens: The token budget of a chunk of comments.
+    :param fan_out: The number of partial summaries merged by one call.
+    :param concurrency: The maximum number of model calls of this summary in flight, on the shared executor.
+    :param generate_fn: The model call, taking the user content and the system prompt (default: Gemini).
+    :param progress: Receives the number of chunks, chunks summarized and merge calls done.
+    :return: The summarized text.
+    """
+    generate_fn = generate_fn or generate
+    progress = progress or Progress()
+    chunks = chunk_by_tokens(comments, chunk_tokens)
+    progress.set("chunks", len(chunks))
+
+    def summarize_chunk(chunk: List[str]) -> str:
+        summary = generate_fn("\n".join(chunk), SUMMARIZE_COMMENTS_PROMPT)
+        progress.add("chunks_summarized")
+        return summary
+
+    def merge(group: List[str]) -> str:
+        if len(group) == 1:
+            return group[0]
+        summary = generate_fn(format_partial_summaries(group), MERGE_SUMMARIES_PROMPT)
+        progress.add("merges")
+        return summary
+
+    if len(chunks) <= 1:
+        return summarize_chunk(comments)
+
+    summaries = run_all(summarize_chunk, chunks, concurrency)
+
+    fan_out = max(fan_out, 2)
+    while len(summaries) > 1:
+        groups = [summaries[i:i + fan_out] for i in range(0, len(summaries), fan_out)]
+        summaries = run_all(merge, groups, concurrency)
+
+    return summaries[0]
+
+
+def run_all(fn: Callable[[Any], str], items: list, concurrency: int) -> List[str]:
+    """
+    Run fn on every item on the shared executor, with at most concurrency of them in flight.
+    Items run in copies of the caller's context, so they are part of the caller's trace.
+    :param fn: The function to run.
+    :param items: The items to run it on.
+    :param concurrency: The maximum number of items in flight.
+    :return: The results, in the order of the items.
+    """
+    context = contextvars.copy_context()
+    slots = threading.BoundedSemaphore(max(concurrency, 1))
+
+    def run(item):
+        try:
+            return context.copy().run(fn, item)
+        finally:
+            slots.release()
+
+    futures = []
+    for item in items:
+        slots.acquire()
+        futures.append(executor.submit(run, item))
+    return [future.result() for future in futures]
+
+
+@timed("gemini.extend_summary")
+def extend_summary(summary: str, comments: list, generate_fn: Callable[[str, str], str] = None,
+                   progress: Progress = None, **kwargs) -> str:
+    """
+    Add new comments to an existing summary: only the new comments are summarized, then merged
+    with the existing summary.
+    :param summary: The existing summary.
+    :param comments: The list of new comments.
+    :param generate_fn: The model call, taking the user content and the system prompt (default: Gemini).
+    :param progress: Receives the number of chunks, chunks summarized and merge calls done.
+    :param kwargs: The chunking options of summarize.
+    :return: The merged summary.
+    """
+    generate_fn = generate_fn or generate
+    progress = progress or Progress()
+    delta = summarize(comments, generate_fn=generate_fn, progress=progress, **kwargs)
+    merged = generate_fn(format_partial_summaries([summary, delta]), MERGE_SUMMARIES_PROMPT)
+    progress.add("merges")
+    return merged
+
+
+def format_partial_summaries(summaries: List[str]) -> str:
+    """
+    Format partial summaries as the user content of a merge call.
+    :param summaries: The partial summaries.
+    :return: The formatted text.
+    """
+    return "\n\n".join(f"--- Résumé partiel {i} ---\n{summary}" for i, summary in enumerate(summaries, start=1))
@@ -1,39 +1,57 @@
-from instagrapi import Client, exceptions
-import os
-from services.firestore import FirestoreService
 import time
 
+import requests
+from instagrapi import Client, exceptions
+
+from config import INSTAGRAM_PAGE_SIZE
+from services.instagram_sessions import InstagramSessionPool, get_instagram_session_pool
+from services.metrics import record_upstream, timer
+from services.resilience import call_with_retry_sync, get_circuit_breaker
+from services.subscription_cache import NOT_SUBSCRIBED, SUBSCRIBED, get_follow_cache
+
+# Network errors and throttling, worth retrying after a while (the calls made here only read)
+TRANSIENT_ERRORS = (exceptions.ClientConnectionError, exceptions.ClientIncompleteReadError,
+                    exceptions.ClientThrottledError, exceptions.PleaseWaitFewMinutes, requests.ConnectionError,
+                    requests.Timeout)
+
 class InstagramService:
     
-    cl = Client()
-    
-    def __init__(self):
-        self.login()
+    def __init__(self, session_pool: InstagramSessionPool = None):
+        self.session_pool = session_pool or get_instagram_session_pool()
     
-    def login(self):
+    def call(self, fn, *args):
         """
-        Login to Instagram.
+        Run a call with a client borrowed from the session pool.
+        Transient failures are retried with backoff, see services.resilience.
+        :param fn: The call, taking the client then args.
+        :return: The result of the call.
         """
-        firestore_service = FirestoreService()
+        with timer(f"instagram.{fn.__name__}"):
+            return call_with_retry_sync(lambda: self._call(fn, *args), get_circuit_breaker("Instagram"),
+                                        retryable=lambda e: isinstance(e, TRANSIENT_ERRORS))
 
-        session_document = firestore_service.get_document('sessions', "main_session")
-
-        if not session_document:
-            self.cl.login(os.getenv('INSTAGRAM_USERNAME'), os.getenv('INSTAGRAM_PASSWORD'))
-            firestore_service.create_document(collection_name='sessions', document_id="main_session", data={
-                "session_id": self.cl.sessionid,
-                "timestamp": time.time()
-            })
-        else:
+    def _call(self, fn, *args):
+        # If the session expired, it is logged in again and the call is retried once
+        with self.session_pool.client() as (generation, cl):
             try:
-                self.cl.login_by_sessionid(sessionid=session_document.get('session_id'))
-            except Exception as e:
-                print(f"Error logging in: {e}")
-                self.cl.login(os.getenv('INSTAGRAM_USERNAME'), os.getenv('INSTAGRAM_PASSWORD'))
-                firestore_service.update_document(collection_name='sessions', document_id="main_session", data={
-                    "session_id": self.cl.sessionid,
-                    "timestamp": time.time()
-                })
+                return self._send(fn, cl, *args)
+            except exceptions.LoginRequired:
+                self.session_pool.refresh(generation)
+        with self.session_pool.client() as (_, cl):
+            return self._send(fn, cl, *args)
+
+    @staticmethod
+    def _send(fn, cl, *args):
+        start = time.perf_counter()
+        try:
+            result = fn(cl, *args)
+        except Exception as e:
+            record_upstream("instagram", fn.__name__, type(e).__name__, time.perf_counter() - start)
+            raise
+        response = getattr(cl, "last_response", None)
+        record_upstream("instagram", fn.__name__, "ok", time.perf_counter() - start,
+                        len(response.content) if response is not None else None)
+        return result
 
     def search(self, q: str):
         """
@@ -41,55 +59,92 @@ class InstagramService:
         :param q: The query to search for.
         :return: A list of users.
         """
-        try:
-            users = self.cl.search_users(q)
-            return [
-                {
-                    "id": u.pk,
-                    "username": u.username,
-                    "full_name": u.full_name,
-                    "profile_pic_url": str(u.profile_pic_url)
-                } for u in users
-            ]
-        except exceptions.LoginRequired as e:
-            self.login()
-            return self.cl.search_users(q)
+        users = self.call(Client.search_users, q)
+        return [
+            {
+                "id": u.pk,
+                "username": u.username,
+                "full_name": u.full_name,
+                "profile_pic_url": str(u.profile_pic_url)
+            } for u in users
+        ]
     
-    def get_posts(self, user_id, limit=0):
+    def get_posts_page(self, user_id, cursor=None, limit=INSTAGRAM_PAGE_SIZE):
         """
-        Get posts from a user.
+        Get a page of posts from a user, the most recent first.
         :param user_id: The ID of the user.
-        :param limit: The maximum number of posts to return.
-        :return: A list of posts.
+        :param cursor: The next_cursor of the previous page, None for the first page.
+        :param limit: The number of posts to return.
+        :return: dict with the posts and the cursor of the next page (None on the last page)
         """
-        try:
-            return [
-                {
-                    "id": m.id,
-                    "title": m.title,
-                    "thumbnail_url": str(m.thumbnail_url),
-                    "comment_count": m.comment_count,
-                    "like_count": m.like_count,
-                    "play_count": m.play_count,
-                    "caption": m.caption_text,
-                    "timestamp": m.taken_at.isoformat(),
-                    "video_url": str(m.video_url) if m.video_url else None,
-                }
-                for m in self.cl.user_medias(user_id, limit)
-            ]
-        except exceptions.LoginRequired as e:
-            self.login()
-            return self.cl.user_medias(user_id, limit)
-    
-    def get_comments(self, id, limit=0):
+        medias, end_cursor = self.call(Client.user_medias_paginated, user_id, limit, cursor or "")
+        return {
+            "medias": [media_item(m) for m in medias],
+            "next_cursor": end_cursor or None
+        }
+
+    def get_comments_page(self, id, cursor=None, limit=INSTAGRAM_PAGE_SIZE):
         """
-        Get comments from a post.
+        Get a page of comments from a post.
         :param id: The ID of the post.
-        :param limit: The maximum number of comments to return.
-        :return: A list of comments.
+        :param cursor: The next_cursor of the previous page, None for the first page.
+        :param limit: The number of comments to return (a page can hold a few more).
+        :return: dict with the comments and the cursor of the next page (None on the last page)
         """
-        try:
-            return self.cl.media_comments(id, limit)
-        except exceptions.LoginRequired as e:
-            self.login()
-            return self.cl.media_comments(id, limit)
+        comments, next_min_id = self.call(Client.media_comments_chunk, id, limit, cursor)
+        return {
+            "comments": [comment_item(c) for c in comments],
+            "next_cursor": next_min_id or None
+        }
+
+    def follows(self, account_id, user_id, username):
+        """
+        Check whether a user follows an account, by looking them up in the account's followers.
+        Results are cached, see services.subscription_cache.get_follow_cache.
+        :param account_id: The ID of the account.
+        :param user_id: The ID of the user.
+        :param username: The username of the user, searched in the followers.
+        :return: Whether the user follows the account.
+        """
+        follow_cache = get_follow_cache()
+        status = follow_cache.get(user_id, [account_id])
+        if status is None:
+            followers = self.call(Client.search_followers_v1, account_id, username)
+            status = SUBSCRIBED if any(u.pk == user_id for u in followers) else NOT_SUBSCRIBED
+            follow_cache.set(user_id, [account_id], status)
+        return status == SUBSCRIBED
+
+
+def media_item(m) -> dict:
+    """
+    Convert an instagrapi Media to a post dict.
+    :param m: The media.
+    :return: The post.
+    """
+    return {
+        "id": m.id,
+        "title": m.title,
+        "thumbnail_url": str(m.thumbnail_url) if m.thumbnail_url else None,
+        "comment_count": m.comment_count,
+        "like_count": m.like_count,
+        "play_count": m.play_count,
+        "caption": m.caption_text,
+        "timestamp": m.taken_at.isoformat(),
+        "video_url": str(m.video_url) if m.video_url else None,
+    }
+
+
+def comment_item(c) -> dict:
+    """
+    Convert an instagrapi Comment to a comment dict.
+    :param c: The comment.
+    :return: The comment.
+    """
+    return {
+        "id": c.pk,
+        "text": c.text,
+        "timestamp": c.created_at_utc.isoformat(),
+        "username": c.user.username,
+        "user_id": c.user.pk,
+        "like_count": c.like_count,
+    }
@@ -0,0 +1,45 @@
+from typing import Optional
+
+from fastapi import HTTPException
+
+from config import INSTAGRAM_DRAW_PARALLELISM, INSTAGRAM_FOLLOW_BATCH_SIZE, INSTAGRAM_PAGE_SIZE
+from services.draw import draw_streamed_comment
+from services.instagram import InstagramService
+from services.instagram_executor import get_instagram_executor
+from services.instagram_stream import iter_pages
+
+
+async def pick_random_instagram_comment(media_id: str, follows: Optional[str] = None,
+                                        instagram_service: InstagramService = None,
+                                        batch_size: int = INSTAGRAM_FOLLOW_BATCH_SIZE,
+                                        parallelism: int = INSTAGRAM_DRAW_PARALLELISM) -> dict:
+    """
+    Pick a random comment from an Instagram post, every commenter having the same chance
+    whatever their number of comments. Comments are drawn from as their pages arrive, see
+    services.draw.draw_streamed_comment.
+    :param media_id: The ID of the post.
+    :param follows: The ID of an account the commenter must follow, if any.
+    :param instagram_service: The Instagram service to use (default: a new one on the shared session pool).
+    :param batch_size: Number of commenters per follow check.
+    :param parallelism: Maximum number of follow checks in flight.
+    :return: dict with comment
+    """
+    instagram_service = instagram_service or InstagramService()
+    executor = get_instagram_executor()
+
+    async def comment_pages():
+        async for page in iter_pages(instagram_service.get_comments_page, media_id, INSTAGRAM_PAGE_SIZE):
+            yield page["comments"]
+
+    async def check_follows(comments: list) -> list:
+        # One executor call per lookup, each with its own timeout: a worker is never held for a whole
+        # batch, and a draw dropping the batch stops after the current lookup
+        return [await executor.run(instagram_service.follows, follows, comment["user_id"], comment["username"])
+                for comment in comments]
+
+    drawn = await draw_streamed_comment(comment_pages(), check_batch=check_follows if follows else None,
+                                        author_key="user_id", batch_size=batch_size, parallelism=parallelism)
+    if drawn is None:
+        raise HTTPException(404, "No comment found meeting requirements")
+
+    return drawn["comment"]
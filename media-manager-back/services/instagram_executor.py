@@ -0,0 +1,132 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict
+
+from fastapi import HTTPException
+
+from config import INSTAGRAM_CALL_TIMEOUT, INSTAGRAM_MAX_QUEUE, INSTAGRAM_WORKERS
+
+
+class InstagramExecutor:
+    """
+    Bounded thread pool running the blocking instagrapi calls off the event loop.
+
+    Instagram calls get their own workers so a slow Instagram response only ever delays other
+    Instagram calls, never the YouTube endpoints sharing the event loop and the default threadpool.
+    """
+
+    def __init__(self, workers: int = INSTAGRAM_WORKERS, max_queue: int = INSTAGRAM_MAX_QUEUE,
+                 timeout: float = INSTAGRAM_CALL_TIMEOUT):
+        """
+        Initialize the executor.
+
+        Args:
+            workers: Number of worker threads
+            max_queue: Maximum number of calls waiting for a worker, further calls are rejected
+            timeout: Default number of seconds a caller waits for a call
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="instagram")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.max_queue_depth = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.rejected = 0
+
+    def _call(self, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        else:
+            with self._lock:
+                self.completed += 1
+            return result
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    async def run(self, fn: Callable, *args, timeout: float = None, **kwargs) -> Any:
+        """
+        Run a blocking call on the pool and wait for its result.
+
+        Args:
+            fn: The blocking callable
+            *args: Positional arguments of the call
+            timeout: Number of seconds to wait for the result (default: the executor timeout)
+            **kwargs: Keyword arguments of the call
+
+        Returns:
+            The result of the call
+
+        Raises:
+            HTTPException: 503 if too many calls are already waiting, 504 if the call timed out
+        """
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise HTTPException(status_code=503, detail="Too many Instagram requests in progress")
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queued)
+
+        # The call runs in a copy of the caller's context, so it is part of the caller's trace
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, functools.partial(self._call, fn, *args, **kwargs))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            # A running thread cannot be interrupted: the call finishes in the background but
+            # its result is dropped. A call still waiting for a worker is not started at all.
+            if future.cancel():
+                with self._lock:
+                    self.queued -= 1
+            with self._lock:
+                self.timed_out += 1
+            raise HTTPException(status_code=504, detail="Instagram did not answer in time")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the executor counters.
+
+        Returns:
+            Dictionary with the pool size, current queue depth and running calls, and call outcomes
+        """
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queued": self.queued,
+                "running": self.running,
+                "max_queue_depth": self.max_queue_depth,
+                "completed": self.completed,
+                "failed": self.failed,
+                "timed_out": self.timed_out,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        """
+        Stop the workers, dropping the calls still waiting for one.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+@lru_cache(maxsize=None)
+def get_instagram_executor() -> InstagramExecutor:
+    """
+    Get the process-wide Instagram executor.
+    """
+    return InstagramExecutor()
@@ -0,0 +1,207 @@
+import copy
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, Optional
+
+from fastapi import HTTPException
+from instagrapi import Client
+
+from config import INSTAGRAM_CALL_TIMEOUT, INSTAGRAM_SESSION_POOL_SIZE, INSTAGRAM_SESSION_REFRESH_EVERY
+from services.clients import get_firestore_service
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_COLLECTION = "sessions"
+SESSION_DOCUMENT = "main_session"
+
+
+class InstagramSessionPool:
+    """
+    Pool of authenticated instagrapi clients sharing one Instagram session.
+
+    The session is loaded (or logged in) once, then every client is built from its settings
+    without any network call. Each request borrows a client for its own use, so clients are never
+    shared between threads, and a background thread logs in again before the session gets old.
+    """
+
+    def __init__(self, size: int = INSTAGRAM_SESSION_POOL_SIZE, refresh_every: float = INSTAGRAM_SESSION_REFRESH_EVERY,
+                 firestore_service=None):
+        """
+        Initialize the pool. Nothing is logged in before the first client is borrowed.
+
+        Args:
+            size: Number of clients
+            refresh_every: Number of seconds after which the session is logged in again
+            firestore_service: Store of the session (default: the process-wide FirestoreService)
+        """
+        self.size = size
+        self.refresh_every = refresh_every
+        self.firestore_service = firestore_service
+        self.logins = 0
+        self.refreshes = 0
+        self._settings: Optional[Dict[str, Any]] = None
+        self._logged_in_at = 0.0
+        self._generation = 0
+        self._created = 0
+        self._idle = queue.LifoQueue()
+        # _login_lock serializes logins, _lock guards the session swap
+        self._login_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
+
+    @property
+    def _store(self):
+        return self.firestore_service or get_firestore_service()
+
+    def _login(self, session_id: str = None) -> Client:
+        """
+        Log a new client in, by session ID when one is given, with the account credentials otherwise,
+        and store the session.
+        """
+        if session_id:
+            cl = Client()
+            try:
+                cl.login_by_sessionid(sessionid=session_id)
+                self.logins += 1
+                self._store.update_document(SESSIONS_COLLECTION, SESSION_DOCUMENT, {"settings": cl.get_settings()})
+                return cl
+            except Exception as e:
+                logger.warning("Error logging in by session ID: %s", e)
+
+        cl = Client()
+        cl.login(os.getenv('INSTAGRAM_USERNAME'), os.getenv('INSTAGRAM_PASSWORD'))
+        self.logins += 1
+        self._store.update_document(SESSIONS_COLLECTION, SESSION_DOCUMENT, {
+            "session_id": cl.sessionid,
+            "settings": cl.get_settings(),
+            "timestamp": time.time(),
+        })
+        return cl
+
+    def _install(self, settings: Dict[str, Any], logged_in_at: float):
+        with self._lock:
+            self._settings = settings
+            self._logged_in_at = logged_in_at
+            self._generation += 1
+            # Clients borrowed or idle from an older generation are rebuilt when next borrowed
+            while self._created < self.size:
+                self._idle.put((self._generation, Client(settings=copy.deepcopy(settings))))
+                self._created += 1
+
+    def start(self):
+        """
+        Load the stored session, or log in, then fill the pool and start the background refresh.
+        Does nothing if the pool is already started.
+        """
+        if self._settings is not None:
+            return
+        with self._login_lock:
+            if self._settings is not None:
+                return
+
+            session_document = self._store.get_document(SESSIONS_COLLECTION, SESSION_DOCUMENT) or {}
+            logged_in_at = session_document.get('timestamp', 0)
+            session_id = session_document.get('session_id')
+            if time.time() - logged_in_at >= self.refresh_every:
+                settings, session_id = None, None
+            else:
+                settings = session_document.get('settings')
+
+            if settings is None:
+                cl = self._login(session_id)
+                settings = cl.get_settings()
+                if cl.sessionid != session_id:
+                    logged_in_at = time.time()
+
+            self._install(settings, logged_in_at)
+
+        self._refresher = threading.Thread(target=self._refresh_loop, name="instagram-session-refresh", daemon=True)
+        self._refresher.start()
+
+    def refresh(self, generation: int = None):
+        """
+        Log in again with the account credentials and rebuild the clients from the new session.
+
+        Args:
+            generation: Generation of the client which hit an expired session. The refresh is
+                skipped if the session was already refreshed since.
+        """
+        with self._login_lock:
+            if generation is not None and generation != self._generation:
+                return
+            cl = self._login()
+            self.refreshes += 1
+            self._install(cl.get_settings(), time.time())
+
+    def _refresh_loop(self):
+        while not self._stop.wait(max(self._logged_in_at + self.refresh_every - time.time(), 1)):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning("Instagram session refresh failed: %s", e)
+                # Retry after a while rather than in a tight loop
+                self._stop.wait(60)
+
+    @contextmanager
+    def client(self, timeout: float = INSTAGRAM_CALL_TIMEOUT) -> Iterator[tuple]:
+        """
+        Borrow an authenticated client.
+
+        Args:
+            timeout: Number of seconds to wait for a free client
+
+        Returns:
+            Context manager yielding (generation, client), the generation is passed to refresh()
+            when the client hits an expired session
+
+        Raises:
+            HTTPException: 503 if no client got free in time
+        """
+        self.start()
+        try:
+            generation, cl = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise HTTPException(status_code=503, detail="No Instagram session available")
+
+        if generation != self._generation:
+            with self._lock:
+                generation, cl = self._generation, Client(settings=copy.deepcopy(self._settings))
+        try:
+            yield generation, cl
+        finally:
+            self._idle.put((generation, cl))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the pool counters.
+
+        Returns:
+            Dictionary with size, idle clients, session age, logins and refreshes
+        """
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "session_age": time.time() - self._logged_in_at if self._settings is not None else None,
+            "logins": self.logins,
+            "refreshes": self.refreshes,
+        }
+
+    def close(self):
+        """
+        Stop the background refresh.
+        """
+        self._stop.set()
+
+
+@lru_cache(maxsize=None)
+def get_instagram_session_pool() -> InstagramSessionPool:
+    """
+    Get the process-wide Instagram session pool.
+    """
+    return InstagramSessionPool()
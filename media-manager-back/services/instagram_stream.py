@@ -0,0 +1,33 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from config import INSTAGRAM_PAGE_SIZE
+from services.instagram_executor import get_instagram_executor
+
+
+async def iter_pages(fn: Callable, id: str, limit: int = INSTAGRAM_PAGE_SIZE,
+                     run: Callable[..., Awaitable[Any]] = None) -> AsyncIterator[dict]:
+    """
+    Walk every page of a paginated Instagram service method, fetching the next page while
+    the caller is still consuming the current one.
+    :param fn: The method, e.g. InstagramService.get_comments_page, taking the ID, a cursor and a limit.
+    :param id: The ID of the user or media.
+    :param limit: The number of items per page.
+    :param run: Runs the blocking method (default: on the Instagram executor).
+    :return: async generator of pages
+    """
+    run = run or get_instagram_executor().run
+    page = await run(fn, id, None, limit)
+    while True:
+        cursor = page["next_cursor"]
+        next_page = asyncio.ensure_future(run(fn, id, cursor, limit)) if cursor else None
+        try:
+            yield page
+        except BaseException:
+            # Stop fetching if the consumer goes away early
+            if next_page is not None:
+                next_page.cancel()
+            raise
+        if next_page is None:
+            return
+        page = await next_page
@@ -0,0 +1,318 @@
+import functools
+import inspect
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config import METRICS_ENABLED
+from services.tracing import CLIENT, TRACING_ENABLED, current_trace, span
+
+PREFIX = "media_manager_"
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_NAME_UNSAFE = re.compile(r"[^a-zA-Z0-9_]")
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Cumulative histogram of observed values, with their sum and count.
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        """
+        Initialize an empty histogram.
+
+        Args:
+            buckets: Upper bounds of the buckets, in increasing order
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """
+        Add a value, the caller holds the registry lock.
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters, gauges and histograms, rendered in the Prometheus text format.
+
+    Collectors turn the stats() of the caches, pools and queues into gauges when the metrics are
+    scraped, so they cost nothing in between. When metrics are disabled, updates return right away
+    and the timed decorator leaves functions as they are.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        """
+        Initialize an empty registry.
+
+        Args:
+            enabled: Whether metrics are recorded
+        """
+        self.enabled = enabled
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Tuple[str, Callable[[], Any], Tuple[str, ...]]] = []
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help: str):
+        """
+        Set the help text of a metric.
+        """
+        self._help[name] = help
+
+    def inc(self, name: str, amount: float = 1, **labels: str):
+        """
+        Increment a counter.
+
+        Args:
+            name: Name of the counter, ending in _total
+            amount: Amount to add
+            **labels: Labels of the series
+        """
+        if not self.enabled:
+            return
+        key = tuple(labels.items())
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def add(self, name: str, amount: float, **labels: str):
+        """
+        Add to a gauge, e.g. +1 when a call starts and -1 when it ends.
+
+        Args:
+            name: Name of the gauge
+            amount: Amount to add, negative to subtract
+            **labels: Labels of the series
+        """
+        if not self.enabled:
+            return
+        key = tuple(labels.items())
+        with self._lock:
+            series = self._gauges.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels: str):
+        """
+        Add a value to a histogram.
+
+        Args:
+            name: Name of the histogram, e.g. ending in _seconds
+            value: The value
+            **labels: Labels of the series
+        """
+        if not self.enabled:
+            return
+        key = tuple(labels.items())
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def register_collector(self, name: str, collect: Callable[[], Any], labels: Sequence[str] = ()):
+        """
+        Export the stats of a component as gauges on each scrape.
+
+        Numbers and booleans of the returned dictionary become gauges named after their path, e.g.
+        search_cache_hit_ratio. The keys of the first levels can become labels instead: with
+        labels=("operation",), {"search": {"calls": 3}} becomes single_flight_calls{operation="search"}.
+
+        Args:
+            name: Prefix of the gauges
+            collect: Returns the stats, e.g. SearchCache.stats, or None while the component does not exist
+            labels: Label names of the first levels of nesting
+        """
+        self._collectors.append((name, collect, tuple(labels)))
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            The metrics
+        """
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            gauges = {name: dict(series) for name, series in self._gauges.items()}
+            histograms = {
+                name: {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in series.items()}
+                for name, series in self._histograms.items()
+            }
+
+        for name, series in sorted(counters.items()):
+            self._header(lines, name, "counter")
+            lines.extend(f"{PREFIX}{name}{_labels(key)} {_number(value)}" for key, value in series.items())
+
+        collected: Dict[str, Dict[Labels, float]] = {}
+        for prefix, collect, label_names in self._collectors:
+            try:
+                stats = collect()
+            except Exception:
+                # A failing collector must not fail the whole scrape
+                continue
+            if stats is not None:
+                _flatten(collected, prefix, stats, label_names, ())
+        for name, series in sorted({**gauges, **collected}.items()):
+            self._header(lines, name, "gauge")
+            lines.extend(f"{PREFIX}{name}{_labels(key)} {_number(value)}" for key, value in series.items())
+
+        for name, series in sorted(histograms.items()):
+            self._header(lines, name, "histogram")
+            for key, (buckets, counts, total, count) in series.items():
+                cumulative = 0
+                for bound, bucket_count in zip((*buckets, "+Inf"), counts):
+                    cumulative += bucket_count
+                    le = bound if bound == "+Inf" else _number(bound)
+                    lines.append(f"{PREFIX}{name}_bucket{_labels(key + (('le', le),))} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{_labels(key)} {_number(total)}")
+                lines.append(f"{PREFIX}{name}_count{_labels(key)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines: List[str], name: str, kind: str):
+        if name in self._help:
+            lines.append(f"# HELP {PREFIX}{name} {self._help[name]}")
+        lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+
+def _flatten(collected: Dict[str, Dict[Labels, float]], name: str, value: Any, label_names: Tuple[str, ...],
+             labels: Labels):
+    if isinstance(value, (bool, int, float)):
+        collected.setdefault(_NAME_UNSAFE.sub("_", name), {})[labels] = float(value)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            if label_names and isinstance(item, dict):
+                _flatten(collected, name, item, label_names[1:], labels + ((label_names[0], str(key)),))
+            else:
+                _flatten(collected, f"{name}_{key}", item, label_names, labels)
+    # Strings and missing values (e.g. a hit ratio before any lookup) are not exported
+
+
+def _labels(key: Labels) -> str:
+    if not key:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in key)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+metrics = MetricsRegistry()
+
+metrics.describe("operation_duration_seconds", "Duration of the instrumented operations")
+metrics.describe("operations_in_flight", "Instrumented operations running")
+metrics.describe("operation_errors_total", "Instrumented operations which raised")
+metrics.describe("upstream_requests_total", "Requests sent to the upstream services, by response status")
+metrics.describe("upstream_request_duration_seconds", "Duration of the requests sent to the upstream services")
+metrics.describe("upstream_bytes_received_total", "Response body bytes received from the upstream services")
+metrics.describe("comment_pages_fetched_total", "commentThreads pages fetched from YouTube")
+
+
+def stats_of(getter: Callable[[], Any]) -> Optional[Dict[str, Any]]:
+    """
+    Get the stats of a process-wide component from its lru_cached getter, without creating it
+    when it does not exist yet (e.g. the Instagram session pool of an instance only serving YouTube).
+    """
+    return getter().stats() if getter.cache_info().currsize else None
+
+
+@contextmanager
+def timer(operation: str) -> Iterator[None]:
+    """
+    Record the duration, the errors and the number in flight of the operation run in this block,
+    and in a traced request, its span and its share of the Server-Timing breakdown.
+    """
+    trace = current_trace()
+    if not metrics.enabled and trace is None:
+        yield
+        return
+    metrics.add("operations_in_flight", 1, operation=operation)
+    start = time.perf_counter()
+    try:
+        with span(operation):
+            yield
+    except Exception:
+        # Cancellations (e.g. a draw dropping checks it no longer needs) are not errors
+        metrics.inc("operation_errors_total", operation=operation)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        metrics.observe("operation_duration_seconds", duration, operation=operation)
+        metrics.add("operations_in_flight", -1, operation=operation)
+        if trace is not None:
+            trace.add_timing(operation, duration)
+
+
+def timed(operation: str) -> Callable[[Callable], Callable]:
+    """
+    Decorate a function or coroutine function so its calls are recorded as an operation, see timer.
+    Functions are left as they are when neither metrics nor tracing are enabled.
+    """
+    def decorator(fn: Callable) -> Callable:
+        if not metrics.enabled and not TRACING_ENABLED:
+            return fn
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timer(operation):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(operation):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def record_upstream(upstream: str, endpoint: str, status: str, duration: float, received: Optional[int] = None):
+    """
+    Record a request sent to an upstream service, as a client span too in a traced request.
+
+    Args:
+        upstream: The service, e.g. "youtube"
+        endpoint: The endpoint or method called
+        status: The response status, or the error type
+        duration: Number of seconds the request took
+        received: Number of bytes of the response body, if known
+    """
+    trace = current_trace()
+    if trace is not None:
+        end = time.time()
+        attributes = {"upstream": upstream, "endpoint": endpoint, "status": status}
+        if received is not None:
+            attributes["bytes_received"] = received
+        trace.add_span(f"{upstream} {endpoint}", end - duration, end, CLIENT, attributes=attributes,
+                       error=not (status == "ok" or status.startswith(("2", "3"))))
+        trace.add_timing(f"upstream.{upstream}.{endpoint.strip('/')}", duration)
+    if not metrics.enabled:
+        return
+    metrics.inc("upstream_requests_total", upstream=upstream, endpoint=endpoint, status=status)
+    metrics.observe("upstream_request_duration_seconds", duration, upstream=upstream, endpoint=endpoint)
+    if received is not None:
+        metrics.inc("upstream_bytes_received_total", received, upstream=upstream, endpoint=endpoint)
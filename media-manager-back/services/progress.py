@@ -0,0 +1,102 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+
+class Progress:
+    """
+    Thread-safe counters of a long-running operation (e.g. pages fetched, chunks summarized).
+    """
+
+    def __init__(self):
+        """
+        Initialize empty counters.
+        """
+        self._counters: Dict[str, int] = {}
+        self._forwarded_to: List["Progress"] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, count: int = 1):
+        """
+        Increment a counter.
+
+        Args:
+            name: Name of the counter
+            count: Amount to add
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + count
+            forwarded_to = list(self._forwarded_to)
+        for progress in forwarded_to:
+            progress.add(name, count)
+
+    def set(self, name: str, value: int):
+        """
+        Set a counter, e.g. a total known upfront.
+
+        Args:
+            name: Name of the counter
+            value: New value
+        """
+        with self._lock:
+            self._counters[name] = value
+            forwarded_to = list(self._forwarded_to)
+        for progress in forwarded_to:
+            progress.set(name, value)
+
+    def forward(self, progress: "Progress"):
+        """
+        Also report to another progress from now on, e.g. the progress of each caller of an operation
+        shared by several of them (see services.single_flight). The current counters are added to it first.
+
+        Args:
+            progress: The progress to report to
+        """
+        with self._lock:
+            self._forwarded_to.append(progress)
+            counters = dict(self._counters)
+        for name, value in counters.items():
+            progress.add(name, value)
+
+    def snapshot(self) -> Dict[str, int]:
+        """
+        Get a copy of the counters.
+
+        Returns:
+            Dictionary mapping each counter to its value
+        """
+        with self._lock:
+            return dict(self._counters)
+
+
+# Progress of the operation running in the current context, inherited by the tasks it starts
+_current: ContextVar[Optional[Progress]] = ContextVar("progress", default=None)
+
+
+@contextmanager
+def tracking(progress: Progress) -> Iterator[Progress]:
+    """
+    Report the progress of the code run in this block (and the tasks it starts) to progress.
+    """
+    token = _current.set(progress)
+    try:
+        yield progress
+    finally:
+        _current.reset(token)
+
+
+def current_progress() -> Optional[Progress]:
+    """
+    Get the progress tracked in the current context, None outside of a tracking block.
+    """
+    return _current.get()
+
+
+def report(name: str, count: int = 1):
+    """
+    Increment a counter of the progress tracked in the current context, if any.
+    """
+    progress = _current.get()
+    if progress is not None:
+        progress.add(name, count)
@@ -0,0 +1,203 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, TypeVar
+
+from fastapi import HTTPException
+
+from config import (CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, UPSTREAM_RETRY_ATTEMPTS, UPSTREAM_RETRY_BASE_DELAY,
+                    UPSTREAM_RETRY_MAX_DELAY)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of an upstream service (YouTube, Gemini, Instagram).
+
+    After failure_threshold consecutive failures the circuit opens and calls fail right away,
+    without waiting on a service which is down. After reset_timeout seconds a single probe call
+    is let through: its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        """
+        Initialize a closed circuit.
+
+        Args:
+            name: Name of the upstream service, used in error messages
+            failure_threshold: Number of consecutive failures opening the circuit
+            reset_timeout: Number of seconds the circuit stays open before a probe call
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Check that a call may be made.
+
+        Raises:
+            HTTPException: 503 while the circuit is open
+        """
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == CLOSED or (self.state == HALF_OPEN and not self._probing):
+                self._probing = self.state == HALF_OPEN
+                return
+            self.rejected += 1
+        raise HTTPException(status_code=503, detail=f"{self.name} is unavailable, try again later")
+
+    def record_success(self):
+        """
+        Record a call the service answered, closing the circuit.
+        """
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        """
+        Record a failed call, opening the circuit after too many of them or after a failed probe.
+        """
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+            self._probing = False
+
+    def release(self):
+        """
+        End a call which says nothing about the health of the service (e.g. it was refused locally).
+        """
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the circuit state and counters.
+
+        Returns:
+            Dictionary with state, consecutive failures, times opened and calls rejected while open
+        """
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """
+    Get the process-wide circuit breaker of an upstream service.
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def circuit_breaker_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Get the state and counters of every circuit breaker created so far.
+    """
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: {**breaker.stats(), "open": breaker.state != CLOSED} for breaker in breakers}
+
+
+def backoff_delays(attempts: int = UPSTREAM_RETRY_ATTEMPTS, base_delay: float = UPSTREAM_RETRY_BASE_DELAY,
+                   max_delay: float = UPSTREAM_RETRY_MAX_DELAY) -> Iterator[float]:
+    """
+    Generate the delays before each retry: exponential backoff with full jitter, so clients
+    failing together do not retry together.
+    """
+    for attempt in range(attempts - 1):
+        yield random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+async def call_with_retry(fn: Callable[[], Awaitable[T]], breaker: CircuitBreaker,
+                          retryable: Callable[[Exception], bool], attempts: int = UPSTREAM_RETRY_ATTEMPTS) -> T:
+    """
+    Make an idempotent call, retrying transient failures with backoff while the circuit allows it.
+
+    Args:
+        fn: Makes the call
+        breaker: Circuit breaker of the upstream service
+        retryable: Tells whether an error is a transient failure of the service
+        attempts: Maximum number of attempts
+
+    Returns:
+        The result of the call
+
+    Raises:
+        HTTPException: 503 if the circuit is open, otherwise the error of the last attempt
+    """
+    delays = backoff_delays(attempts)
+    while True:
+        breaker.before_call()
+        try:
+            result = await fn()
+        except BaseException as e:
+            # Cancellations say nothing about the service either, and a cancelled probe must not
+            # leave the circuit half open for good
+            if not isinstance(e, Exception) or not retryable(e):
+                breaker.release()
+                raise
+            breaker.record_failure()
+            delay = next(delays, None)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+def call_with_retry_sync(fn: Callable[[], T], breaker: CircuitBreaker, retryable: Callable[[Exception], bool],
+                         attempts: int = UPSTREAM_RETRY_ATTEMPTS) -> T:
+    """
+    Blocking version of call_with_retry, for the clients running in worker threads (Gemini, Instagram).
+    """
+    delays = backoff_delays(attempts)
+    while True:
+        breaker.before_call()
+        try:
+            result = fn()
+        except BaseException as e:
+            # Cancellations say nothing about the service either, and a cancelled probe must not
+            # leave the circuit half open for good
+            if not isinstance(e, Exception) or not retryable(e):
+                breaker.release()
+                raise
+            breaker.record_failure()
+            delay = next(delays, None)
+            if delay is None:
+                raise
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
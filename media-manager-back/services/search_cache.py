@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import logging
+import time
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from config import (SEARCH_CACHE_SIZE, SEARCH_PREFIX_MIN_RESULTS, SEARCH_STALE_FOR, SEARCH_TTL, SEARCH_TTL_CHANNELS,
+                    SHARED_CACHE_BACKEND)
+from models.youtube import Channel, Video
+from services.cache import TTLCache
+from services.clients import get_firestore_service
+from services.firestore import DocumentStore
+from services.single_flight import single_flight_group
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "search_cache"
+
+
+class SearchCache:
+    """
+    Cache of YouTube search results keyed by normalized (query, scope).
+
+    Entries are fresh for a per-scope TTL, then served stale while a background call refreshes them,
+    so a repeated search never waits for YouTube. An in-process LRU sits in front of an optional
+    document store shared by every instance. A query which only extends a cached one (e.g. "mrbea"
+    then "mrbeast") is answered by filtering the cached results, without any API call. The reverse
+    does not hold: a shorter query matches more than the results of a longer one.
+    """
+
+    def __init__(self, store: Optional[DocumentStore] = None, maxsize: int = SEARCH_CACHE_SIZE,
+                 ttl: float = SEARCH_TTL, ttl_channels: float = SEARCH_TTL_CHANNELS,
+                 stale_for: float = SEARCH_STALE_FOR, prefix_min_results: int = SEARCH_PREFIX_MIN_RESULTS):
+        """
+        Initialize the cache.
+
+        Args:
+            store: Shared document store, or None to keep entries in process only
+            maxsize: Maximum number of entries kept in process
+            ttl: Number of seconds results stay fresh
+            ttl_channels: Number of seconds channel search results stay fresh
+            stale_for: Number of seconds stale results are still served after their TTL
+            prefix_min_results: Minimum number of filtered results to answer from a cached prefix
+        """
+        self.store = store
+        self.local = TTLCache(maxsize=maxsize)
+        self.ttl = ttl
+        self.ttl_channels = ttl_channels
+        self.stale_for = stale_for
+        self.prefix_min_results = prefix_min_results
+        self._refreshing: Dict[tuple, asyncio.Task] = {}
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.prefix_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.refresh_failures = 0
+
+    @staticmethod
+    def normalize(q: str) -> str:
+        return " ".join(q.lower().split())
+
+    def _ttl(self, scope: str) -> float:
+        return self.ttl_channels if scope == 'channels' else self.ttl
+
+    @staticmethod
+    def _document_id(key: tuple) -> str:
+        return hashlib.sha256("\n".join(key).encode()).hexdigest()
+
+    def _set_local(self, key: tuple, entry: Dict[str, Any]):
+        scope = key[1]
+        remaining = entry['fetched_at'] + self._ttl(scope) + self.stale_for - time.time()
+        if remaining <= 0:
+            return
+        self.local.set(key, entry, remaining)
+
+    def _get_shared(self, key: tuple) -> Optional[Dict[str, Any]]:
+        if self.store is None:
+            return None
+        try:
+            document = self.store.get_document(COLLECTION, self._document_id(key))
+        except Exception:
+            # The shared tier is an optimization, an unavailable store is just a miss
+            return None
+        if not document or document.get('fetched_at', 0) + self._ttl(key[1]) + self.stale_for <= time.time():
+            return None
+        return {
+            "result": {
+                "videos": [Video(**v) for v in document.get('videos', [])],
+                "channels": [Channel(**c) for c in document.get('channels', [])],
+            },
+            "fetched_at": document.get('fetched_at'),
+        }
+
+    def _set_shared(self, key: tuple, entry: Dict[str, Any]):
+        if self.store is None:
+            return
+        self.store.update_document(COLLECTION, self._document_id(key), {
+            "query": key[0],
+            "scope": key[1],
+            "videos": [v.model_dump(exclude_none=True) for v in entry['result'].get('videos', [])],
+            "channels": [c.model_dump(exclude_none=True) for c in entry['result'].get('channels', [])],
+            "fetched_at": entry['fetched_at'],
+        }, merge=False)
+
+    @staticmethod
+    def _matches(item, terms: list) -> bool:
+        text = " ".join(filter(None, [item.title, getattr(item, 'channel_title', None), item.description])).lower()
+        return all(term in text for term in terms)
+
+    def _from_prefix(self, query: str, scope: str) -> Optional[dict]:
+        """
+        Answer a query from the cached results of a query it extends, keeping the results which
+        contain every term of the query.
+        """
+        terms = query.split()
+        # Closest queries first
+        for prefix in (query[:i] for i in range(len(query) - 1, 0, -1)):
+            entry = self.local.get((prefix, scope))
+            if entry is None:
+                continue
+            result = {
+                kind: [item for item in items if self._matches(item, terms)]
+                for kind, items in entry['result'].items()
+            }
+            if sum(len(items) for items in result.values()) >= self.prefix_min_results:
+                return result
+        return None
+
+    async def _fetch_and_store(self, key: tuple, fetch: Callable[[str, str], Awaitable[dict]]) -> dict:
+        result = await fetch(*key)
+        entry = {"result": result, "fetched_at": time.time()}
+        self._set_local(key, entry)
+        await run_in_threadpool(self._set_shared, key, entry)
+        return result
+
+    def _fetch_once(self, key: tuple, fetch: Callable[[str, str], Awaitable[dict]]) -> Awaitable[dict]:
+        return single_flight_group.do("youtube.search", key, lambda: self._fetch_and_store(key, fetch))
+
+    def _revalidate(self, key: tuple, fetch: Callable[[str, str], Awaitable[dict]]):
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                await self._fetch_once(key, fetch)
+            except Exception as e:
+                # Keep serving the stale results, e.g. while the search quota is exhausted
+                self.refresh_failures += 1
+                logger.warning("Search cache refresh failed for %s: %s", key, e)
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.ensure_future(refresh())
+
+    async def get(self, q: str, scope: str, fetch: Callable[[str, str], Awaitable[dict]]) -> dict:
+        """
+        Get the results of a search, from the cache when possible.
+
+        Args:
+            q: The query string
+            scope: The type of search
+            fetch: Runs the search on YouTube, taking the normalized query and the scope
+
+        Returns:
+            dict with list of videos and / or channels
+        """
+        key = (self.normalize(q), scope)
+        entry = self.local.get(key)
+        if entry is None:
+            entry = await run_in_threadpool(self._get_shared, key)
+            if entry is not None:
+                self.shared_hits += 1
+                self._set_local(key, entry)
+
+        if entry is not None:
+            if time.time() - entry['fetched_at'] < self._ttl(scope):
+                self.fresh_hits += 1
+            else:
+                self.stale_hits += 1
+                self._revalidate(key, fetch)
+            return entry['result']
+
+        result = self._from_prefix(*key)
+        if result is not None:
+            self.prefix_hits += 1
+            return result
+
+        self.misses += 1
+        return await self._fetch_once(key, fetch)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the cache counters.
+
+        Returns:
+            Dictionary with size, fresh, stale, prefix and shared hits, misses, refresh failures and hit_ratio
+        """
+        hits = self.fresh_hits + self.stale_hits + self.prefix_hits
+        return {
+            "size": len(self.local),
+            "fresh_hits": self.fresh_hits,
+            "stale_hits": self.stale_hits,
+            "prefix_hits": self.prefix_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "refresh_failures": self.refresh_failures,
+            "hit_ratio": hits / (hits + self.misses) if hits + self.misses else None,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_search_cache() -> SearchCache:
+    """
+    Get the process-wide search cache.
+    """
+    return SearchCache(store=get_firestore_service() if SHARED_CACHE_BACKEND == "firestore" else None)
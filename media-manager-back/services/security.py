@@ -1,8 +1,15 @@
+import hashlib
 import os
+import time
 import firebase_admin
 from firebase_admin import credentials, auth
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
+
+from config import FIREBASE_TOKEN_CACHE_SIZE
+from services.cache import TTLCache
+from services.metrics import timed
 
 # Initialize Firebase Admin SDK
 # cred = credentials.Certificate(os.getenv("FIREBASE_SERVICE_ACCOUNT_KEY"))
@@ -10,18 +17,34 @@ firebase_admin.initialize_app()
 
 security = HTTPBearer()
 
+# Decoded claims of verified tokens, keyed by the SHA-256 of the token so raw tokens are not kept in memory
+token_cache = TTLCache(maxsize=FIREBASE_TOKEN_CACHE_SIZE)
+
+
+@timed("auth.verify_firebase_token")
 async def verify_firebase_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
     Verify Firebase JWT token from Authorization header
     Returns the decoded token if valid, raises HTTPException otherwise
+    Verified tokens are cached until their exp claim, and the RS256 check of a new token runs off the event loop
+    (the SDK keeps Google's signing certificates for as long as their Cache-Control allows)
     """
     token = credentials.credentials
-    try:
-        decoded_token = auth.verify_id_token(token)
+    key = hashlib.sha256(token.encode()).hexdigest()
+    decoded_token = token_cache.get(key)
+    if decoded_token is not None:
         return decoded_token
+
+    try:
+        decoded_token = await run_in_threadpool(auth.verify_id_token, token)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Invalid authentication credentials: {str(e)}",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    ttl = decoded_token.get('exp', 0) - time.time()
+    if ttl > 0:
+        token_cache.set(key, decoded_token, ttl)
+    return decoded_token
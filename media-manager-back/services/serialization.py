@@ -0,0 +1,53 @@
+from typing import Any, AsyncIterator
+
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+from services.metrics import timer
+
+
+def _default(obj: Any) -> Any:
+    # Models were validated when they were built, dump them as they are
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encode content as JSON with orjson.
+    Pydantic models (Video, Channel...) are dumped without being validated again.
+    :param content: The content to encode.
+    :return: The UTF-8 encoded JSON document
+    """
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    JSON response rendered with orjson.
+
+    Returning it from an endpoint also skips FastAPI's validation and encoding of the content
+    against the response_model, which stays declared for the OpenAPI schema only. Use it for
+    content built from already validated models or from the comment store.
+    """
+
+    def render(self, content: Any) -> bytes:
+        with timer("serialization"):
+            return dumps(content)
+
+
+async def encode_ndjson(events: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    """
+    Encode events as newline-delimited JSON.
+    The status code is already sent once streaming starts, so errors become a final error event.
+    :param events: The events to encode.
+    :return: async generator of JSON lines
+    """
+    try:
+        async for event in events:
+            yield dumps(event) + b"\n"
+    except HTTPException as e:
+        yield dumps({"type": "error", "status_code": e.status_code, "detail": e.detail}) + b"\n"
@@ -0,0 +1,104 @@
+import asyncio
+import functools
+import inspect
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from services.progress import Progress, current_progress, tracking
+from services.youtube_quota import SharedPriority, current_quota_priority, quota_priority
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical operations: while an operation runs for a key, later callers
+    with the same key wait for it instead of starting their own.
+
+    Every caller gets the same result object, so callers must not mutate it. A failure is shared
+    the same way, and the next call after the operation finished starts a new one. The operation
+    reports its progress to every caller tracking one, and its YouTube calls get the highest quota
+    priority of its callers.
+    """
+
+    def __init__(self):
+        """
+        Initialize the in-flight table and the counters.
+        """
+        self._in_flight: Dict[Hashable, Tuple[asyncio.Future, Progress, SharedPriority]] = {}
+        self.calls = Counter()
+        self.deduplicated = Counter()
+
+    async def do(self, operation: str, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run an operation, or join the identical one already in flight.
+
+        Args:
+            operation: Name of the operation, used for the counters
+            key: Arguments identifying the operation
+            fn: Starts the operation
+
+        Returns:
+            The result of the operation
+        """
+        self.calls[operation] += 1
+        flight_key = (operation, key)
+        flight = self._in_flight.get(flight_key)
+        if flight is None:
+            progress, priority = Progress(), SharedPriority()
+
+            async def run():
+                with tracking(progress), quota_priority(priority):
+                    return await fn()
+
+            task = asyncio.ensure_future(run())
+            self._in_flight[flight_key] = task, progress, priority
+            task.add_done_callback(lambda _: self._in_flight.pop(flight_key, None))
+        else:
+            task, progress, priority = flight
+            self.deduplicated[operation] += 1
+
+        # The operation works for this caller too, whoever started it
+        caller_progress = current_progress()
+        if caller_progress is not None:
+            progress.forward(caller_progress)
+        priority.join(current_quota_priority())
+
+        # A caller going away must not cancel the operation the other callers wait for
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Get the counters.
+
+        Returns:
+            Dictionary mapping each operation to its calls, deduplicated calls and calls in flight
+        """
+        in_flight = Counter(operation for operation, _ in self._in_flight)
+        return {
+            operation: {
+                "calls": self.calls[operation],
+                "deduplicated": self.deduplicated[operation],
+                "in_flight": in_flight[operation],
+            } for operation in self.calls
+        }
+
+
+single_flight_group = SingleFlight()
+
+
+def single_flight(fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """
+    Decorate a coroutine function so concurrent calls with the same arguments share one call.
+    The arguments must be hashable.
+    """
+    operation = f"{fn.__module__}.{fn.__qualname__}"
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        # Positional, keyword and default arguments give the same key for the same call
+        arguments = signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        key = tuple(arguments.arguments.items())
+        return await single_flight_group.do(operation, key, lambda: fn(*args, **kwargs))
+
+    return wrapper
@@ -0,0 +1,133 @@
+import hashlib
+import time
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional
+
+from config import (SHARED_CACHE_BACKEND, SUBSCRIPTION_CACHE_SIZE, SUBSCRIPTION_TTL_NOT_SUBSCRIBED,
+                    SUBSCRIPTION_TTL_PRIVATE, SUBSCRIPTION_TTL_SUBSCRIBED)
+from services.cache import TTLCache
+from services.clients import get_firestore_service
+from services.firestore import DocumentStore, InMemoryFirestoreService
+
+SUBSCRIBED = "subscribed"
+NOT_SUBSCRIBED = "not_subscribed"
+# The author keeps their subscriptions private (403 from the API)
+PRIVATE = "private"
+
+COLLECTION = "subscription_cache"
+FOLLOW_COLLECTION = "instagram_follow_cache"
+
+
+class SubscriptionCache:
+    """
+    Cache of subscription check results keyed by (author channel ID, set of channels).
+
+    An in-process LRU sits in front of a document store shared by every instance, and each
+    status has its own TTL: authors may subscribe during a giveaway, so negative results
+    should expire much sooner than positive or private ones.
+    """
+
+    def __init__(self, store: Optional[DocumentStore] = None, maxsize: int = SUBSCRIPTION_CACHE_SIZE,
+                 collection: str = COLLECTION):
+        """
+        Initialize the cache.
+
+        Args:
+            store: Shared document store (default: an InMemoryFirestoreService)
+            maxsize: Maximum number of entries kept in process
+            collection: Collection of the shared entries
+        """
+        self.store = store if store is not None else InMemoryFirestoreService()
+        self.collection = collection
+        self.local = TTLCache(maxsize=maxsize)
+        self.shared_hits = 0
+        self.misses = 0
+        self.ttls = {
+            SUBSCRIBED: SUBSCRIPTION_TTL_SUBSCRIBED,
+            NOT_SUBSCRIBED: SUBSCRIPTION_TTL_NOT_SUBSCRIBED,
+            PRIVATE: SUBSCRIPTION_TTL_PRIVATE,
+        }
+
+    @staticmethod
+    def _document_id(author_id: str, channels: frozenset) -> str:
+        return hashlib.sha256("\n".join([author_id, *sorted(channels)]).encode()).hexdigest()
+
+    def get(self, author_id: str, channels: Iterable[str]) -> Optional[str]:
+        """
+        Get the cached subscription status of an author.
+
+        Args:
+            author_id: Channel ID of the author
+            channels: Channels the author must be subscribed to
+
+        Returns:
+            SUBSCRIBED, NOT_SUBSCRIBED or PRIVATE, or None on a miss
+        """
+        key = (author_id, frozenset(channels))
+        status = self.local.get(key)
+        if status is not None:
+            return status
+
+        try:
+            document = self.store.get_document(self.collection, self._document_id(*key))
+        except Exception:
+            # The shared tier is an optimization, an unavailable store is just a miss
+            document = None
+        remaining = document.get('expires_at', 0) - time.time() if document else 0
+        if remaining > 0:
+            self.shared_hits += 1
+            self.local.set(key, document.get('status'), remaining)
+            return document.get('status')
+
+        self.misses += 1
+        return None
+
+    def set(self, author_id: str, channels: Iterable[str], status: str):
+        """
+        Cache the subscription status of an author.
+
+        Args:
+            author_id: Channel ID of the author
+            channels: Channels the author must be subscribed to
+            status: SUBSCRIBED, NOT_SUBSCRIBED or PRIVATE
+        """
+        key = (author_id, frozenset(channels))
+        ttl = self.ttls[status]
+        self.local.set(key, status, ttl)
+        # expires_at can also back a Firestore TTL policy to purge old entries
+        self.store.update_document(self.collection, self._document_id(*key), {
+            "status": status,
+            "expires_at": time.time() + ttl,
+        }, merge=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the cache counters.
+
+        Returns:
+            Dictionary with local_hits, shared_hits, misses and hit_ratio
+        """
+        hits = self.local.hits + self.shared_hits
+        return {
+            "local_hits": self.local.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / (hits + self.misses) if hits + self.misses else None,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_subscription_cache() -> SubscriptionCache:
+    """
+    Get the process-wide subscription cache.
+    """
+    return SubscriptionCache(store=get_firestore_service() if SHARED_CACHE_BACKEND == "firestore" else None)
+
+
+@lru_cache(maxsize=None)
+def get_follow_cache() -> SubscriptionCache:
+    """
+    Get the process-wide cache of Instagram follow checks, keyed by (user ID, account IDs).
+    """
+    return SubscriptionCache(store=get_firestore_service() if SHARED_CACHE_BACKEND == "firestore" else None,
+                             collection=FOLLOW_COLLECTION)
@@ -0,0 +1,237 @@
+import asyncio
+import itertools
+import logging
+import time
+import uuid
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from config import SHARED_CACHE_BACKEND, SUMMARY_JOB_KEEP_FOR, SUMMARY_JOB_MAX_QUEUE, SUMMARY_JOB_WORKERS
+from services.cache import TTLCache
+from services.clients import get_firestore_service
+from services.firestore import DocumentStore
+from services.progress import Progress, tracking
+from services.youtube import summarize_comments
+from services.youtube_quota import BACKGROUND, quota_priority
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "summary_jobs"
+
+# Lower runs first
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+
+class SummaryJobQueue:
+    """
+    In-process queue of comment summary jobs, run in the background by a bounded number of workers.
+
+    A submission returns a job right away, and its status and progress (pages fetched, chunks
+    summarized) are polled until it is done. The summary itself is stored in the `videos` document
+    by summarize_comments. Job documents are also written to an optional document store, so their
+    last known state can be looked up from any instance and after a restart.
+    """
+
+    def __init__(self, store: Optional[DocumentStore] = None, workers: int = SUMMARY_JOB_WORKERS,
+                 max_queue: int = SUMMARY_JOB_MAX_QUEUE, keep_for: float = SUMMARY_JOB_KEEP_FOR,
+                 run: Callable[..., Awaitable[str]] = None):
+        """
+        Initialize the queue, workers are started on the first submission.
+
+        Args:
+            store: Document store of the jobs, or None to keep them in process only
+            workers: Number of jobs running at once
+            max_queue: Maximum number of jobs waiting for a worker, further submissions are rejected
+            keep_for: Number of seconds finished jobs can still be looked up in process
+            run: Produces the summary, taking the video ID, max_comments and regenerate (default: summarize_comments)
+        """
+        self.store = store
+        self.workers = workers
+        self.max_queue = max_queue
+        self.keep_for = keep_for
+        self.run = run or summarize_comments
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks = []
+        self._sequence = itertools.count()
+        self._active: Dict[str, Dict[str, Any]] = {}
+        self._active_by_key: Dict[tuple, str] = {}
+        self._progress: Dict[str, Progress] = {}
+        self._finished = TTLCache(maxsize=10000)
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        """
+        Start the workers if they are not running yet.
+        """
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def close(self):
+        """
+        Stop the workers, running jobs are marked as failed.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, video_id: str, regenerate: bool = False, priority: str = "normal",
+                     max_comments: int = None) -> Dict[str, Any]:
+        """
+        Queue a summary job, or return the identical job already queued or running.
+
+        Args:
+            video_id: ID of the video to summarize
+            regenerate: Whether to ignore the stored summary
+            priority: "high", "normal" or "low"
+            max_comments: Maximum number of comments to summarize, the most liked ones first (default: all)
+
+        Returns:
+            The job
+
+        Raises:
+            HTTPException: 503 if too many jobs are already waiting
+        """
+        self.start()
+        key = (video_id, regenerate, max_comments)
+        job = self._active.get(self._active_by_key.get(key))
+        if job is not None:
+            if job["status"] == "queued" and PRIORITIES[priority] < PRIORITIES[job["priority"]]:
+                # The entry queued with the former priority is skipped once the job has run
+                job["priority"] = priority
+                self._queue.put_nowait((PRIORITIES[priority], next(self._sequence), job["id"]))
+            return self._view(job)
+
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Too many summaries in progress, try again later")
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "video_id": video_id,
+            "regenerate": regenerate,
+            "max_comments": max_comments,
+            "priority": priority,
+            "status": "queued",
+            "progress": {},
+            "summary": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        self._active[job["id"]] = job
+        self._active_by_key[key] = job["id"]
+        self.queued += 1
+        self._queue.put_nowait((PRIORITIES[priority], next(self._sequence), job["id"]))
+        await self._save(job)
+        return self._view(job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a job with its current progress.
+
+        Args:
+            job_id: ID of the job
+
+        Returns:
+            The job, or None if it is unknown
+        """
+        job = self._active.get(job_id) or self._finished.get(job_id)
+        if job is not None:
+            return self._view(job)
+        if self.store is None:
+            return None
+        try:
+            return await run_in_threadpool(self.store.get_document, COLLECTION, job_id)
+        except Exception:
+            return None
+
+    def _view(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        progress = self._progress.get(job["id"])
+        return {**job, "progress": progress.snapshot()} if progress is not None else dict(job)
+
+    async def _save(self, job: Dict[str, Any]):
+        if self.store is None:
+            return
+        try:
+            await run_in_threadpool(self.store.update_document, COLLECTION, job["id"], self._view(job), False)
+        except Exception as e:
+            # The in-process state stays authoritative on this instance
+            logger.warning("Failed to save summary job %s: %s", job["id"], e)
+
+    async def _work(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self._active.get(job_id)
+            # Entries left behind by a priority change
+            if job is None or job["status"] != "queued":
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]):
+        progress = self._progress[job["id"]] = Progress()
+        job.update(status="running", started_at=time.time())
+        self.queued -= 1
+        self.running += 1
+        await self._save(job)
+        try:
+            # Jobs only spend the quota left over by interactive calls
+            with tracking(progress), quota_priority(BACKGROUND):
+                summary = await self.run(job["video_id"], max_comments=job["max_comments"],
+                                         regenerate=job["regenerate"])
+        except asyncio.CancelledError:
+            job.update(status="failed", error="Interrupted by a shutdown")
+            raise
+        except HTTPException as e:
+            job.update(status="failed", error=e.detail)
+        except Exception:
+            logger.exception("Summary job %s failed", job["id"])
+            job.update(status="failed", error="Failed to summarize the comments")
+        else:
+            job.update(status="done", summary=summary)
+        finally:
+            self.running -= 1
+            if job["status"] == "done":
+                self.completed += 1
+            else:
+                self.failed += 1
+            job.update(progress=progress.snapshot(), finished_at=time.time())
+            del self._progress[job["id"]]
+            del self._active[job["id"]]
+            self._active_by_key.pop((job["video_id"], job["regenerate"], job["max_comments"]), None)
+            self._finished.set(job["id"], job, self.keep_for)
+            await asyncio.shield(self._save(job))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the queue counters.
+
+        Returns:
+            Dictionary with workers, queued and running jobs, completed, failed and rejected jobs
+        """
+        return {
+            "workers": self.workers,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_summary_job_queue() -> SummaryJobQueue:
+    """
+    Get the process-wide summary job queue.
+    """
+    return SummaryJobQueue(store=get_firestore_service() if SHARED_CACHE_BACKEND == "firestore" else None)
@@ -0,0 +1,433 @@
+import json
+import logging
+import os
+import queue
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+from config import (PROFILE_DIR, PROFILE_SAMPLE_INTERVAL, PROFILE_SLOW_REQUESTS_AFTER, PROFILING_ENABLED,
+                    TRACE_EXPORT, TRACE_SAMPLE_RATIO, TRACE_SERVICE_NAME, TRACE_TRUST_PARENT)
+
+logger = logging.getLogger(__name__)
+
+# Whether operations are wrapped at all, see services.metrics.timed
+TRACING_ENABLED = PROFILING_ENABLED or bool(TRACE_EXPORT)
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_TIMING_UNSAFE = re.compile(r"[^a-zA-Z0-9_.-]")
+
+# OTLP span kinds
+INTERNAL = 1
+SERVER = 2
+CLIENT = 3
+
+
+class Trace:
+    """
+    Spans and operation timings of one request.
+
+    The trace is shared by the tasks and threads working for the request (the context is copied to
+    them), so spans and timings are added under a lock.
+    """
+
+    def __init__(self, trace_id: str = None, parent_span_id: str = None, export: bool = False):
+        """
+        Initialize an empty trace.
+
+        Args:
+            trace_id: ID of the trace, 32 hex digits (default: a new one)
+            parent_span_id: ID of the caller's span, from its traceparent header
+            export: Whether the spans are exported once the request is done
+        """
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.parent_span_id = parent_span_id
+        self.export = export
+        self.spans: List[Dict[str, Any]] = []
+        self.timings: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def add_timing(self, name: str, seconds: float):
+        """
+        Add time spent in an operation to the Server-Timing breakdown.
+        """
+        with self._lock:
+            timing = self.timings.setdefault(name, [0.0, 0])
+            timing[0] += seconds
+            timing[1] += 1
+
+    def add_span(self, name: str, start: float, end: float, kind: int = INTERNAL, parent_span_id: str = None,
+                 attributes: Dict[str, Any] = None, error: bool = False, span_id: str = None) -> str:
+        """
+        Add a finished span.
+
+        Args:
+            name: Name of the span
+            start: Start time, seconds since the epoch
+            end: End time, seconds since the epoch
+            kind: INTERNAL, SERVER or CLIENT
+            parent_span_id: ID of the enclosing span (default: the current span)
+            attributes: Attributes of the span
+            error: Whether the operation failed
+            span_id: ID of the span (default: a new one)
+
+        Returns:
+            The ID of the span
+        """
+        span_id = span_id or secrets.token_hex(8)
+        span = {
+            "traceId": self.trace_id,
+            "spanId": span_id,
+            "name": name,
+            "kind": kind,
+            "startTimeUnixNano": str(int(start * 1e9)),
+            "endTimeUnixNano": str(int(end * 1e9)),
+            "attributes": [_attribute(key, value) for key, value in (attributes or {}).items()],
+            "status": {"code": 2 if error else 1},
+        }
+        parent_span_id = parent_span_id or _span_id.get()
+        if parent_span_id:
+            span["parentSpanId"] = parent_span_id
+        with self._lock:
+            self.spans.append(span)
+        return span_id
+
+    def server_timing(self, total: float) -> str:
+        """
+        Format the timings as a Server-Timing header value, durations in milliseconds.
+        Operations running concurrently can add up to more than the total.
+
+        Args:
+            total: Number of seconds the request took
+
+        Returns:
+            The header value
+        """
+        with self._lock:
+            timings = sorted(self.timings.items(), key=lambda item: -item[1][0])
+        entries = [f'{_TIMING_UNSAFE.sub("_", name)};dur={seconds * 1000:.1f};desc="{count} call(s)"'
+                   for name, (seconds, count) in timings]
+        return ", ".join([*entries, f"total;dur={total * 1000:.1f}"])
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """
+        Get the spans as an OTLP/JSON export request.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_attribute("service.name", TRACE_SERVICE_NAME)]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }]
+        }
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+# Trace of the request being served, and current span of the code running, inherited by the tasks it starts
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_span_id: ContextVar[Optional[str]] = ContextVar("span_id", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    """
+    Get the trace of the request being served, None if the request is neither profiled nor traced.
+    """
+    return _trace.get()
+
+
+@contextmanager
+def span(name: str, kind: int = INTERNAL, **attributes: Any) -> Iterator[None]:
+    """
+    Record the code run in this block as a span of the current trace, the spans started in the block
+    being its children. Does nothing outside a traced request.
+    """
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    span_id = secrets.token_hex(8)
+    parent_span_id = _span_id.get()
+    token = _span_id.set(span_id)
+    start = time.time()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        _span_id.reset(token)
+        trace.add_span(name, start, time.time(), kind, parent_span_id, attributes, error, span_id)
+
+
+def start_trace(profile: bool, traceparent: Optional[str] = None,
+                trust_parent: bool = TRACE_TRUST_PARENT) -> Optional[Trace]:
+    """
+    Start the trace of a request if it is profiled or sampled for export.
+    The trace continues the caller's one, but the caller's sampling decision is only followed when trusted.
+
+    Args:
+        profile: Whether the request asked for a Server-Timing breakdown, and profiling is enabled
+        traceparent: The W3C traceparent header of the request, if any
+        trust_parent: Whether a sampled traceparent forces the export, whatever TRACE_SAMPLE_RATIO
+
+    Returns:
+        The trace, or None if the request is not traced
+    """
+    trace_id = parent_span_id = None
+    sampled = False
+    match = _TRACEPARENT.match(traceparent or "")
+    if match:
+        trace_id, parent_span_id, flags = match.groups()
+        sampled = trust_parent and bool(int(flags, 16) & 1)
+
+    export = bool(TRACE_EXPORT) and (profile or sampled or random.random() < TRACE_SAMPLE_RATIO)
+    if not profile and not export:
+        return None
+    return Trace(trace_id, parent_span_id, export)
+
+
+class TraceExporter:
+    """
+    Background exporter of finished traces to a file (one OTLP/JSON export request per line, the
+    format read by the OpenTelemetry Collector's otlpjsonfile receiver) or to an OTLP/HTTP collector.
+    Traces are dropped when the exporter falls behind, requests never wait for it.
+    """
+
+    def __init__(self, target: str = TRACE_EXPORT, max_queue: int = 1000):
+        """
+        Initialize the exporter, its thread is started on the first export.
+
+        Args:
+            target: A file path, or the URL of an OTLP/HTTP traces endpoint
+            max_queue: Maximum number of traces waiting to be exported
+        """
+        self.target = target
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace):
+        """
+        Queue a trace for export.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(trace.to_otlp())
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        with httpx.Client(timeout=10) as client:
+            while True:
+                payload = self._queue.get()
+                try:
+                    if self.target.startswith(("http://", "https://")):
+                        client.post(self.target, json=payload).raise_for_status()
+                    else:
+                        with open(self.target, "a") as f:
+                            f.write(json.dumps(payload) + "\n")
+                    self.exported += 1
+                except Exception as e:
+                    self.failed += 1
+                    logger.warning("Trace export failed: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the exporter counters.
+
+        Returns:
+            Dictionary with queued, exported, dropped and failed traces
+        """
+        return {
+            "queued": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+trace_exporter = TraceExporter()
+
+
+class SamplingProfiler:
+    """
+    Sampling profiler of the requests in flight.
+
+    While at least one request runs, a thread records the stack of every other thread every
+    `interval` seconds and adds it to each running request's samples. The event loop serves every
+    request, so the samples of concurrent requests include each other's work: profiles are most
+    telling for slow requests on a quiet instance. Samples are written as folded stacks, which
+    flamegraph.pl and speedscope turn into flame graphs.
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL, directory: str = PROFILE_DIR):
+        """
+        Initialize the profiler, sampling starts with the first request.
+
+        Args:
+            interval: Number of seconds between two samples
+            directory: Directory of the profiles of slow requests
+        """
+        self.interval = interval
+        self.directory = directory
+        self.dumped = 0
+        self._sessions: List[Counter] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+
+    @contextmanager
+    def profile(self) -> Iterator[Counter]:
+        """
+        Sample the stacks while this block runs.
+
+        Returns:
+            Counter of the folded stacks sampled, filled until the block exits
+        """
+        samples = Counter()
+        with self._lock:
+            self._sessions.append(samples)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+            self._wake.notify()
+        try:
+            yield samples
+        finally:
+            with self._lock:
+                self._sessions.remove(samples)
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                while not self._sessions:
+                    self._wake.wait()
+                sessions = list(self._sessions)
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = [_fold(names.get(ident, str(ident)), frame)
+                      for ident, frame in sys._current_frames().items() if ident != me]
+            with self._lock:
+                for samples in sessions:
+                    samples.update(stacks)
+            time.sleep(self.interval)
+
+    def dump(self, samples: Counter, label: str) -> Optional[str]:
+        """
+        Write samples as folded stacks, one "frame;frame;... count" line per stack.
+
+        Args:
+            samples: The samples of a request
+            label: Describes the request, used in the file name
+
+        Returns:
+            The path of the file, or None if there was nothing to write
+        """
+        if not samples:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{_TIMING_UNSAFE.sub('_', label)[:80]}"
+                                            f"-{secrets.token_hex(3)}.folded")
+        with open(path, "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in samples.most_common())
+        self.dumped += 1
+        return path
+
+
+def _fold(thread_name: str, frame) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join([thread_name, *reversed(frames)])
+
+
+sampling_profiler = SamplingProfiler()
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware of the per-request profiling.
+
+    - A request sent with an X-Profile: 1 header or a profile=1 query parameter gets a Server-Timing
+      header with the time spent in each operation (Firestore, YouTube pages, Gemini, serialization...).
+    - Traced requests get a server span, the spans of their operations and upstream calls being its
+      children, and are exported to TRACE_EXPORT.
+    - With PROFILE_SLOW_REQUESTS_AFTER set, requests are sampled by the profiler and the slow ones
+      dump their samples to PROFILE_DIR.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (TRACING_ENABLED or PROFILE_SLOW_REQUESTS_AFTER > 0):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        profile = PROFILING_ENABLED and (
+            headers.get(b"x-profile") == b"1" or b"profile=1" in scope.get("query_string", b"").split(b"&"))
+        trace = start_trace(profile, headers.get(b"traceparent", b"").decode("latin-1"))
+        label = f"{scope['method']} {scope['path']}"
+        start = time.perf_counter()
+        started_at = time.time()
+        status = {}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if trace is not None and profile:
+                    server_timing = trace.server_timing(time.perf_counter() - start).encode("latin-1")
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", server_timing)]}
+            await send(message)
+
+        span_id = secrets.token_hex(8) if trace is not None else None
+        trace_token, span_token = _trace.set(trace), _span_id.set(span_id)
+        try:
+            if PROFILE_SLOW_REQUESTS_AFTER > 0:
+                with sampling_profiler.profile() as samples:
+                    await self.app(scope, receive, send_with_timing)
+                if time.perf_counter() - start >= PROFILE_SLOW_REQUESTS_AFTER:
+                    path = sampling_profiler.dump(samples, label)
+                    logger.warning("Slow request %s took %.1fs, profile written to %s",
+                                   label, time.perf_counter() - start, path)
+            else:
+                await self.app(scope, receive, send_with_timing)
+        finally:
+            _trace.reset(trace_token)
+            _span_id.reset(span_token)
+            if trace is not None and trace.export:
+                trace.add_span(label, started_at, time.time(), SERVER, trace.parent_span_id, {
+                    "http.request.method": scope["method"],
+                    "url.path": scope["path"],
+                    "http.response.status_code": status.get("code", 500),
+                }, error=status.get("code", 500) >= 500, span_id=span_id)
+                trace_exporter.export(trace)
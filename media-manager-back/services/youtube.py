@@ -1,24 +1,160 @@
-import random
-import requests
+import asyncio
+import base64
+import json
 import os
+import random
+import time
+import weakref
+from typing import AsyncIterator, Optional
+
+import httpx
+import orjson
 from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from config import (COMMENT_STORE_FRESH_FOR, COMMENT_STORE_RESYNC_AFTER, COMMENT_SYNC_RESUME_FOR, COMMENTS_PREFETCH_PAGES,
+                    DRAW_PARALLELISM, SUMMARY_DELTA_MAX_RATIO)
 from models.youtube import Channel, Video
+from services.clients import get_firestore_service, get_http_client
+from services.comment_set import CommentSet
+from services.comment_store import get_comment_store
+from services.draw import draw_eligible_comment, draw_streamed_comment, draw_weighted_comment
 from services.firestore import FirestoreService
-from services.gemini import summarize
-import json
+from services.gemini import SUMMARY_VERSION, extend_summary, summarize
+from services.metrics import metrics, record_upstream, timed
+from services.progress import current_progress, report
+from services.resilience import call_with_retry, get_circuit_breaker
+from services.search_cache import get_search_cache
+from services.single_flight import single_flight
+from services.subscription_cache import NOT_SUBSCRIBED, PRIVATE, SUBSCRIBED, get_subscription_cache
+from services.youtube_quota import get_youtube_quota
+
+# Marks the end of the page queue
+_DONE = object()
+
+# Full syncs of a video share its staging rows, so they run one at a time; a lock goes away with its last user
+_full_sync_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+# Errors meaning the daily quota is spent
+QUOTA_EXHAUSTED_REASONS = {'quotaExceeded', 'dailyLimitExceeded'}
+
+# Transient errors: server errors and per-second rate limits
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+RATE_LIMITED_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+
+def raise_for_youtube_error(response: httpx.Response):
+    """
+    Raise an HTTPException carrying the YouTube API error message if the response failed.
+    :param response: The response to check.
+    """
+    if response.is_success:
+        return
+
+    error_message = f"YouTube API error: {response.status_code} {response.reason_phrase}"
+    try:
+        error_data = response.json()
+        if 'error' in error_data and 'message' in error_data['error']:
+            error_message = f"YouTube API error: {error_data['error']['message']}"
+    except ValueError:
+        pass
+
+    raise HTTPException(status_code=response.status_code, detail=error_message)
+
+
+class _TransientResponse(Exception):
+    """
+    A failed YouTube response worth retrying.
+    """
+
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"{response.status_code} {response.reason_phrase}")
+        self.response = response
+
+
+def youtube_error_reasons(response: httpx.Response) -> set:
+    """
+    Get the reasons of a YouTube API error response (e.g. quotaExceeded).
+    :param response: The failed response.
+    :return: set of reasons
+    """
+    try:
+        return {e.get('reason') for e in response.json().get('error', {}).get('errors', [])}
+    except ValueError:
+        return set()
+
+
+async def youtube_request(path: str, params: dict) -> httpx.Response:
+    """
+    Send a GET request to the YouTube Data API on the shared HTTP client.
+    Calls are paced and counted against the daily quota, see services.youtube_quota.
+    Transient failures are retried with backoff, see services.resilience.
+    :param path: The resource path, e.g. '/search'.
+    :param params: The query parameters, without the API key.
+    :return: The response, whatever its status
+    """
+    quota = get_youtube_quota()
+
+    async def attempt() -> httpx.Response:
+        # Every attempt is paced and costs quota units
+        await quota.acquire(path)
+        start = time.perf_counter()
+        try:
+            response = await get_http_client().get(path, params={"key": os.getenv('YOUTUBE_API_KEY'), **params})
+        except httpx.HTTPError as e:
+            record_upstream("youtube", path, type(e).__name__, time.perf_counter() - start)
+            raise
+        record_upstream("youtube", path, str(response.status_code), time.perf_counter() - start,
+                        len(response.content))
+        if response.status_code in RETRY_STATUS_CODES or (
+                response.status_code == 403 and youtube_error_reasons(response) & RATE_LIMITED_REASONS):
+            raise _TransientResponse(response)
+        return response
+
+    try:
+        r = await call_with_retry(attempt, get_circuit_breaker("YouTube"),
+                                  retryable=lambda e: isinstance(e, (httpx.TransportError, _TransientResponse)))
+    except _TransientResponse as e:
+        r = e.response
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"YouTube API error: {str(e)}")
+
+    if r.status_code == 403 and youtube_error_reasons(r) & QUOTA_EXHAUSTED_REASONS:
+        quota.budget.mark_exhausted()
+    return r
+
+
+async def youtube_get(path: str, params: dict) -> dict:
+    """
+    Get a YouTube Data API resource.
+    :param path: The resource path, e.g. '/search'.
+    :param params: The query parameters, without the API key.
+    :return: The decoded API response
+    """
+    r = await youtube_request(path, params)
+    raise_for_youtube_error(r)
+    return r.json()
+
+
+@timed("youtube.search")
+async def search(q: str, scope: str) -> dict:
+    """
+    Search for videos or channels, from the search cache when possible (see services.search_cache).
+    :param q: The query string.
+    :param scope: The type of search. Can be 'videos' or 'channels'.
+    :return: dict with list of videos and / or channels
+    """
+    return await get_search_cache().get(q, scope, fetch_search)
 
 
-def search(q: str, scope: str) -> dict:
+async def fetch_search(q: str, scope: str) -> dict:
     """
     Search for videos or channels on YouTube.
     :param q: The query string.
     :param scope: The type of search. Can be 'videos' or 'channels'.
     :return: dict with list of videos and / or channels
     """
-    r = requests.get(
-        f"https://www.googleapis.com/youtube/v3/search?part=snippet,id&maxResults=100&q={q}&type={scope}&key={os.getenv('YOUTUBE_API_KEY')}")
-    r.raise_for_status()
-    result = r.json()
+    result = await youtube_get("/search", {"part": "snippet,id", "maxResults": 100, "q": q, "type": scope})
     return {
         "videos": [generate_video_item(i) for i in result.get('items') if i.get('id').get('kind') == 'youtube#video'],
         "channels": [generate_channel_item(i) for i in result.get('items') if i.get('id').get('kind') == 'youtube#channel']
@@ -56,227 +192,563 @@ def generate_channel_item(item: dict) -> Channel:
         "published_at": item.get('snippet').get('publishedAt')
     })
 
-def get_comments(video_id: str, page_token: str = None) -> dict:
+def generate_comment_item(item: dict) -> dict:
     """
-    Fetch comments from a YouTube video.
+    Generate a comment dict from a YouTube commentThreads API item.
+    :param item: The commentThread item to generate the comment from.
+    :return: The generated comment with its replies.
+    """
+    # Extract nested data more efficiently
+    snippet = item.get('snippet', {})
+    top_comment = snippet.get('topLevelComment', {}).get('snippet', {})
+    author_channel = top_comment.get('authorChannelId', {})
+
+    # Build comment object
+    comment = {
+        "id": item.get('id'),
+        "text": top_comment.get('textOriginal'),
+        "author": top_comment.get('authorDisplayName'),
+        "author_id": author_channel.get('value'),
+        "likes": top_comment.get('likeCount', 0),
+        "published_at": top_comment.get('publishedAt'),
+        "replies": []
+    }
+
+    # Process replies if they exist
+    replies = item.get('replies', {}).get('comments', [])
+    if replies:
+        comment["replies"] = [
+            {
+                "id": reply.get('id'),
+                "text": reply.get('snippet', {}).get('textOriginal'),
+                "author": reply.get('snippet', {}).get('authorDisplayName'),
+                "likes": reply.get('snippet', {}).get('likeCount', 0)
+            } for reply in replies
+        ]
+
+    return comment
+
+
+async def fetch_comment_threads(video_id: str, page_token: str = None, order: str = "relevance") -> dict:
+    """
+    Fetch one raw commentThreads page.
     :param video_id: The ID of the video to fetch comments from.
-    :param page_token: The token for the next page of comments.
-    :return: dict with list of comments and next page token
+    :param page_token: The token for the page to fetch.
+    :param order: The order of the comment threads ('relevance' or 'time').
+    :return: The decoded API response
     """
-    # Build parameters dict instead of string concatenation
     params = {
-        "key": os.getenv('YOUTUBE_API_KEY'),
         "part": "snippet,id,replies",
         "videoId": video_id,
         "maxResults": 100,
-        "order": "relevance"
+        "order": order
     }
 
     # Only add pageToken if it exists
     if page_token:
         params["pageToken"] = page_token
 
+    return await youtube_get("/commentThreads", params)
+
+
+@timed("youtube.get_comments")
+async def get_comments(video_id: str, page_token: str = None, order: str = "relevance") -> dict:
+    """
+    Fetch comments from a YouTube video.
+    :param video_id: The ID of the video to fetch comments from.
+    :param page_token: The token for the next page of comments.
+    :param order: The order of the comment threads ('relevance' or 'time').
+    :return: dict with list of comments and next page token
+    """
+    result = await fetch_comment_threads(video_id, page_token=page_token, order=order)
+    return {
+        "comments": [generate_comment_item(item) for item in result.get('items', [])],
+        "nextPageToken": result.get('nextPageToken')
+    }
+
+
+async def stream_comment_results(video_id: str, order: str = "relevance",
+                                 prefetch: int = COMMENTS_PREFETCH_PAGES, page_token: str = None):
+    """
+    Stream the raw commentThreads pages of a video.
+    A background task keeps fetching the next pages (up to `prefetch` ahead) while the
+    caller is still consuming the current one. A page failing transiently is retried from its
+    own page token (see youtube_request), so the pages already fetched are never fetched again.
+    :param video_id: The ID of the video to fetch comments from.
+    :param order: The order of the comment threads ('relevance' or 'time').
+    :param prefetch: Maximum number of fetched pages waiting to be consumed.
+    :param page_token: The token of the first page to fetch (default: the first page).
+    :return: async generator of decoded API responses, one per page
+    """
+    pages = asyncio.Queue(maxsize=max(prefetch, 1))
+
+    async def fetch_pages():
+        next_page_token = page_token
+        try:
+            while True:
+                result = await fetch_comment_threads(video_id, page_token=next_page_token, order=order)
+                report("pages_fetched")
+                metrics.inc("comment_pages_fetched_total")
+                await pages.put(result)
+                next_page_token = result.get('nextPageToken')
+                if not next_page_token:
+                    break
+        except Exception as e:
+            await pages.put(e)
+            return
+        await pages.put(_DONE)
+
+    fetcher = asyncio.create_task(fetch_pages())
     try:
-        r = requests.get(
-            "https://www.googleapis.com/youtube/v3/commentThreads", params=params)
-        r.raise_for_status()
-        result = r.json()
-
-        comments = []
-        for item in result.get('items', []):
-            # Extract nested data more efficiently
-            snippet = item.get('snippet', {})
-            top_comment = snippet.get('topLevelComment', {}).get('snippet', {})
-            author_channel = top_comment.get('authorChannelId', {})
-
-            # Build comment object
-            comment = {
-                "id": item.get('id'),
-                "text": top_comment.get('textOriginal'),
-                "author": top_comment.get('authorDisplayName'),
-                "author_id": author_channel.get('value'),
-                "likes": top_comment.get('likeCount', 0),
-                "replies": []
-            }
-
-            # Process replies if they exist
-            replies = item.get('replies', {}).get('comments', [])
-            if replies:
-                comment["replies"] = [
-                    {
-                        "id": reply.get('id'),
-                        "text": reply.get('snippet', {}).get('textOriginal'),
-                        "author": reply.get('snippet', {}).get('authorDisplayName'),
-                        "likes": reply.get('snippet', {}).get('likeCount', 0)
-                    } for reply in replies
-                ]
-
-            comments.append(comment)
-
-        return {
-            "comments": comments,
-            "nextPageToken": result.get('nextPageToken')
-        }
-
-    except requests.exceptions.RequestException as e:
-        # Handle API errors more gracefully
-        error_message = f"YouTube API error: {str(e)}"
-        if hasattr(e, 'response') and e.response is not None:
-            try:
-                error_data = e.response.json()
-                if 'error' in error_data and 'message' in error_data['error']:
-                    error_message = f"YouTube API error: {error_data['error']['message']}"
-            except ValueError:
-                pass
-
-        # Re-raise as HTTPException if needed, or handle differently
-        raise HTTPException(status_code=e.response.status_code if hasattr(e, 'response') else 500,
-                            detail=error_message)
-
-
-def get_all_comments(video_id: str) -> list:
-    """
-    Fetch all comments from a YouTube video.
+        while True:
+            result = await pages.get()
+            if result is _DONE:
+                break
+            if isinstance(result, Exception):
+                raise result
+            yield result
+    finally:
+        # Stop fetching if the consumer goes away early
+        fetcher.cancel()
+
+
+async def stream_comment_pages(video_id: str, order: str = "relevance",
+                               prefetch: int = COMMENTS_PREFETCH_PAGES):
+    """
+    Stream the comments of a video page by page, see stream_comment_results.
     :param video_id: The ID of the video to fetch comments from.
-    :return: list of comments
+    :param order: The order of the comment threads ('relevance' or 'time').
+    :param prefetch: Maximum number of fetched pages waiting to be consumed.
+    :return: async generator of comment lists, one per API page
     """
-    comments = []
+    async for result in stream_comment_results(video_id, order=order, prefetch=prefetch):
+        yield [generate_comment_item(item) for item in result.get('items', [])]
+
+
+async def stage_all_comments(video_id: str, resume: bool = True, prefetch: int = COMMENTS_PREFETCH_PAGES):
+    """
+    Do a full sync of the comment store for a video, yielding the pages as they are staged.
+    The stored copy is only replaced once every page went through, and full syncs of the same video
+    run one after the other. Staged pages are kept when the sync fails, so the next one resumes from
+    the page that failed if it starts within COMMENT_SYNC_RESUME_FOR seconds.
+    The sync runs in a background task which never waits for the caller: when the caller falls more
+    than `prefetch` pages behind (e.g. a slow client of a stream), its remaining pages are read back
+    from the store once the sync is done.
+    :param video_id: The ID of the video.
+    :param resume: Whether to resume an interrupted sync, only the remaining pages are then yielded.
+    :param prefetch: Maximum number of staged pages waiting to be consumed.
+    :return: async generator of comment lists, one per API page
+    """
+    comment_store = get_comment_store()
+    # Staged pages, then the position the caller must read on from if it fell behind, then _DONE or the error
+    pages = asyncio.Queue()
+
+    async def sync():
+        lock = _full_sync_locks.get(video_id)
+        if lock is None:
+            lock = _full_sync_locks[video_id] = asyncio.Lock()
+        behind = False
+        try:
+            # Another sync would discard the pages staged by this one, or commit them before the last page
+            async with lock:
+                staged = await run_in_threadpool(comment_store.get_staged_sync, video_id) if resume else None
+                if (staged and staged.get('page_token')
+                        and time.time() - staged.get('staged_at') < COMMENT_SYNC_RESUME_FOR):
+                    page_token, position = staged.get('page_token'), staged.get('position')
+                    newest_published_at = staged.get('newest_published_at')
+                else:
+                    await run_in_threadpool(comment_store.discard_staged_comments, video_id)
+                    page_token, position, newest_published_at = None, 0, None
+
+                try:
+                    async for result in stream_comment_results(video_id, page_token=page_token):
+                        page = [generate_comment_item(item) for item in result.get('items', [])]
+                        newest_published_at = max(
+                            filter(None, [newest_published_at, *(c.get('published_at') for c in page)]), default=None)
+                        await run_in_threadpool(comment_store.stage_comments, video_id, page, position,
+                                                result.get('nextPageToken'), newest_published_at)
+                        if not behind and pages.qsize() >= max(prefetch, 1):
+                            behind = True
+                            pages.put_nowait(position)
+                        if not behind:
+                            pages.put_nowait(page)
+                        position += len(page)
+                except HTTPException as e:
+                    if page_token and e.status_code == 400:
+                        # The page token expired, start over
+                        await run_in_threadpool(comment_store.discard_staged_comments, video_id)
+                    raise
+
+                await run_in_threadpool(comment_store.commit_staged_comments, video_id, newest_published_at)
+        except Exception as e:
+            pages.put_nowait(e)
+            return
+        pages.put_nowait(_DONE)
+
+    syncing = asyncio.create_task(sync())
+    try:
+        read_from = None
+        while True:
+            result = await pages.get()
+            if result is _DONE:
+                break
+            if isinstance(result, Exception):
+                raise result
+            if isinstance(result, int):
+                read_from = result
+                continue
+            yield result
+    finally:
+        # Stop syncing if the caller goes away early, the staged pages are kept for the next sync
+        syncing.cancel()
+
+    if read_from is not None:
+        # Committed threads keep their staged positions
+        after_position = read_from - 1
+        while after_position is not None:
+            batch = await run_in_threadpool(comment_store.get_comments_batch, video_id, after_position)
+            if batch.get('comments'):
+                yield batch.get('comments')
+            after_position = batch.get('next_position')
+
+
+async def fetch_new_comments(video_id: str, newest_published_at: str = None) -> list:
+    """
+    Fetch the comments added since the last sync, newest first.
+    Walks the threads by time until reaching one already in the comment store.
+    :param video_id: The ID of the video to fetch comments from.
+    :param newest_published_at: Publication date of the newest stored thread.
+    :return: list of new comments
+    """
+    comment_store = get_comment_store()
+    new_comments = []
     page_token = None
+    # No prefetching here: the walk usually stops on the first page
     while True:
-        res = get_comments(video_id=video_id, page_token=page_token)
-        comments.extend(res.get('comments'))
+        res = await get_comments(video_id=video_id, page_token=page_token, order="time")
+        report("pages_fetched")
+        metrics.inc("comment_pages_fetched_total")
+        page = res.get('comments')
+        known_ids = await run_in_threadpool(comment_store.known_ids, video_id, [c.get('id') for c in page])
+        for comment in page:
+            # Also stop on the date in case the newest stored thread was deleted since
+            if comment.get('id') in known_ids or (
+                    newest_published_at and (comment.get('published_at') or '') < newest_published_at):
+                return new_comments
+            new_comments.append(comment)
         page_token = res.get('nextPageToken')
         if not page_token:
+            return new_comments
+
+
+@single_flight
+async def sync_comments(video_id: str):
+    """
+    Bring the comment store up to date for a video.
+    Does a full fetch the first time and when the stored copy is too old to trust its like
+    counts and replies, otherwise only fetches the threads added since the last sync.
+    :param video_id: The ID of the video to sync.
+    """
+    comment_store = get_comment_store()
+    state = await run_in_threadpool(comment_store.get_sync_state, video_id)
+    now = time.time()
+
+    if state and now - state.get('synced_at') < COMMENT_STORE_FRESH_FOR:
+        return
+
+    if not state or now - state.get('full_synced_at') > COMMENT_STORE_RESYNC_AFTER:
+        async for _ in stage_all_comments(video_id):
+            pass
+        return
+
+    new_comments = await fetch_new_comments(video_id, state.get('newest_published_at'))
+    await run_in_threadpool(comment_store.add_comments, video_id, new_comments)
+
+
+@single_flight
+@timed("youtube.get_all_comments")
+async def get_all_comments(video_id: str) -> CommentSet:
+    """
+    Get all comments from a YouTube video, syncing the comment store first.
+    :param video_id: The ID of the video to fetch comments from.
+    :return: compact, read-only set of comments
+    """
+    await sync_comments(video_id)
+    return await run_in_threadpool(get_comment_store().get_comment_set, video_id)
+
+
+async def stream_stored_comments(video_id: str, batch_size: int = 100) -> AsyncIterator[list]:
+    """
+    Add the new threads to the comment store, then stream the stored comments batch by batch.
+    :param video_id: The ID of the video
+    :param batch_size: Number of comments per batch
+    :return: async generator of comment lists
+    """
+    comment_store = get_comment_store()
+    await sync_comments(video_id)
+
+    after_position = None
+    while True:
+        batch = await run_in_threadpool(comment_store.get_comments_batch, video_id, after_position, batch_size)
+        if batch.get('comments'):
+            yield batch.get('comments')
+        after_position = batch.get('next_position')
+        if after_position is None:
             break
-    return comments
 
 
-def is_subscribed(author, channels):
+def encode_cursor(sort: str, generation: Optional[float], after: tuple) -> str:
     """
-    Check if author is subscribed to any of the channels
-    :param author: The author of the comment
-    :param channels: The list of channels to check
-    :return: True if author is subscribed to any of the channels, False otherwise
+    Encode the position of the next page of stored comments as an opaque cursor.
+    :param sort: The sort order of the pages.
+    :param generation: The sync generation of the page, positions are only valid within it.
+    :param after: The `next` value of the page.
+    :return: The cursor
     """
+    return base64.urlsafe_b64encode(json.dumps([sort, generation, *after]).encode()).decode()
+
+
+def decode_cursor(cursor: str, sort: str) -> tuple:
+    """
+    Decode a cursor made by encode_cursor.
+    :param cursor: The cursor.
+    :param sort: The sort order of the requested page, which must be the one of the cursor.
+    :return: The sync generation of the cursor and the `after` value to read the page from
+    """
+    try:
+        cursor_sort, generation, *after = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+    if cursor_sort != sort or len(after) != 2:
+        raise HTTPException(400, "Invalid cursor")
+    return generation, tuple(after)
 
-    r = requests.get(
-        f"https://www.googleapis.com/youtube/v3/subscriptions?channelId={author}&key={os.getenv('YOUTUBE_API_KEY')}&part=snippet,contentDetails&maxResults=100&forChannelId={','.join(channels)}")
+
+async def get_comments_page(video_id: str, cursor: str = None, limit: int = 50, sort: str = "relevance",
+                            raw: bool = False) -> dict:
+    """
+    Get a page of the comments of a video from the comment store.
+    The store is synced when the first page is requested, and later pages are read from the same
+    snapshot position, so their cost does not depend on the number of comments. A full resync
+    between two pages reassigns the positions, the cursor is then rejected with a 409 and the
+    pages must be read again from the first one.
+    :param video_id: The ID of the video.
+    :param cursor: The next_cursor of the previous page, None for the first page.
+    :param limit: The maximum number of comments in the page.
+    :param sort: "relevance", "likes" (most liked first) or "time" (newest first).
+    :param raw: Whether to return the comments as stored JSON fragments, spliced as they are by orjson.
+    :return: dict with the comments and the cursor of the next page (None on the last page)
+    """
+    generation, after = decode_cursor(cursor, sort) if cursor else (None, None)
+    if after is None:
+        await sync_comments(video_id)
+
+    page = await run_in_threadpool(get_comment_store().get_comments_page, video_id, sort, after, limit, not raw)
+    if after is not None and page.get('generation') != generation:
+        raise HTTPException(409, "The comments were resynced, restart from the first page")
+    return {
+        "comments": [orjson.Fragment(c) for c in page.get('comments')] if raw else page.get('comments'),
+        "next_cursor": encode_cursor(sort, page.get('generation'), page.get('next')) if page.get('next') else None,
+    }
+
+
+async def check_subscription(author, channels):
+    """
+    Ask YouTube whether author is subscribed to all of the channels
+    :param author: The channel ID of the author
+    :param channels: The list of channels to check
+    :return: SUBSCRIBED, NOT_SUBSCRIBED, PRIVATE when the author hides their subscriptions, or None if the check failed
+    """
+    r = await youtube_request("/subscriptions", {
+        "channelId": author,
+        "part": "snippet,contentDetails",
+        "maxResults": 100,
+        "forChannelId": ','.join(channels)
+    })
 
     if r.status_code == 403:
-        return False
+        # Quota errors say nothing about the author
+        if youtube_error_reasons(r) & (QUOTA_EXHAUSTED_REASONS | RATE_LIMITED_REASONS):
+            raise HTTPException(status_code=429, detail="YouTube API quota exceeded")
+        return PRIVATE
+
+    if not r.is_success:
+        return None
 
     res = r.json()
 
     if len(res.get('items', [])) == len(channels):
-        return True
+        return SUBSCRIBED
 
-    return False
+    return NOT_SUBSCRIBED
 
 
-def pick_random_comment(video_id: str, needs_subscription=False, channels=[], all_comments: list = None, processed_authors=[]) -> dict:
+@timed("youtube.is_subscribed")
+async def is_subscribed(author, channels):
     """
-    Pick a random comment from a video
-    :param video_id: The ID of the video to pick a comment from.
-    :param needs_subscription: Whether the comment should be from a subscribed channel
+    Check if author is subscribed to any of the channels
+    Results are cached, see services.subscription_cache.
+    :param author: The author of the comment
     :param channels: The list of channels to check
-    :param all_comments: The list of all comments for the video
-    :param processed_authors: The list of authors already processed
-    :return: dict with comment
+    :return: True if author is subscribed to any of the channels, False otherwise
     """
+    subscription_cache = get_subscription_cache()
+    status = await run_in_threadpool(subscription_cache.get, author, channels)
 
-    if not all_comments:
-        all_comments = get_all_comments(video_id=video_id)
-
-    comment = random.choice(all_comments)
+    if status is None:
+        status = await check_subscription(author, channels)
+        # Failed checks are not cached
+        if status is not None:
+            await run_in_threadpool(subscription_cache.set, author, channels, status)
 
-    if needs_subscription and not is_subscribed(comment.get('author_id'), channels):
-        processed_authors.append(comment.get('author_id'))
-        available_comments = [c for c in all_comments if c.get(
-            'author_id') not in processed_authors]
+    return status == SUBSCRIBED
 
-        if available_comments == []:
-            raise HTTPException(404, "No comment found meeting requirements")
 
-        return pick_random_comment(video_id, needs_subscription, channels, available_comments, processed_authors)
-
-    return comment
+def likes_weight(comment: dict) -> int:
+    """
+    Weight of a comment in a draw by likes: its likes, plus one so every comment has a chance.
+    """
+    return (comment.get('likes') or 0) + 1
 
 
-def summarize_comments(video_id: str, max_comments: int = 500, regenerate: bool = False) -> dict:
+async def pick_random_comment(video_id: str, needs_subscription=False, channels=[],
+                              parallelism: int = DRAW_PARALLELISM, weight: str = None, seed: str = None) -> dict:
+    """
+    Pick a random comment from a video
+    Without a subscription requirement, the stored comments are streamed batch by batch and only
+    the comment drawn so far is kept, see services.draw.
+    :param video_id: The ID of the video to pick a comment from.
+    :param needs_subscription: Whether the comment should be from a subscribed channel
+    :param channels: The list of channels to check
+    :param parallelism: Maximum number of subscription checks in flight
+    :param weight: Chance of each comment: None (the same for every comment), 'likes' (proportional
+        to its likes + 1) or 'author' (the same for every author). Draws requiring a subscription
+        always give every author the same chance.
+    :param seed: Seed of a reproducible draw, which then comes with an audit record: the seed and
+        the position of the winner (batch and offset, or index) in the stored comments
+    :return: dict with comment, and audit for a seeded draw
+    """
+    rng = random.Random(seed) if seed is not None else None
+
+    if needs_subscription:
+        if weight == 'likes':
+            raise HTTPException(400, "Draws by likes cannot require a subscription")
+        all_comments = await get_all_comments(video_id=video_id)
+        index = await draw_eligible_comment(
+            all_comments.group_by_author(), lambda author: is_subscribed(author, channels), parallelism=parallelism,
+            rng=rng)
+        drawn = {"comment": all_comments[index], "index": index} if index is not None else None
+    elif weight == 'author':
+        drawn = await draw_streamed_comment(stream_stored_comments(video_id), rng=rng)
+    else:
+        drawn = await draw_weighted_comment(stream_stored_comments(video_id),
+                                            weight=likes_weight if weight == 'likes' else None, rng=rng)
+
+    if drawn is None:
+        raise HTTPException(404, "No comment found meeting requirements")
+
+    result = {"comment": drawn.pop("comment")}
+    if seed is not None:
+        result["audit"] = {"seed": seed, "weight": weight, "needs_subscription": needs_subscription, **drawn}
+    return result
+
+
+@single_flight
+async def summarize_comments(video_id: str, max_comments: int = None, regenerate: bool = False) -> dict:
     """
     Use Gemini to summarize comments
+    Large comment sets are summarized chunk by chunk, see services.gemini.summarize.
+    Pages fetched and chunks summarized are reported to the tracked progress (see services.progress).
+    A stored summary is reused when the comments it was made from (IDs and like counts), the prompts
+    and the model did not change, and kept when only their like counts changed. When the comments it
+    was made from are unchanged otherwise (none deleted or edited, no new replies) and only a few
+    comments were added since, just those are summarized and merged into the stored summary.
     :param video_id: The ID of the video to summarize comments from
-    :param max_comments: Maximum number of comments to process (default: 500)
+    :param max_comments: Maximum number of comments to process, the most liked ones first (default: all)
+    :param regenerate: Whether to summarize the current comments instead of returning the stored summary as is
     :return: dict with summary
     """
-    firestore_service = FirestoreService()
-    
-    if not regenerate:
-        summary = firestore_service.get_document("videos", video_id)
-        if summary:
-            return summary.get('summary')
-    
-    all_comments = get_all_comments(video_id=video_id)
-
-    # Limit the number of comments to prevent processing too much data
-    if len(all_comments) > max_comments:
-        # Sort by likes to prioritize more relevant comments
-        all_comments = sorted(all_comments, key=lambda c: c.get(
-            'likes', 0), reverse=True)[:max_comments]
-
-    # Transform comments into a more efficient structure without JSON conversion
-    formatted_comments = []
-    for c in all_comments:
-        comment = {
-            "author": c.get('author'),
-            "text": c.get('text'),
-            "likes": c.get('likes'),
-            "replies": []
-        }
-
-        # Only process replies if they exist
-        if c.get('replies'):
-            comment["replies"] = [
-                {
-                    "author": r.get('author'),
-                    "text": r.get('text'),
-                    "likes": r.get('likes'),
-                } for r in c.get('replies')
-            ]
-
-        formatted_comments.append(comment)
-
-    # Pass the structured data directly instead of JSON strings
-    summary = summarize([json.dumps(c) for c in formatted_comments])
-    
-    firestore_service.update_document("videos", video_id, {"summary": summary})
+    # Resolved here rather than passed in, so every caller of a video shares one call (see single_flight)
+    firestore_service = get_firestore_service()
+
+    document = await run_in_threadpool(firestore_service.get_document, "videos", video_id) or {}
+    stored_summary = document.get('summary')
+    if stored_summary and not regenerate:
+        return stored_summary
+
+    # Sort by likes so the most relevant comments are summarized together and kept by max_comments
+    all_comments = await get_all_comments(video_id=video_id)
+    by_likes = all_comments.order_by_likes()
+    if max_comments:
+        by_likes = by_likes[:max_comments]
+
+    fingerprint = f"{SUMMARY_VERSION}:{all_comments.fingerprint(by_likes)}"
+    if stored_summary and document.get('summary_fingerprint') == fingerprint:
+        return stored_summary
+
+    # The stored summary is only extended when the threads it was made from are all still there,
+    # unedited and without new replies, so it does not keep describing comments which are gone
+    summarized_through = document.get('summary_newest_published_at')
+    summarized_count = document.get('summary_comment_count') or 0
+    delta = None
+    if (stored_summary and not max_comments and summarized_through
+            and document.get('summary_fingerprint', '').startswith(f"{SUMMARY_VERSION}:")):
+        published_at = all_comments.published_at
+        summarized, delta = [], []
+        for i in by_likes:
+            (delta if (published_at[i] or '') > summarized_through else summarized).append(i)
+        if all_comments.content_fingerprint(summarized) != document.get('summary_content_fingerprint'):
+            delta = None
+
+    if delta == []:
+        # Only like counts changed, the comments say the same
+        summary = stored_summary
+    elif delta and len(delta) <= summarized_count * SUMMARY_DELTA_MAX_RATIO:
+        summary = await run_in_threadpool(extend_summary, stored_summary, list(all_comments.iter_summary_json(delta)),
+                                          progress=current_progress())
+    else:
+        summary = await run_in_threadpool(summarize, list(all_comments.iter_summary_json(by_likes)),
+                                          progress=current_progress())
+
+    await run_in_threadpool(firestore_service.update_document, "videos", video_id, {
+        "summary": summary,
+        "summary_fingerprint": fingerprint,
+        "summary_content_fingerprint": all_comments.content_fingerprint(by_likes),
+        "summary_newest_published_at": max((all_comments.published_at[i] or '' for i in by_likes), default=''),
+        "summary_comment_count": len(by_likes),
+    })
     return summary
 
 
-def get_video(video_id: str):
+@single_flight
+async def get_video(video_id: str):
     """
     Get video
     :param video_id: The ID of the video
     :return: dict with video details
     """
-    r = requests.get(
-        f"https://www.googleapis.com/youtube/v3/videos?part=snippet,contentDetails,statistics&id={video_id}&key={os.getenv('YOUTUBE_API_KEY')}"
-    )
-    r.raise_for_status()
-    result = r.json()
-    return result.get('items', [{}])[0]
+    result = await youtube_get("/videos", {"part": "snippet,contentDetails,statistics", "id": video_id})
+    if not result.get('items'):
+        raise HTTPException(404, "Video not found")
+    return result.get('items')[0]
 
 
-def get_video_details(video_id: str):
+async def get_video_details(video_id: str, firestore_service: FirestoreService = None, include_comments: bool = True):
     """
     Get video details, comments, and summary if exists
     :param video_id: The ID of the video
+    :param firestore_service: The Firestore service to use (default: the shared one)
+    :param include_comments: Whether to include every comment, use get_comments_page to page through them instead
     :return: dict with video details, comments, and summary if exists
     """
-    firestore_service = FirestoreService()
-    document = firestore_service.get_document("videos", video_id)
+    firestore_service = firestore_service or get_firestore_service()
+    video, document, *comments = await asyncio.gather(
+        get_video(video_id),
+        run_in_threadpool(firestore_service.get_document, "videos", video_id),
+        *([get_all_comments(video_id)] if include_comments else []),
+    )
     return {
-        "comments": get_all_comments(video_id),
-        "video": generate_video_item(get_video(video_id)),
+        "comments": comments[0].to_list() if comments else None,
+        "video": generate_video_item(video),
         "summary": document.get("summary") if document else None
-    }
\ No newline at end of file
+    }
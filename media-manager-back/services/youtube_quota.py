@@ -0,0 +1,386 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Union
+from zoneinfo import ZoneInfo
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from config import (SHARED_CACHE_BACKEND, YOUTUBE_DAILY_QUOTA, YOUTUBE_QUOTA_SHARE_BACKGROUND, YOUTUBE_QUOTA_SHARE_BULK,
+                    YOUTUBE_QUOTA_SYNC_EVERY, YOUTUBE_RATE_BURST, YOUTUBE_RATE_DEFAULT, YOUTUBE_RATE_SEARCH)
+from services.clients import get_firestore_service
+from services.firestore import DocumentStore
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "youtube_quota"
+
+# Priority classes, the first ones are served first and may use more of the daily budget
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+BULK = "bulk"
+RANKS = {INTERACTIVE: 0, BACKGROUND: 1, BULK: 2}
+
+# Quota units of each endpoint (https://developers.google.com/youtube/v3/determine_quota_cost)
+COSTS = {"/search": 100, "/videos": 1, "/commentThreads": 1, "/subscriptions": 1}
+
+# Priority of each endpoint when the caller does not lower it
+DEFAULT_PRIORITIES = {"/search": INTERACTIVE, "/videos": INTERACTIVE, "/commentThreads": INTERACTIVE,
+                      "/subscriptions": BULK}
+
+# YouTube quotas reset at midnight Pacific time
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+
+class SharedPriority:
+    """
+    Priority of the YouTube calls of an operation shared by several callers (see services.single_flight):
+    the highest of theirs, so an interactive caller joining a summary job's operation is not served as
+    a background one.
+    """
+
+    def __init__(self):
+        """
+        Initialize the priority, without callers yet.
+        """
+        self._callers: List[Union[str, "SharedPriority", None]] = []
+
+    def join(self, priority: Union[str, "SharedPriority", None]):
+        """
+        Add a caller, with the priority set in its context (None when it did not lower it).
+        """
+        self._callers.append(priority)
+
+    def get(self) -> Optional[str]:
+        """
+        Get the priority the calls are lowered to, None when a caller did not lower it.
+        """
+        lowered = [caller.get() if isinstance(caller, SharedPriority) else caller for caller in self._callers]
+        if not lowered or None in lowered:
+            return None
+        return min(lowered, key=RANKS.get)
+
+
+# Priority set by the caller for the calls made in the current context (e.g. by a summary job)
+_priority: ContextVar[Union[str, SharedPriority, None]] = ContextVar("youtube_priority", default=None)
+
+
+def current_quota_priority() -> Union[str, SharedPriority, None]:
+    """
+    Get the priority set in the current context, None when it was not lowered.
+    """
+    return _priority.get()
+
+
+@contextmanager
+def quota_priority(priority: Union[str, SharedPriority]) -> Iterator[None]:
+    """
+    Lower the priority of the YouTube calls made in this block (and the tasks it starts).
+    A call never gets a higher priority than the default of its endpoint.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter where waiting callers are served by priority, then in arrival order.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        """
+        Initialize a full bucket.
+
+        Args:
+            rate: Number of tokens added per second
+            burst: Maximum number of tokens
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.waited = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _dispatch(self):
+        self._timer = None
+        self._refill()
+        while self._waiters and self.tokens >= 1:
+            _, _, waiter = heapq.heappop(self._waiters)
+            # Skip callers which gave up waiting
+            if waiter.done():
+                continue
+            self.tokens -= 1
+            waiter.set_result(None)
+        if self._waiters:
+            self._timer = asyncio.get_running_loop().call_later((1 - self.tokens) / self.rate, self._dispatch)
+
+    async def acquire(self, priority: str = INTERACTIVE):
+        """
+        Take a token, waiting for one if the bucket is empty.
+
+        Args:
+            priority: Priority class of the caller
+        """
+        self._refill()
+        if not self._waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+
+        self.waited += 1
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (RANKS[priority], next(self._sequence), waiter))
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later((1 - self.tokens) / self.rate, self._dispatch)
+        await waiter
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the bucket counters.
+
+        Returns:
+            Dictionary with rate, tokens, waiting and waited calls
+        """
+        return {
+            "rate": self.rate,
+            "tokens": self.tokens,
+            "waiting": sum(1 for _, _, waiter in self._waiters if not waiter.done()),
+            "waited": self.waited,
+        }
+
+
+class QuotaBudget:
+    """
+    Daily quota budget shared by every instance.
+
+    Units are counted locally and added to a counter in the shared store every sync_every
+    seconds, which also brings back the units spent by the other instances. Without a store,
+    the budget only counts the units of this process.
+    """
+
+    def __init__(self, store: Optional[DocumentStore] = None, daily_limit: int = YOUTUBE_DAILY_QUOTA,
+                 sync_every: float = YOUTUBE_QUOTA_SYNC_EVERY, shares: Dict[str, float] = None):
+        """
+        Initialize the budget.
+
+        Args:
+            store: Shared document store, or None to count units in process only
+            daily_limit: Number of units per day
+            sync_every: Number of seconds between two syncs with the store
+            shares: Share of the daily limit each priority class may use (default: from the config)
+        """
+        self.store = store
+        self.daily_limit = daily_limit
+        self.sync_every = sync_every
+        self.shares = shares or {INTERACTIVE: 1.0, BACKGROUND: YOUTUBE_QUOTA_SHARE_BACKGROUND, BULK: YOUTUBE_QUOTA_SHARE_BULK}
+        self.day = self._today()
+        # Units known to be spent by every instance, and units spent here since the last sync
+        self.used = 0
+        self.pending = 0
+        self.exhausted = False
+        self.spent = Counter()
+        self.rejected = Counter()
+        self._synced_at = 0.0
+        self._syncing = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+    def _roll(self):
+        today = self._today()
+        if today != self.day:
+            self.day = today
+            self.used = 0
+            self.pending = 0
+            self.exhausted = False
+
+    def spend(self, cost: int, priority: str) -> bool:
+        """
+        Spend units if the priority class still has enough of the daily budget.
+
+        Args:
+            cost: Number of units of the call
+            priority: Priority class of the call
+
+        Returns:
+            True if the units were spent, False if the call must not be made
+        """
+        with self._lock:
+            self._roll()
+            if self.exhausted or self.used + self.pending + cost > self.daily_limit * self.shares[priority]:
+                self.rejected[priority] += 1
+                return False
+            self.pending += cost
+            self.spent[priority] += cost
+            return True
+
+    def mark_exhausted(self):
+        """
+        Record that YouTube refused a call for lack of quota, so no call is made until the quota resets.
+        """
+        with self._lock:
+            self._roll()
+            self.exhausted = True
+
+    def start_sync(self) -> bool:
+        """
+        Check whether a sync is due, and if so mark it as started.
+
+        Returns:
+            True if the caller must run sync
+        """
+        with self._lock:
+            if self._syncing or time.monotonic() - self._synced_at < self.sync_every:
+                return False
+            self._syncing = True
+            return True
+
+    def sync(self):
+        """
+        Add the units spent since the last sync to the shared counter and read it back (blocking).
+        """
+        with self._lock:
+            day, amount = self.day, self.pending
+            self.pending = 0
+        try:
+            if self.store is None:
+                total = None
+            else:
+                total = self.store.increment(COLLECTION, day, "used", amount)
+        except Exception as e:
+            # The units are added on the next sync, meanwhile the budget is counted locally
+            logger.warning("YouTube quota sync failed: %s", e)
+            with self._lock:
+                self.pending += amount if day == self.day else 0
+            total = None
+            amount = 0
+        finally:
+            with self._lock:
+                self._syncing = False
+                self._synced_at = time.monotonic()
+
+        with self._lock:
+            if day == self.day:
+                self.used = total if total is not None else self.used + amount
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the budget counters.
+
+        Returns:
+            Dictionary with the day, limit, used and remaining units, units spent and calls rejected by priority
+        """
+        with self._lock:
+            self._roll()
+            used = self.used + self.pending
+            return {
+                "day": self.day,
+                "limit": self.daily_limit,
+                "used": used,
+                "remaining": 0 if self.exhausted else max(self.daily_limit - used, 0),
+                "exhausted": self.exhausted,
+                "spent": dict(self.spent),
+                "rejected": dict(self.rejected),
+            }
+
+
+class YouTubeQuota:
+    """
+    Admission control of the YouTube Data API calls: a rate limiter per endpoint and the daily budget.
+
+    Calls wait for their endpoint's rate instead of hitting YouTube in bursts, interactive calls
+    (searches, video pages) first. Calls the budget of their priority class cannot afford are
+    refused before reaching YouTube, so bulk work never spends the quota kept for users.
+    """
+
+    def __init__(self, budget: QuotaBudget, rates: Dict[str, float] = None, default_rate: float = YOUTUBE_RATE_DEFAULT,
+                 burst: float = YOUTUBE_RATE_BURST):
+        """
+        Initialize the quota.
+
+        Args:
+            budget: The daily budget
+            rates: Requests per second of each endpoint (default: from the config)
+            default_rate: Requests per second of the other endpoints
+            burst: Number of seconds worth of requests let through at once
+        """
+        self.budget = budget
+        self.rates = rates if rates is not None else {"/search": YOUTUBE_RATE_SEARCH}
+        self.default_rate = default_rate
+        self.burst = burst
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def _bucket(self, path: str) -> TokenBucket:
+        bucket = self._buckets.get(path)
+        if bucket is None:
+            rate = self.rates.get(path, self.default_rate)
+            bucket = self._buckets[path] = TokenBucket(rate, rate * self.burst)
+        return bucket
+
+    def priority(self, path: str) -> str:
+        """
+        Get the priority class of a call: the default of its endpoint, lowered by quota_priority.
+        """
+        default = DEFAULT_PRIORITIES.get(path, INTERACTIVE)
+        lowered = _priority.get()
+        if isinstance(lowered, SharedPriority):
+            lowered = lowered.get()
+        return lowered if lowered is not None and RANKS[lowered] > RANKS[default] else default
+
+    async def acquire(self, path: str):
+        """
+        Wait until a call to an endpoint may be sent, and spend its units.
+
+        Args:
+            path: The resource path, e.g. '/search'
+
+        Raises:
+            HTTPException: 429 if the daily budget of the call's priority class is spent
+        """
+        priority = self.priority(path)
+        await self._bucket(path).acquire(priority)
+        if not self.budget.spend(COSTS.get(path, 1), priority):
+            raise HTTPException(status_code=429, detail="YouTube API quota exceeded")
+        if self.budget.start_sync():
+            asyncio.ensure_future(run_in_threadpool(self.budget.sync))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the budget and rate limiter counters.
+
+        Returns:
+            Dictionary with the budget counters and the counters of each endpoint's rate limiter
+        """
+        return {
+            "budget": self.budget.stats(),
+            "endpoints": {path: bucket.stats() for path, bucket in self._buckets.items()},
+        }
+
+
+@lru_cache(maxsize=None)
+def get_youtube_quota() -> YouTubeQuota:
+    """
+    Get the process-wide YouTube quota.
+    """
+    return YouTubeQuota(QuotaBudget(store=get_firestore_service() if SHARED_CACHE_BACKEND == "firestore" else None))
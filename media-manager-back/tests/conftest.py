@@ -0,0 +1,13 @@
+import os
+
+# Keep the shared caches in process, so no test needs a Firestore database
+os.environ.setdefault("SHARED_CACHE_BACKEND", "memory")
+
+import pytest
+
+from services.comment_store import CommentStore
+
+
+@pytest.fixture
+def comment_store(tmp_path):
+    return CommentStore(str(tmp_path / "comments.db"))
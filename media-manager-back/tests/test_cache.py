@@ -0,0 +1,57 @@
+import pytest
+
+from services import cache
+from services.cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_get_and_set():
+    c = TTLCache()
+    c.set("a", 1, 60)
+
+    assert c.get("a") == 1
+    assert c.get("b", "default") == "default"
+    assert c.stats() == {"size": 1, "hits": 1, "misses": 1, "hit_ratio": 0.5}
+
+
+def test_entries_expire_after_their_ttl(clock):
+    c = TTLCache()
+    c.set("short", 1, 10)
+    c.set("long", 2, 100)
+
+    clock[0] += 10
+    assert c.get("short") is None
+    assert "short" not in c
+    assert c.get("long") == 2
+    assert len(c) == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    c = TTLCache(maxsize=2)
+    c.set("a", 1, 60)
+    c.set("b", 2, 60)
+    c.get("a")
+    c.set("c", 3, 60)
+
+    assert "b" not in c
+    assert c.get("a") == 1
+    assert c.get("c") == 3
+
+
+def test_delete_and_clear():
+    c = TTLCache()
+    c.set("a", 1, 60)
+    c.set("b", 2, 60)
+
+    c.delete("a")
+    c.delete("missing")
+    assert "a" not in c and "b" in c
+
+    c.clear()
+    assert len(c) == 0
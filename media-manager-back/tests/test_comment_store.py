@@ -0,0 +1,94 @@
+def comment(i, **fields):
+    return {"id": f"c{i}", "text": f"Comment {i}", "likes": i % 3,
+            "published_at": f"2025-01-01T00:00:{i:02d}Z", **fields}
+
+
+def full_sync(store, comments, video_id="v"):
+    store.stage_comments(video_id, comments, 0)
+    store.commit_staged_comments(video_id, store._newest_published_at(comments))
+
+
+def ids(comments):
+    return [c["id"] for c in comments]
+
+
+def read_all(store, sort, limit):
+    comments, after = [], None
+    while True:
+        page = store.get_comments_page("v", sort, after, limit)
+        comments += page["comments"]
+        after = page["next"]
+        if after is None:
+            return comments
+
+
+def test_staged_comments_are_invisible_until_committed(comment_store):
+    full_sync(comment_store, [comment(0)])
+    comment_store.stage_comments("v", [comment(1), comment(2)], 0, next_page_token="token")
+
+    assert ids(comment_store.get_comment_set("v")) == ["c0"]
+    assert comment_store.get_staged_sync("v")["page_token"] == "token"
+    assert comment_store.get_staged_sync("v")["position"] == 2
+
+    comment_store.commit_staged_comments("v", None)
+    assert ids(comment_store.get_comment_set("v")) == ["c1", "c2"]
+    assert comment_store.get_staged_sync("v") is None
+
+
+def test_discard_staged_comments(comment_store):
+    full_sync(comment_store, [comment(0)])
+    comment_store.stage_comments("v", [comment(1)], 0)
+    comment_store.discard_staged_comments("v")
+
+    assert comment_store.get_staged_sync("v") is None
+    comment_store.commit_staged_comments("v", None)
+    assert ids(comment_store.get_comment_set("v")) == []
+
+
+def test_add_comments_goes_in_front(comment_store):
+    full_sync(comment_store, [comment(0), comment(1)])
+    comment_store.add_comments("v", [comment(9), comment(8)])
+
+    assert ids(comment_store.get_comment_set("v")) == ["c9", "c8", "c0", "c1"]
+    assert comment_store.get_sync_state("v")["newest_published_at"] == "2025-01-01T00:00:09Z"
+    assert comment_store.known_ids("v", ["c8", "c5"]) == {"c8"}
+
+
+def test_get_comments_batch(comment_store):
+    full_sync(comment_store, [comment(i) for i in range(5)])
+
+    first = comment_store.get_comments_batch("v", limit=3)
+    rest = comment_store.get_comments_batch("v", first["next_position"], limit=3)
+    assert ids(first["comments"]) == ["c0", "c1", "c2"]
+    assert ids(rest["comments"]) == ["c3", "c4"]
+    assert rest["next_position"] is None
+
+
+def test_pages_cover_every_comment_once_in_order(comment_store):
+    comments = [comment(i) for i in range(10)]
+    full_sync(comment_store, comments)
+
+    assert ids(read_all(comment_store, "relevance", 3)) == ids(comments)
+    # Ties on likes are broken by position
+    assert ids(read_all(comment_store, "likes", 3)) == ids(sorted(comments, key=lambda c: -c["likes"]))
+    assert ids(read_all(comment_store, "time", 4)) == ids(reversed(comments))
+
+
+def test_page_generation_changes_with_full_sync(comment_store):
+    assert comment_store.get_comments_page("v")["generation"] is None
+
+    full_sync(comment_store, [comment(0)])
+    generation = comment_store.get_comments_page("v")["generation"]
+    comment_store.add_comments("v", [comment(1)])
+    assert comment_store.get_comments_page("v")["generation"] == generation
+
+    full_sync(comment_store, [comment(0)])
+    assert comment_store.get_comments_page("v")["generation"] != generation
+
+
+def test_raw_pages_are_the_stored_json(comment_store):
+    full_sync(comment_store, [comment(0)])
+
+    page = comment_store.get_comments_page("v", decode=False)
+    assert isinstance(page["comments"][0], str)
+    assert '"id": "c0"' in page["comments"][0]
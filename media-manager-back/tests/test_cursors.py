@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import services.youtube as youtube
+from services.youtube import decode_cursor, encode_cursor
+
+
+@pytest.fixture
+def store(comment_store, monkeypatch):
+    async def no_sync(video_id):
+        pass
+
+    monkeypatch.setattr(youtube, "get_comment_store", lambda: comment_store)
+    monkeypatch.setattr(youtube, "sync_comments", no_sync)
+    return comment_store
+
+
+def full_sync(store, count):
+    store.stage_comments("v", [{"id": f"c{i}", "likes": i % 2} for i in range(count)], 0)
+    store.commit_staged_comments("v", None)
+
+
+def read_all(sort, limit):
+    async def read():
+        page = await youtube.get_comments_page("v", limit=limit, sort=sort)
+        comments = page["comments"]
+        while page["next_cursor"]:
+            page = await youtube.get_comments_page("v", page["next_cursor"], limit, sort)
+            comments += page["comments"]
+        return [c["id"] for c in comments]
+
+    return asyncio.run(read())
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("likes", 12.5, (3, 7))
+    assert decode_cursor(cursor, "likes") == (12.5, (3, 7))
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor("likes", 1.0, (3, 7)), "WzFd"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor, "time")
+    assert e.value.status_code == 400
+
+
+@pytest.mark.parametrize("sort", ["relevance", "likes", "time"])
+def test_pages_follow_the_cursor(store, sort):
+    full_sync(store, 10)
+    assert sorted(read_all(sort, 3)) == sorted(f"c{i}" for i in range(10))
+
+
+def test_cursor_from_before_a_full_resync_is_rejected(store):
+    full_sync(store, 10)
+    page = asyncio.run(youtube.get_comments_page("v", limit=4))
+    full_sync(store, 12)
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(youtube.get_comments_page("v", page["next_cursor"], 4))
+    assert e.value.status_code == 409
+
+
+def test_cursor_survives_an_incremental_sync(store):
+    full_sync(store, 10)
+    page = asyncio.run(youtube.get_comments_page("v", limit=4))
+    store.add_comments("v", [{"id": "new"}])
+
+    page = asyncio.run(youtube.get_comments_page("v", page["next_cursor"], 4))
+    assert [c["id"] for c in page["comments"]] == ["c4", "c5", "c6", "c7"]
@@ -0,0 +1,73 @@
+import pytest
+from fastapi import HTTPException
+
+from services import resilience
+from services.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def fail(breaker, times):
+    for _ in range(times):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("Upstream", failure_threshold=3, reset_timeout=30)
+    fail(breaker, 2)
+    breaker.before_call()
+    breaker.record_success()
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+    with pytest.raises(HTTPException) as e:
+        breaker.before_call()
+    assert e.value.status_code == 503
+    assert breaker.stats() == {"state": OPEN, "failures": 3, "times_opened": 1, "rejected": 1}
+
+
+def test_single_probe_after_reset_timeout(clock):
+    breaker = CircuitBreaker("Upstream", failure_threshold=1, reset_timeout=30)
+    fail(breaker, 1)
+
+    clock[0] += 30
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time
+    with pytest.raises(HTTPException):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_opens_again(clock):
+    breaker = CircuitBreaker("Upstream", failure_threshold=1, reset_timeout=30)
+    fail(breaker, 1)
+
+    clock[0] += 30
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+    assert breaker.times_opened == 2
+    with pytest.raises(HTTPException):
+        breaker.before_call()
+
+
+def test_released_probe_lets_another_one_through(clock):
+    breaker = CircuitBreaker("Upstream", failure_threshold=1, reset_timeout=30)
+    fail(breaker, 1)
+
+    clock[0] += 30
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from services.progress import Progress, current_progress, tracking
+from services.single_flight import SingleFlight, single_flight
+
+
+def test_concurrent_calls_share_one_operation():
+    group = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"result": len(calls)}
+
+    async def main():
+        return await asyncio.gather(*(group.do("fetch", "key", fetch) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert group.stats() == {"fetch": {"calls": 5, "deduplicated": 4, "in_flight": 0}}
+
+
+def test_different_keys_do_not_share():
+    group = SingleFlight()
+
+    async def main():
+        return await asyncio.gather(group.do("fetch", "a", lambda: asyncio.sleep(0, "a")),
+                                    group.do("fetch", "b", lambda: asyncio.sleep(0, "b")))
+
+    assert asyncio.run(main()) == ["a", "b"]
+
+
+def test_failure_is_shared_then_the_next_call_starts_over():
+    group = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise ValueError("upstream failed")
+        return "ok"
+
+    async def main():
+        results = await asyncio.gather(*(group.do("fetch", "key", fetch) for _ in range(3)),
+                                       return_exceptions=True)
+        return results, await group.do("fetch", "key", fetch)
+
+    results, retried = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert retried == "ok"
+    assert len(calls) == 2
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    group = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def main():
+        first = asyncio.ensure_future(group.do("fetch", "key", fetch))
+        second = asyncio.ensure_future(group.do("fetch", "key", fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "ok"
+
+
+def test_progress_is_reported_to_every_caller():
+    group = SingleFlight()
+
+    async def fetch():
+        current_progress().add("pages")
+        await asyncio.sleep(0.01)
+        current_progress().add("pages")
+
+    async def call(progress):
+        with tracking(progress):
+            await group.do("fetch", "key", fetch)
+
+    first, second = Progress(), Progress()
+
+    async def main():
+        await asyncio.gather(call(first), call(second))
+
+    asyncio.run(main())
+    assert first.snapshot() == second.snapshot() == {"pages": 2}
+
+
+def test_decorator_keys_on_the_bound_arguments():
+    calls = []
+
+    @single_flight
+    async def fetch(video_id, limit=10):
+        calls.append((video_id, limit))
+        await asyncio.sleep(0.01)
+        return video_id
+
+    async def main():
+        return await asyncio.gather(fetch("v"), fetch("v", 10), fetch(video_id="v", limit=10), fetch("w"))
+
+    assert asyncio.run(main()) == ["v", "v", "v", "w"]
+    assert calls == [("v", 10), ("w", 10)]
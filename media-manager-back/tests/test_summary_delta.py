@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+import services.gemini as gemini
+import services.youtube as youtube
+from services.comment_set import CommentSet
+from services.firestore import InMemoryFirestoreService
+
+
+def comment(i, **fields):
+    return {"id": f"c{i}", "text": f"Comment {i}", "author": "@author", "author_id": "UC", "likes": i,
+            "published_at": f"2025-01-01T00:00:{i:02d}Z", "replies": [], **fields}
+
+
+NEW = {"id": "new", "text": "New comment", "author": "@other", "author_id": "UO", "likes": 0,
+       "published_at": "2099-01-01T00:00:00Z", "replies": []}
+
+
+@pytest.fixture
+def video(monkeypatch):
+    """
+    Summarizes video "v" with the current comments of the returned state, recording the model calls.
+    """
+    state = {"comments": [], "calls": []}
+    store = InMemoryFirestoreService()
+
+    def generate(text, prompt):
+        state["calls"].append("merge" if prompt == gemini.MERGE_SUMMARIES_PROMPT else "summarize")
+        return f"summary {len(state['calls'])}"
+
+    async def get_all_comments(video_id):
+        return CommentSet.from_comments(state["comments"])
+
+    monkeypatch.setattr(gemini, "generate", generate)
+    monkeypatch.setattr(youtube, "get_firestore_service", lambda: store)
+    monkeypatch.setattr(youtube, "get_all_comments", get_all_comments)
+
+    def summarize(comments):
+        state["comments"] = comments
+        state["calls"] = []
+        return asyncio.run(youtube.summarize_comments("v", regenerate=True)), state["calls"]
+
+    return summarize
+
+
+BASE = [comment(i) for i in range(50)]
+
+
+def test_unchanged_comments_reuse_the_summary(video):
+    summary, _ = video(BASE)
+    assert video(BASE) == (summary, [])
+
+
+def test_like_changes_keep_the_summary(video):
+    summary, _ = video(BASE)
+    assert video([{**c, "likes": c["likes"] + 1} for c in BASE]) == (summary, [])
+
+
+def test_new_comments_are_merged_into_the_summary(video):
+    video(BASE)
+    _, calls = video(BASE + [NEW])
+    assert calls == ["summarize", "merge"]
+
+
+def test_edited_comment_summarizes_everything_again(video):
+    video(BASE)
+    edited = [{**c, "text": "Edited"} if c["id"] == "c3" else c for c in BASE]
+    _, calls = video(edited + [NEW])
+    assert calls == ["summarize"]
+
+
+def test_deleted_comment_summarizes_everything_again(video):
+    video(BASE)
+    _, calls = video(BASE[1:] + [NEW])
+    assert calls == ["summarize"]
+
+
+def test_too_many_new_comments_summarize_everything_again(video):
+    video(BASE)
+    new = [{**NEW, "id": f"new{i}"} for i in range(20)]
+    _, calls = video(BASE + new)
+    assert calls == ["summarize"]
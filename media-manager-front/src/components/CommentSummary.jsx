@@ -1,4 +1,4 @@
-import { selectVideo, selectSummary, updateCommentSummary } from "../store/features/video";
+import { selectVideo, selectSummary, selectSummaryJob, updateCommentSummary } from "../store/features/video";
 import { useState, useEffect } from "react";
 import { useSelector, useDispatch } from "react-redux";
 import ReactMarkdown from 'react-markdown';
@@ -7,6 +7,7 @@ import { decodeUnicodeEscapes } from "../utils";
 export default function CommentSummary() {
     const videoData = useSelector(selectVideo);
     const summary = useSelector(selectSummary);
+    const summaryJob = useSelector(selectSummaryJob);
     const [opened, setOpened] = useState(false);
     const [isLoading, setIsLoading] = useState(false);
     const dispatch = useDispatch();
@@ -32,6 +33,18 @@ export default function CommentSummary() {
         }
     };
     
+    // Describe where the summary job stands while it runs
+    const progressLabel = () => {
+        if (!summaryJob || summaryJob.status === 'queued') {
+            return 'Waiting for a summary slot...';
+        }
+        const { pages_fetched = 0, chunks, chunks_summarized = 0 } = summaryJob.progress || {};
+        if (chunks) {
+            return `Summarizing comments (${chunks_summarized}/${chunks} chunks)...`;
+        }
+        return `Fetching comments (${pages_fetched} pages)...`;
+    };
+
     // Common button styles
     const buttonClasses = "px-4 py-3 bg-blue-900 hover:bg-blue-800 text-white font-semibold transition-colors focus:outline-none";
     
@@ -50,7 +63,7 @@ export default function CommentSummary() {
                                 <circle className="opacity-25" cx="12" cy="12" r="10" stroke="currentColor" strokeWidth="4"></circle>
                                 <path className="opacity-75" fill="currentColor" d="M4 12a8 8 0 018-8V0C5.373 0 0 5.373 0 12h4zm2 5.291A7.962 7.962 0 014 12H0c0 3.042 1.135 5.824 3 7.938l3-2.647z"></path>
                             </svg>
-                            Generating a summary...
+                            {progressLabel()}
                         </>
                     ) : (
                         "Generate summary"
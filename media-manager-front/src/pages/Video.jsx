@@ -1,7 +1,7 @@
 import { useParams, useNavigate } from 'react-router-dom';
 import { useEffect, useState, useRef } from 'react';
 import { useDispatch, useSelector } from 'react-redux';
-import { selectVideo, selectComments, selectSummary, getVideo, updateCommentSummary, clearState } from '../store/features/video';
+import { selectVideo, selectComments, selectCommentsCursor, selectCommentsSort, selectCommentsStatus, getVideo, getComments, clearState } from '../store/features/video';
 import { formatDateToFrench, decodeHtmlEntities } from '../utils';
 import RandomCommentDialog from '../components/dialogs/RandomCommentDialog';
 import CommentSummary from '../components/CommentSummary';
@@ -14,6 +14,9 @@ export default function Video() {
 
     const videoData = useSelector(selectVideo);
     const commentsData = useSelector(selectComments);
+    const commentsCursor = useSelector(selectCommentsCursor);
+    const commentsSort = useSelector(selectCommentsSort);
+    const commentsStatus = useSelector(selectCommentsStatus);
 
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
@@ -29,6 +32,14 @@ export default function Video() {
         navigate('/');
     };
 
+    const handleSortChange = (event) => {
+        dispatch(getComments({ videoId, sort: event.target.value }));
+    };
+
+    const handleLoadMore = () => {
+        dispatch(getComments({ videoId, cursor: commentsCursor, sort: commentsSort }));
+    };
+
     useEffect(() => {
         let isMounted = true;
 
@@ -42,6 +53,9 @@ export default function Video() {
             // Mark this videoId as requested
             requestMadeRef.current[videoId] = true;
 
+            // Comments are paged separately so the video shows up without waiting for them
+            dispatch(getComments({ videoId }));
+
             try {
                 await dispatch(getVideo(videoId)).unwrap();
                 if (isMounted) {
@@ -67,15 +81,14 @@ export default function Video() {
 
    
 
-    // Check if data is actually available, regardless of loading state
-    if (loading || !videoData || !videoData.title) {
-        return <div>Loading...</div>;
-    }
-
     if (error) {
         return <div>Error: {error}</div>;
     }
 
+    if (loading || !videoData || !videoData.title) {
+        return <div>Loading...</div>;
+    }
+
     return (
         <div className="px-10 sm:px-40 flex flex-1 justify-center py-5">
             <div className="layout-content-container flex flex-col flex-1">
@@ -116,15 +129,35 @@ export default function Video() {
                     </button>
                 </div>
                 
-                <h3 className="text-white text-lg font-bold leading-tight tracking-[-0.015em] px-4 pb-2 pt-4">Comments</h3>
+                <div className="flex items-center justify-between px-4 pb-2 pt-4">
+                    <h3 className="text-white text-lg font-bold leading-tight tracking-[-0.015em]">Comments</h3>
+                    <select
+                        value={commentsSort}
+                        onChange={handleSortChange}
+                        className="bg-[#243647] text-white text-sm rounded-md px-3 py-2 focus:outline-none"
+                    >
+                        <option value="relevance">Top comments</option>
+                        <option value="likes">Most liked</option>
+                        <option value="time">Newest first</option>
+                    </select>
+                </div>
 
                 <CommentSummary />
 
                 {
-                    commentsData && commentsData.length > 0 ? commentsData.map((comment, index) => (
-                        <Comment key={index} comment={comment} />
-                    )) : <p className="text-[#93adc8] px-4">No comments available</p>
+                    commentsData && commentsData.length > 0 ? commentsData.map((comment) => (
+                        <Comment key={comment.id} comment={comment} />
+                    )) : commentsStatus !== 'loading' && <p className="text-[#93adc8] px-4">No comments available</p>
                 }
+                {commentsStatus === 'loading' && <p className="text-[#93adc8] px-4">Loading comments...</p>}
+                {commentsCursor && commentsStatus !== 'loading' && (
+                    <button
+                        onClick={handleLoadMore}
+                        className="self-center bg-[#243647] hover:bg-[#2f4559] text-white font-medium py-2 px-4 rounded-md transition-colors mt-2"
+                    >
+                        Load more comments
+                    </button>
+                )}
             </div>
             
             {/* Random Comment Picker Dialog */}
@@ -4,13 +4,20 @@ import axios from 'axios';
 // Define the base URL for your API
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
 
-// Create an async thunk for searching
+// Number of comments fetched per page
+const COMMENTS_PAGE_SIZE = 50;
+
+// Delay between two checks of a summary job, in milliseconds
+const SUMMARY_POLL_INTERVAL = 1000;
+
+// Create an async thunk fetching the video and its summary, comments are paged with getComments
 export const getVideo = createAsyncThunk(
     'video/getVideo',
     async (videoId, { rejectWithValue }) => {
         try {
-            // You can adjust the endpoint and parameters based on your API
-            const response = await axios.get(`${API_BASE_URL}/api/youtube/video/${videoId}`);
+            const response = await axios.get(`${API_BASE_URL}/api/youtube/video/${videoId}`, {
+                params: { comments: false }
+            });
 
             return response.data.response;
         } catch (error) {
@@ -24,14 +31,49 @@ export const getVideo = createAsyncThunk(
     }
 );
 
+// Create an async thunk fetching a page of comments, the first one when no cursor is given
+export const getComments = createAsyncThunk(
+    'video/getComments',
+    async ({ videoId, cursor = null, sort = 'relevance' }, { rejectWithValue }) => {
+        try {
+            const response = await axios.get(`${API_BASE_URL}/api/youtube/video/${videoId}/comments`, {
+                params: { cursor, sort, limit: COMMENTS_PAGE_SIZE }
+            });
+
+            return response.data;
+        } catch (error) {
+            if (error.response && error.response.data.message) {
+                return rejectWithValue(error.response.data.message);
+            } else {
+                return rejectWithValue('An error occurred while loading comments. Please try again.');
+            }
+        }
+    }
+);
+
+// Create an async thunk starting a summary job and polling it until it is done
 export const updateCommentSummary = createAsyncThunk(
     'video/updateCommentSummary',
-    async ({ videoId, regenerate = false }, { rejectWithValue }) => {
+    async ({ videoId, regenerate = false }, { dispatch, rejectWithValue }) => {
         try {
-            const response = await axios.get(`${API_BASE_URL}/api/youtube/comments/summary/${videoId}?regenerate=${regenerate}`);
-            return response.data.summary;
+            let response = await axios.post(`${API_BASE_URL}/api/youtube/comments/summary/${videoId}`, null, {
+                params: { regenerate }
+            });
+            let job = response.data;
+
+            while (job.status === 'queued' || job.status === 'running') {
+                dispatch(summaryJobUpdated(job));
+                await new Promise((resolve) => setTimeout(resolve, SUMMARY_POLL_INTERVAL));
+                response = await axios.get(`${API_BASE_URL}/api/youtube/comments/summary/jobs/${job.id}`);
+                job = response.data;
+            }
+
+            if (job.status === 'failed') {
+                return rejectWithValue(job.error);
+            }
+            return job.summary;
         } catch (error) {
-            return rejectWithValue(error.response.data.message);
+            return rejectWithValue(error.response?.data?.detail);
         }
     }
 )
@@ -60,13 +102,23 @@ export const videoSlice = createSlice({
     initialState: {
         video: null,
         comments: null,
-        summary: null
+        commentsCursor: null,
+        commentsSort: 'relevance',
+        commentsStatus: 'idle',
+        summary: null,
+        summaryJob: null
     },
     reducers: {
         clearState: (state) => {
             state.video = {};
             state.comments = [];
+            state.commentsCursor = null;
+            state.commentsStatus = 'idle';
             state.summary = null;
+            state.summaryJob = null;
+        },
+        summaryJobUpdated: (state, action) => {
+            state.summaryJob = action.payload;
         }
     },
     extraReducers: (builder) => {
@@ -76,9 +128,7 @@ export const videoSlice = createSlice({
             })
             .addCase(getVideo.fulfilled, (state, action) => {
                 state.status = 'succeeded';
-                // Assuming your API returns an object with channels and videos arrays
-                state.video = action.payload.video || [];
-                state.comments = action.payload.comments || [];
+                state.video = action.payload.video || {};
                 state.summary = action.payload.summary;
             })
             .addCase(getVideo.rejected, (state, action) => {
@@ -86,6 +136,29 @@ export const videoSlice = createSlice({
                 state.error = action.payload || 'Failed to search content';
             });
 
+        builder
+            .addCase(getComments.pending, (state, action) => {
+                state.commentsStatus = 'loading';
+                // A first page replaces the comments, e.g. when the sort order changes
+                if (!action.meta.arg.cursor) {
+                    state.comments = [];
+                    state.commentsSort = action.meta.arg.sort || 'relevance';
+                }
+            })
+            .addCase(getComments.fulfilled, (state, action) => {
+                // Drop pages of a previous sort order arriving late
+                if ((action.meta.arg.sort || 'relevance') !== state.commentsSort) {
+                    return;
+                }
+                state.commentsStatus = 'succeeded';
+                state.comments.push(...action.payload.comments);
+                state.commentsCursor = action.payload.next_cursor;
+            })
+            .addCase(getComments.rejected, (state, action) => {
+                state.commentsStatus = 'failed';
+                state.error = action.payload || 'Failed to load comments';
+            });
+
         builder
             .addCase(updateCommentSummary.pending, (state) => {
                 state.status = 'loading';
@@ -93,21 +166,27 @@ export const videoSlice = createSlice({
             .addCase(updateCommentSummary.fulfilled, (state, action) => {
                 state.status = 'succeeded';
                 state.summary = action.payload;
+                state.summaryJob = null;
             })
             .addCase(updateCommentSummary.rejected, (state, action) => {
                 state.status = 'failed';
+                state.summaryJob = null;
                 state.error = action.payload || 'Failed to update comment summary';
             });
     },
 });
 
 // Export the synchronous actions
-export const { clearState } = videoSlice.actions;
+export const { clearState, summaryJobUpdated } = videoSlice.actions;
 
 // Export selectors
 export const selectVideo = (state) => state.video.video;
 export const selectComments = (state) => state.video.comments;
+export const selectCommentsCursor = (state) => state.video.commentsCursor;
+export const selectCommentsSort = (state) => state.video.commentsSort;
+export const selectCommentsStatus = (state) => state.video.commentsStatus;
 export const selectSummary = (state) => state.video.summary;
+export const selectSummaryJob = (state) => state.video.summaryJob;
 
 // Export the reducer
 export default videoSlice.reducer;